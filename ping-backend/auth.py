@@ -1,27 +1,178 @@
 from passlib.context import CryptContext
 from jose import JWTError, jwt
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from typing import Optional
 import os
+import threading
+import time
 from dotenv import load_dotenv
 
 load_dotenv()
 
 # Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+PASSWORD_HASH_WORKERS = int(
+    os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1)))
+)
+
+# min/max pin the cost so hashes made with any other cost report needs_update
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+    bcrypt__max_rounds=BCRYPT_ROUNDS,
+)
+
+
+class PasswordHashPool:
+    """
+    Small dedicated pool for bcrypt work. bcrypt releases the GIL, so a
+    handful of threads bounds how many CPU cores a login burst can take
+    while the request threadpool stays free for everything else.
+    """
+
+    def __init__(self, workers: int):
+        self.workers = max(1, workers)
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.workers, thread_name_prefix="password-hash"
+        )
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._running = 0
+        self._completed = 0
+        self._wait_ms_total = 0.0
+        self._work_ms_total = 0.0
+
+    def run(self, func, *args):
+        submitted = time.perf_counter()
+        with self._lock:
+            self._queued += 1
+
+        def task():
+            started = time.perf_counter()
+            with self._lock:
+                self._queued -= 1
+                self._running += 1
+                self._wait_ms_total += (started - submitted) * 1000
+            try:
+                return func(*args)
+            finally:
+                with self._lock:
+                    self._running -= 1
+                    self._completed += 1
+                    self._work_ms_total += (time.perf_counter() - started) * 1000
+
+        return self._executor.submit(task).result()
+
+    def stats(self) -> dict:
+        with self._lock:
+            completed = self._completed
+            return {
+                "workers": self.workers,
+                "bcrypt_rounds": BCRYPT_ROUNDS,
+                "queue_depth": self._queued,
+                "running": self._running,
+                "completed": completed,
+                "avg_wait_ms": round(self._wait_ms_total / completed, 2) if completed else 0.0,
+                "avg_work_ms": round(self._work_ms_total / completed, 2) if completed else 0.0,
+            }
+
+
+password_pool = PasswordHashPool(PASSWORD_HASH_WORKERS)
 
 # JWT settings
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-change-this-in-production")
 ALGORITHM = os.getenv("ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
+TOKEN_CACHE_MAX_ENTRIES = int(os.getenv("TOKEN_CACHE_MAX_ENTRIES", "10000"))
+
+
+def parse_signing_keys(value: str) -> dict[str, str]:
+    """Parse ``JWT_KEYS`` ("kid1:secret1,kid2:secret2") into a kid -> secret map."""
+    keys = {}
+    for item in value.split(","):
+        kid, sep, secret = item.strip().partition(":")
+        if sep and kid and secret:
+            keys[kid] = secret
+    return keys
+
+
+# Tokens are signed with the active kid and verified with any listed kid.
+# Tokens without a kid header predate rotation and are checked against SECRET_KEY.
+SIGNING_KEYS = parse_signing_keys(os.getenv("JWT_KEYS", ""))
+JWT_ACTIVE_KID = os.getenv("JWT_ACTIVE_KID") or next(iter(SIGNING_KEYS), None)
+if JWT_ACTIVE_KID and JWT_ACTIVE_KID not in SIGNING_KEYS:
+    raise RuntimeError(f"JWT_ACTIVE_KID {JWT_ACTIVE_KID!r} is not listed in JWT_KEYS")
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify a password against its hash"""
-    return pwd_context.verify(plain_password, hashed_password)
+    return password_pool.run(pwd_context.verify, plain_password, hashed_password)
+
+def verify_and_update_password(plain_password: str, hashed_password: str) -> tuple[bool, Optional[str]]:
+    """Verify a password and return a new hash if the stored one uses an outdated cost"""
+    return password_pool.run(pwd_context.verify_and_update, plain_password, hashed_password)
 
 def get_password_hash(password: str) -> str:
     """Hash a password"""
-    return pwd_context.hash(password)
+    return password_pool.run(pwd_context.hash, password)
+
+class VerifiedTokenCache:
+    """
+    Bounded LRU of already-verified tokens to their claims, so repeat
+    requests with the same bearer token skip the HMAC and JSON decode.
+    Entries are only served until the token's own ``exp``.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, token: str) -> Optional[dict]:
+        if self.max_entries <= 0:
+            return None
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry[0] <= time.time():
+                del self._entries[token]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(token)
+            self.hits += 1
+            return dict(entry[1])
+
+    def put(self, token: str, claims: dict):
+        if self.max_entries <= 0:
+            return
+        exp = claims.get("exp")
+        if not isinstance(exp, (int, float)):
+            return
+        with self._lock:
+            self._entries[token] = (float(exp), dict(claims))
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "active_kid": JWT_ACTIVE_KID,
+            "kids": sorted(SIGNING_KEYS),
+        }
+
+
+token_cache = VerifiedTokenCache(TOKEN_CACHE_MAX_ENTRIES)
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     """Create a JWT access token"""
@@ -32,13 +183,28 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
         expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     
     to_encode.update({"exp": expire})
+    if JWT_ACTIVE_KID:
+        return jwt.encode(
+            to_encode,
+            SIGNING_KEYS[JWT_ACTIVE_KID],
+            algorithm=ALGORITHM,
+            headers={"kid": JWT_ACTIVE_KID},
+        )
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
 def verify_token(token: str):
     """Verify and decode a JWT token"""
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    payload = token_cache.get(token)
+    if payload is not None:
         return payload
+    try:
+        kid = jwt.get_unverified_header(token).get("kid")
+        key = SIGNING_KEYS.get(kid) if kid else SECRET_KEY
+        if key is None:
+            return None
+        payload = jwt.decode(token, key, algorithms=[ALGORITHM])
     except JWTError:
         return None
+    token_cache.put(token, payload)
+    return payload
@@ -0,0 +1,96 @@
+import logging
+import threading
+
+from database import advisory_lock
+
+logger = logging.getLogger(__name__)
+
+
+class PeriodicJob:
+    """
+    Runs ``func`` every ``interval_seconds`` on a daemon thread. Each run
+    takes a database advisory lock named after the job, so with several
+    uvicorn workers only one of them does the work per tick.
+    """
+
+    def __init__(self, name: str, interval_seconds: float, func, enabled: bool = True):
+        self.name = name
+        self.interval_seconds = max(1.0, float(interval_seconds))
+        self.func = func
+        self.enabled = enabled
+        self.runs = 0
+        self.failures = 0
+        self.skipped = 0
+        self._thread: threading.Thread | None = None
+        self._stopping = threading.Event()
+        self._wake = threading.Event()
+
+    def start(self):
+        if not self.enabled or (self._thread is not None and self._thread.is_alive()):
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(
+            target=self._run, name=f"job-{self.name}", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        self._stopping.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def trigger(self):
+        """Run as soon as possible instead of waiting for the next tick."""
+        self._wake.set()
+
+    def run_once(self) -> bool:
+        with advisory_lock(f"job:{self.name}") as acquired:
+            if not acquired:
+                self.skipped += 1
+                return False
+            try:
+                self.func()
+                self.runs += 1
+            except Exception:
+                self.failures += 1
+                logger.exception("Background job %s failed", self.name)
+        return True
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "running": self._thread is not None and self._thread.is_alive(),
+            "interval_seconds": self.interval_seconds,
+            "runs": self.runs,
+            "failures": self.failures,
+            "skipped": self.skipped,
+        }
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                self.run_once()
+            except Exception:
+                logger.exception("Background job %s could not run", self.name)
+            self._wake.wait(self.interval_seconds)
+            self._wake.clear()
+
+
+jobs: dict[str, PeriodicJob] = {}
+
+
+def register_job(job: PeriodicJob) -> PeriodicJob:
+    jobs[job.name] = job
+    return job
+
+
+def start_jobs():
+    for job in jobs.values():
+        job.start()
+
+
+def stop_jobs():
+    for job in jobs.values():
+        job.stop()
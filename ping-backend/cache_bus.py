@@ -0,0 +1,173 @@
+import json
+import logging
+import os
+import select
+import threading
+from collections import defaultdict
+from typing import Callable
+
+from sqlalchemy import text
+
+from database import direct_engine
+
+logger = logging.getLogger(__name__)
+
+CACHE_BUS_BACKEND = os.getenv("CACHE_BUS_BACKEND", "local").lower()
+CACHE_BUS_CHANNEL = os.getenv("CACHE_BUS_CHANNEL", "ping_cache_invalidation")
+
+Handler = Callable[[object], None]
+
+
+class LocalCacheBus:
+    """
+    Delivers invalidation messages to subscribers in this process only.
+    Fine for a single uvicorn worker; use the Postgres bus otherwise.
+    """
+
+    def __init__(self):
+        self._handlers: dict[str, list[Handler]] = defaultdict(list)
+        self._reset_handlers: list[Callable[[], None]] = []
+        self.published = 0
+        self.received = 0
+
+    def subscribe(self, topic: str, handler: Handler, on_reset: Callable[[], None] | None = None):
+        """
+        Call ``handler(key)`` for every message on ``topic``. ``on_reset`` runs
+        when messages may have been missed and the subscriber should drop
+        everything it holds.
+        """
+        self._handlers[topic].append(handler)
+        if on_reset:
+            self._reset_handlers.append(on_reset)
+
+    def publish(self, topic: str, key) -> None:
+        self.published += 1
+        self._dispatch(topic, key)
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def stats(self) -> dict:
+        return {
+            "backend": "local",
+            "published": self.published,
+            "received": self.received,
+        }
+
+    def _dispatch(self, topic: str, key):
+        for handler in self._handlers.get(topic, ()):
+            try:
+                handler(key)
+            except Exception:
+                logger.exception("Cache bus handler for %s failed", topic)
+
+    def _reset(self):
+        for handler in self._reset_handlers:
+            try:
+                handler()
+            except Exception:
+                logger.exception("Cache bus reset handler failed")
+
+
+class PostgresCacheBus(LocalCacheBus):
+    """
+    Fans invalidations out to every worker through LISTEN/NOTIFY. Messages
+    are applied locally straight away and again when the notification comes
+    back, which is harmless because invalidation is idempotent.
+    """
+
+    def __init__(self, channel: str = CACHE_BUS_CHANNEL):
+        super().__init__()
+        self.channel = channel
+        self.reconnects = 0
+        self._thread: threading.Thread | None = None
+        self._stopping = threading.Event()
+
+    def publish(self, topic: str, key) -> None:
+        super().publish(topic, key)
+        payload = json.dumps({"topic": topic, "key": key})
+        try:
+            with direct_engine.connect() as conn:
+                conn.execute(
+                    text("SELECT pg_notify(:channel, :payload)"),
+                    {"channel": self.channel, "payload": payload},
+                )
+                conn.commit()
+        except Exception:
+            logger.exception("Could not publish cache invalidation for %s", topic)
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(
+            target=self._listen_forever, name="cache-bus-listener", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def stats(self) -> dict:
+        data = super().stats()
+        data["backend"] = "postgres"
+        data["reconnects"] = self.reconnects
+        data["listening"] = self._thread is not None and self._thread.is_alive()
+        return data
+
+    def _listen_forever(self):
+        backoff = 1.0
+        while not self._stopping.is_set():
+            try:
+                self._listen()
+                backoff = 1.0
+            except Exception:
+                logger.exception("Cache bus listener lost its connection")
+            if self._stopping.wait(backoff):
+                break
+            backoff = min(backoff * 2, 30.0)
+            self.reconnects += 1
+
+    def _listen(self):
+        raw = direct_engine.raw_connection()
+        raw.detach()
+        conn = raw.driver_connection
+        try:
+            conn.autocommit = True
+            with conn.cursor() as cursor:
+                cursor.execute(f'LISTEN "{self.channel}"')
+            # Anything published while we were disconnected is lost.
+            self._reset()
+            while not self._stopping.is_set():
+                readable, _, _ = select.select([conn], [], [], 1.0)
+                if not readable:
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    notify = conn.notifies.pop(0)
+                    self._handle(notify.payload)
+        finally:
+            raw.close()
+
+    def _handle(self, payload: str):
+        try:
+            message = json.loads(payload)
+        except ValueError:
+            return
+        self.received += 1
+        self._dispatch(message.get("topic"), message.get("key"))
+
+
+def create_cache_bus() -> LocalCacheBus:
+    if CACHE_BUS_BACKEND == "postgres" and direct_engine.dialect.name == "postgresql":
+        return PostgresCacheBus()
+    return LocalCacheBus()
+
+
+cache_bus = create_cache_bus()
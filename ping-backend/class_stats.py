@@ -0,0 +1,82 @@
+from dataclasses import dataclass
+
+from sqlalchemy import and_, func
+from sqlalchemy.orm import Session
+
+from models import BehaviorData, Class, ClassStudent, Module, ModuleWhitelist
+
+
+@dataclass
+class ClassStats:
+    student_count: int = 0
+    module_count: int = 0
+    total_sessions: int = 0
+
+
+def get_class_stats(db: Session, classes: list[Class]) -> dict[int, ClassStats]:
+    """
+    Student, module and distinct-session counts for ``classes`` in three
+    grouped queries, however many classes are passed in.
+
+    Modules are those published and enabled on the class organization's
+    whitelist; sessions are distinct telemetry sessions by class members
+    in any of those modules.
+    """
+    stats = {c.id: ClassStats() for c in classes}
+    if not stats:
+        return stats
+    class_ids = list(stats)
+
+    student_rows = (
+        db.query(ClassStudent.class_id, func.count(ClassStudent.user_id))
+        .filter(ClassStudent.class_id.in_(class_ids))
+        .group_by(ClassStudent.class_id)
+        .all()
+    )
+    for class_id, count in student_rows:
+        stats[class_id].student_count = int(count)
+
+    org_ids = {c.organization_id for c in classes if c.organization_id is not None}
+    if org_ids:
+        module_rows = (
+            db.query(ModuleWhitelist.organization_id, func.count(Module.module_id))
+            .join(Module, ModuleWhitelist.module_id == Module.id)
+            .filter(
+                ModuleWhitelist.organization_id.in_(org_ids),
+                ModuleWhitelist.is_enabled == True,
+                Module.is_published == True,
+            )
+            .group_by(ModuleWhitelist.organization_id)
+            .all()
+        )
+        modules_by_org = {org_id: int(count) for org_id, count in module_rows}
+        for c in classes:
+            stats[c.id].module_count = modules_by_org.get(c.organization_id, 0)
+
+    session_rows = (
+        db.query(
+            ClassStudent.class_id,
+            func.count(func.distinct(BehaviorData.session_id)),
+        )
+        .join(Class, Class.id == ClassStudent.class_id)
+        .join(BehaviorData, BehaviorData.user_id == ClassStudent.user_id)
+        .join(
+            Module,
+            and_(Module.module_id == BehaviorData.module_id, Module.is_published == True),
+        )
+        .join(
+            ModuleWhitelist,
+            and_(
+                ModuleWhitelist.module_id == Module.id,
+                ModuleWhitelist.organization_id == Class.organization_id,
+                ModuleWhitelist.is_enabled == True,
+            ),
+        )
+        .filter(ClassStudent.class_id.in_(class_ids))
+        .group_by(ClassStudent.class_id)
+        .all()
+    )
+    for class_id, count in session_rows:
+        stats[class_id].total_sessions = int(count)
+
+    return stats
@@ -0,0 +1,124 @@
+import hashlib
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Hashable
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class CacheEntry:
+    value: Any
+    etag: str
+    built_at: float
+
+
+class StaleWhileRevalidateCache:
+    """
+    Per-process cache for expensive, read-only payloads.
+
+    Entries younger than ``ttl_seconds`` are served as-is. Up to
+    ``stale_seconds`` past that they are still served, marked stale, while
+    a single background thread rebuilds them. Older or missing entries are
+    built inline, with concurrent callers for the same key waiting on one
+    build instead of each running the queries.
+    """
+
+    def __init__(
+        self,
+        build: Callable[[Hashable], Any],
+        etag_for: Callable[[Any], str],
+        ttl_seconds: float,
+        stale_seconds: float,
+    ):
+        self.build = build
+        self.etag_for = etag_for
+        self.ttl_seconds = max(0.0, float(ttl_seconds))
+        self.stale_seconds = max(0.0, float(stale_seconds))
+        self._entries: dict[Hashable, CacheEntry] = {}
+        self._lock = threading.Lock()
+        self._key_locks: dict[Hashable, threading.Lock] = {}
+        self._refreshing: set[Hashable] = set()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl_seconds > 0
+
+    def get(self, key: Hashable) -> tuple[CacheEntry, bool]:
+        """Return ``(entry, stale)`` for ``key``."""
+        if not self.enabled:
+            return self._build(key), False
+
+        entry = self._entries.get(key)
+        if entry is not None:
+            age = time.monotonic() - entry.built_at
+            if age < self.ttl_seconds:
+                self.hits += 1
+                return entry, False
+            if age < self.ttl_seconds + self.stale_seconds:
+                self.stale_hits += 1
+                self._refresh_in_background(key)
+                return entry, True
+
+        self.misses += 1
+        with self._key_lock(key):
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry.built_at < self.ttl_seconds:
+                return entry, False
+            entry = self._build(key)
+            self._entries[key] = entry
+            return entry, False
+
+    def invalidate(self, key: Hashable | None = None):
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "ttl_seconds": self.ttl_seconds,
+            "stale_seconds": self.stale_seconds,
+        }
+
+    def _build(self, key: Hashable) -> CacheEntry:
+        value = self.build(key)
+        return CacheEntry(value=value, etag=self.etag_for(value), built_at=time.monotonic())
+
+    def _key_lock(self, key: Hashable) -> threading.Lock:
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    def _refresh_in_background(self, key: Hashable):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+        threading.Thread(
+            target=self._refresh, args=(key,), name="dashboard-cache-refresh", daemon=True
+        ).start()
+
+    def _refresh(self, key: Hashable):
+        try:
+            with self._key_lock(key):
+                self._entries[key] = self._build(key)
+        except Exception:
+            logger.exception("Background refresh of cache key %r failed", key)
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+
+def payload_etag(payload: bytes) -> str:
+    return '"' + hashlib.sha1(payload).hexdigest() + '"'
@@ -0,0 +1,213 @@
+import logging
+import os
+import smtplib
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import event, insert
+from sqlalchemy.orm import Session
+
+from background_jobs import PeriodicJob, register_job
+from database import AdminSessionLocal
+from email_service import SmtpConnection, build_message, smtp_configured
+from models import EmailOutbox
+
+logger = logging.getLogger(__name__)
+
+EMAIL_OUTBOX_BATCH_SIZE = int(os.getenv("EMAIL_OUTBOX_BATCH_SIZE", "50"))
+EMAIL_OUTBOX_INTERVAL_SECONDS = int(os.getenv("EMAIL_OUTBOX_INTERVAL_SECONDS", "10"))
+EMAIL_OUTBOX_MAX_ATTEMPTS = int(os.getenv("EMAIL_OUTBOX_MAX_ATTEMPTS", "8"))
+EMAIL_OUTBOX_RETRY_BASE_SECONDS = int(os.getenv("EMAIL_OUTBOX_RETRY_BASE_SECONDS", "30"))
+EMAIL_OUTBOX_RETRY_MAX_SECONDS = int(os.getenv("EMAIL_OUTBOX_RETRY_MAX_SECONDS", "3600"))
+
+PENDING = "pending"
+SENT = "sent"
+FAILED = "failed"
+
+QUEUED_KEY = "email_outbox_queued"
+
+
+def queue_email(db: Session, recipient: str, subject: str, body: str) -> EmailOutbox:
+    """
+    Add a message to the outbox in the caller's transaction. Nothing is sent
+    unless that transaction commits; the sender is woken up when it does.
+    """
+    message = EmailOutbox(
+        recipient=recipient,
+        subject=subject,
+        body=body,
+        status=PENDING,
+        next_attempt_at=datetime.now(timezone.utc),
+    )
+    db.add(message)
+    db.info[QUEUED_KEY] = True
+    return message
+
+
+def queue_emails(db: Session, messages: list[tuple[str, str, str]]) -> None:
+    """Bulk ``queue_email`` for ``(recipient, subject, body)`` tuples, in one INSERT."""
+    if not messages:
+        return
+    now = datetime.now(timezone.utc)
+    db.execute(
+        insert(EmailOutbox),
+        [
+            {
+                "recipient": recipient,
+                "subject": subject,
+                "body": body,
+                "status": PENDING,
+                "next_attempt_at": now,
+            }
+            for recipient, subject, body in messages
+        ],
+    )
+    db.info[QUEUED_KEY] = True
+
+
+@event.listens_for(Session, "after_commit")
+def wake_sender(session):
+    if session.info.pop(QUEUED_KEY, False):
+        outbox_job.trigger()
+
+
+@event.listens_for(Session, "after_rollback")
+def discard_queued(session):
+    session.info.pop(QUEUED_KEY, None)
+
+
+def retry_delay(attempts: int) -> timedelta:
+    seconds = EMAIL_OUTBOX_RETRY_BASE_SECONDS * 2 ** max(attempts - 1, 0)
+    return timedelta(seconds=min(seconds, EMAIL_OUTBOX_RETRY_MAX_SECONDS))
+
+
+def is_message_error(exc: Exception) -> bool:
+    """
+    Rejections of this particular message. Anything else (socket errors,
+    disconnects, failed login) is a problem with the session and would hit
+    every following message too.
+    """
+    return isinstance(
+        exc, (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused, smtplib.SMTPDataError)
+    )
+
+
+def is_permanent(exc: Exception) -> bool:
+    """5xx replies (bad address, rejected content) will not succeed on retry."""
+    if isinstance(exc, smtplib.SMTPRecipientsRefused):
+        return all(code >= 500 for code, _ in exc.recipients.values())
+    if is_message_error(exc):
+        return exc.smtp_code >= 500
+    return False
+
+
+class OutboxSender:
+    """
+    Drains ``email_outbox`` over one persistent SMTP connection. Runs from
+    the ``email-outbox`` job, so only one worker process sends at a time.
+    """
+
+    def __init__(self, batch_size: int = EMAIL_OUTBOX_BATCH_SIZE):
+        self.batch_size = max(1, batch_size)
+        self.connection = SmtpConnection()
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "sent": 0,
+            "retried": 0,
+            "failed": 0,
+            "batches": 0,
+            "last_batch_size": 0,
+            "last_batch_ms": 0.0,
+            "last_batch_per_second": 0.0,
+        }
+
+    def run(self):
+        self.connection.close_if_idle()
+        if not smtp_configured():
+            # Leave messages queued until SMTP is configured.
+            return
+        # Rows are committed one by one; don't reload the batch after each.
+        db = AdminSessionLocal(expire_on_commit=False)
+        try:
+            while self.send_batch(db) == self.batch_size:
+                pass
+        finally:
+            db.close()
+
+    def send_batch(self, db: Session) -> int:
+        """Send up to one batch of due messages; returns how many were attempted (0 to stop the run)."""
+        now = datetime.now(timezone.utc)
+        messages = (
+            db.query(EmailOutbox)
+            .filter(EmailOutbox.status == PENDING, EmailOutbox.next_attempt_at <= now)
+            .order_by(EmailOutbox.next_attempt_at, EmailOutbox.id)
+            .limit(self.batch_size)
+            .all()
+        )
+        if not messages:
+            return 0
+
+        started = time.perf_counter()
+        sent = retried = failed = 0
+        connection_lost = False
+        for message in messages:
+            try:
+                self.connection.send(build_message(message.recipient, message.subject, message.body or ""))
+            except Exception as exc:
+                message.last_error = str(exc)[:2000]
+                if not is_message_error(exc):
+                    # The server is unreachable or dropped us; stop here rather
+                    # than time out once per message, and reconnect next run.
+                    # That says nothing about this message, so it keeps its
+                    # attempts and an outage cannot fail the whole queue.
+                    logger.warning("SMTP connection failed, retrying later: %s", exc)
+                    self.connection.reset()
+                    connection_lost = True
+                    message.next_attempt_at = datetime.now(timezone.utc) + retry_delay(1)
+                    retried += 1
+                    db.commit()
+                    break
+                message.attempts += 1
+                if is_permanent(exc) or message.attempts >= EMAIL_OUTBOX_MAX_ATTEMPTS:
+                    message.status = FAILED
+                    failed += 1
+                    logger.warning("Giving up on email %s to %s: %s", message.id, message.recipient, exc)
+                else:
+                    message.next_attempt_at = datetime.now(timezone.utc) + retry_delay(message.attempts)
+                    retried += 1
+            else:
+                message.attempts += 1
+                message.status = SENT
+                message.sent_at = datetime.now(timezone.utc)
+                message.body = None
+                message.last_error = None
+                sent += 1
+            # Commit per message so a crash cannot resend what already went out.
+            db.commit()
+
+        elapsed = time.perf_counter() - started
+        attempted = sent + retried + failed
+        with self._stats_lock:
+            self._stats["sent"] += sent
+            self._stats["retried"] += retried
+            self._stats["failed"] += failed
+            self._stats["batches"] += 1
+            self._stats["last_batch_size"] = attempted
+            self._stats["last_batch_ms"] = round(elapsed * 1000, 3)
+            self._stats["last_batch_per_second"] = round(attempted / elapsed, 1) if elapsed else 0.0
+        return 0 if connection_lost else attempted
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            data = dict(self._stats)
+        data["smtp_configured"] = smtp_configured()
+        data["smtp_connections_opened"] = self.connection.connections_opened
+        return data
+
+
+outbox_sender = OutboxSender()
+
+outbox_job = register_job(
+    PeriodicJob("email-outbox", EMAIL_OUTBOX_INTERVAL_SECONDS, outbox_sender.run)
+)
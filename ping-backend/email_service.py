@@ -1,21 +1,20 @@
 import os
 import smtplib
+import time
 from email.message import EmailMessage
 from email.utils import formatdate, make_msgid
 
+SMTP_TIMEOUT_SECONDS = float(os.getenv("SMTP_TIMEOUT_SECONDS", "30"))
+SMTP_IDLE_SECONDS = float(os.getenv("SMTP_IDLE_SECONDS", "60"))
 
-def send_email(recipient: str, subject: str, body: str) -> None:
-    host = os.getenv("SMTP_HOST")
-    port = int(os.getenv("SMTP_PORT", "587"))
-    user = os.getenv("SMTP_USER")
-    password = os.getenv("SMTP_PASSWORD")
-    sender = os.getenv("SMTP_FROM", user)
-    sender_name = os.getenv("SMTP_FROM_NAME")
-    use_tls = os.getenv("SMTP_TLS", "true").lower() == "true"
-    use_ssl = os.getenv("SMTP_SSL", "false").lower() == "true"
 
-    if not host or not sender:
-        raise RuntimeError("SMTP is not configured")
+def smtp_configured() -> bool:
+    return bool(os.getenv("SMTP_HOST") and (os.getenv("SMTP_FROM") or os.getenv("SMTP_USER")))
+
+
+def build_message(recipient: str, subject: str, body: str) -> EmailMessage:
+    sender = os.getenv("SMTP_FROM", os.getenv("SMTP_USER"))
+    sender_name = os.getenv("SMTP_FROM_NAME")
 
     message = EmailMessage()
     message["Subject"] = subject
@@ -27,22 +26,92 @@ def send_email(recipient: str, subject: str, body: str) -> None:
         message["From"] = sender
     message["To"] = recipient
     message.set_content(body)
+    return message
 
-    if use_ssl:
-        server = smtplib.SMTP_SSL(host, port)
-    else:
-        server = smtplib.SMTP(host, port)
 
-    try:
-        server.ehlo()
-        if use_tls and not use_ssl:
-            server.starttls()
+class SmtpConnection:
+    """
+    One SMTP session kept open across sends, so a batch pays for
+    EHLO/STARTTLS/login once. Reconnects when the server has dropped an
+    idle connection. Not thread-safe; the outbox sender owns it.
+    """
+
+    def __init__(self, idle_seconds: float = SMTP_IDLE_SECONDS):
+        self.idle_seconds = idle_seconds
+        self.connections_opened = 0
+        self._server: smtplib.SMTP | None = None
+        self._last_used = 0.0
+
+    def send(self, message: EmailMessage) -> None:
+        self._ensure_connected()
+        self._server.send_message(message)
+        self._last_used = time.monotonic()
+
+    def close(self) -> None:
+        server, self._server = self._server, None
+        if server is None:
+            return
+        try:
+            server.quit()
+        except (smtplib.SMTPException, OSError):
+            server.close()
+
+    def reset(self) -> None:
+        """Drop the connection without a polite QUIT, e.g. after a socket error."""
+        server, self._server = self._server, None
+        if server is not None:
+            server.close()
+
+    def close_if_idle(self) -> None:
+        if self._server is not None and time.monotonic() - self._last_used > self.idle_seconds:
+            self.close()
+
+    def _ensure_connected(self) -> None:
+        if self._server is not None:
+            try:
+                if self._server.noop()[0] == 250:
+                    return
+            except (smtplib.SMTPException, OSError):
+                pass
+            self.reset()
+        self._server = self._connect()
+        self.connections_opened += 1
+
+    def _connect(self) -> smtplib.SMTP:
+        host = os.getenv("SMTP_HOST")
+        port = int(os.getenv("SMTP_PORT", "587"))
+        user = os.getenv("SMTP_USER")
+        password = os.getenv("SMTP_PASSWORD")
+        use_tls = os.getenv("SMTP_TLS", "true").lower() == "true"
+        use_ssl = os.getenv("SMTP_SSL", "false").lower() == "true"
+
+        if not smtp_configured():
+            raise RuntimeError("SMTP is not configured")
+
+        if use_ssl:
+            server = smtplib.SMTP_SSL(host, port, timeout=SMTP_TIMEOUT_SECONDS)
+        else:
+            server = smtplib.SMTP(host, port, timeout=SMTP_TIMEOUT_SECONDS)
+        try:
             server.ehlo()
-        if user and password:
-            server.login(user, password)
-        server.send_message(message)
+            if use_tls and not use_ssl:
+                server.starttls()
+                server.ehlo()
+            if user and password:
+                server.login(user, password)
+        except Exception:
+            server.close()
+            raise
+        return server
+
+
+def send_email(recipient: str, subject: str, body: str) -> None:
+    """Send one message on a fresh connection. Request handlers should use the outbox."""
+    connection = SmtpConnection()
+    try:
+        connection.send(build_message(recipient, subject, body))
     finally:
-        server.quit()
+        connection.close()
 
 
 def render_template(content: str, context: dict) -> str:
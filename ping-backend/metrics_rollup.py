@@ -0,0 +1,270 @@
+import os
+from datetime import date, datetime, time as dt_time, timedelta, timezone
+
+from sqlalchemy import distinct, func, union
+from sqlalchemy.orm import Session, aliased
+
+from background_jobs import PeriodicJob, register_job
+from database import AdminSessionLocal
+from models import (
+    App,
+    AppEvent,
+    AppMetricDaily,
+    BehaviorData,
+    MetricRollupState,
+    SparcGameSession,
+    SparcWordGameScore,
+    User,
+)
+
+METRICS_ROLLUP_ENABLED = os.getenv("METRICS_ROLLUP_ENABLED", "true").lower() == "true"
+METRICS_ROLLUP_INTERVAL_SECONDS = int(os.getenv("METRICS_ROLLUP_INTERVAL_SECONDS", "300"))
+
+# Running count of distinct ping sessions. Summing the daily counts would
+# count a session that crosses midnight once for every day it touches.
+PING_SESSIONS_SOURCE = "ping:sessions"
+
+METRIC_FIELDS = ("active_users", "new_users", "sessions", "events", "errors")
+
+
+def day_bounds(day: date) -> tuple[datetime, datetime]:
+    start = datetime.combine(day, dt_time.min, tzinfo=timezone.utc)
+    return start, start + timedelta(days=1)
+
+
+def to_date(value) -> date | None:
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    try:
+        return datetime.fromisoformat(str(value)).date()
+    except ValueError:
+        return None
+
+
+def get_watermark(db: Session, source: str) -> MetricRollupState:
+    state = db.query(MetricRollupState).filter(MetricRollupState.source == source).first()
+    if not state:
+        state = MetricRollupState(source=source, last_id=0)
+        db.add(state)
+        db.flush()
+    return state
+
+
+def utc_day(db: Session, column):
+    if db.get_bind().dialect.name == "postgresql":
+        return func.date(func.timezone("UTC", column))
+    return func.date(column)
+
+
+def collect_new_days(db: Session, source: str, id_column, time_column) -> set[date]:
+    """
+    Days touched by rows added since the last run, advancing the
+    watermark for ``source`` to the newest id seen.
+    """
+    state = get_watermark(db, source)
+    max_id = db.query(func.max(id_column)).scalar() or 0
+    if max_id <= state.last_id:
+        return set()
+
+    rows = (
+        db.query(utc_day(db, time_column).label("day"))
+        .filter(id_column > state.last_id, id_column <= max_id)
+        .distinct()
+        .all()
+    )
+    state.last_id = max_id
+    return {day for day in (to_date(row[0]) for row in rows) if day}
+
+
+def count_new_sessions(db: Session) -> int:
+    """
+    Add the sessions first seen since the last run to the running total
+    for ``PING_SESSIONS_SOURCE`` and return the new total.
+    """
+    state = get_watermark(db, PING_SESSIONS_SOURCE)
+    max_id = db.query(func.max(BehaviorData.id)).scalar() or 0
+    if max_id <= state.last_id:
+        return state.total or 0
+
+    earlier = aliased(BehaviorData)
+    seen_before = (
+        db.query(earlier.id)
+        .filter(earlier.session_id == BehaviorData.session_id, earlier.id <= state.last_id)
+        .exists()
+    )
+    new_sessions = (
+        db.query(func.count(distinct(BehaviorData.session_id)))
+        .filter(BehaviorData.id > state.last_id, BehaviorData.id <= max_id, ~seen_before)
+        .scalar()
+        or 0
+    )
+    state.total = (state.total or 0) + new_sessions
+    state.last_id = max_id
+    return state.total
+
+
+def count_errors(db: Session, app_id: int, start: datetime, end: datetime) -> int:
+    return (
+        db.query(func.count(AppEvent.id))
+        .filter(
+            AppEvent.app_id == app_id,
+            AppEvent.event_type == "error",
+            AppEvent.occurred_at >= start,
+            AppEvent.occurred_at < end,
+        )
+        .scalar()
+        or 0
+    )
+
+
+def compute_ping_day(db: Session, app_id: int, day: date) -> dict:
+    start, end = day_bounds(day)
+    in_day = (BehaviorData.timestamp >= start, BehaviorData.timestamp < end)
+    row = db.query(
+        func.count(BehaviorData.id),
+        func.count(distinct(BehaviorData.session_id)),
+        func.count(distinct(BehaviorData.user_id)),
+        func.count(distinct(BehaviorData.guest_session_id)),
+    ).filter(*in_day).one()
+    new_users = (
+        db.query(func.count(User.id))
+        .filter(User.created_at >= start, User.created_at < end)
+        .scalar()
+        or 0
+    )
+    return {
+        "events": row[0] or 0,
+        "sessions": row[1] or 0,
+        "active_users": (row[2] or 0) + (row[3] or 0),
+        "new_users": new_users,
+        "errors": count_errors(db, app_id, start, end),
+    }
+
+
+def sparc_score_time():
+    return func.coalesce(SparcWordGameScore.played_at, SparcWordGameScore.created_at)
+
+
+def compute_sparc_day(db: Session, app_id: int, day: date) -> dict:
+    start, end = day_bounds(day)
+    score_time = sparc_score_time()
+    sessions = (
+        db.query(func.count(SparcGameSession.id))
+        .filter(SparcGameSession.started_at >= start, SparcGameSession.started_at < end)
+        .scalar()
+        or 0
+    )
+    events = (
+        db.query(func.count(SparcWordGameScore.id))
+        .filter(score_time >= start, score_time < end)
+        .scalar()
+        or 0
+    )
+    players = union(
+        db.query(SparcGameSession.user_id)
+        .filter(SparcGameSession.started_at >= start, SparcGameSession.started_at < end)
+        .statement,
+        db.query(SparcWordGameScore.user_id)
+        .filter(
+            score_time >= start,
+            score_time < end,
+            SparcWordGameScore.user_id.isnot(None),
+        )
+        .statement,
+    ).subquery()
+    active_users = db.query(func.count()).select_from(players).scalar() or 0
+    return {
+        "events": events,
+        "sessions": sessions,
+        "active_users": active_users,
+        "new_users": 0,
+        "errors": count_errors(db, app_id, start, end),
+    }
+
+
+def upsert_day(db: Session, app_id: int, day: date, values: dict):
+    metric_date, _ = day_bounds(day)
+    row = (
+        db.query(AppMetricDaily)
+        .filter(AppMetricDaily.app_id == app_id, AppMetricDaily.metric_date == metric_date)
+        .first()
+    )
+    if not row:
+        row = AppMetricDaily(app_id=app_id, metric_date=metric_date)
+        db.add(row)
+    for key in METRIC_FIELDS:
+        setattr(row, key, values.get(key, 0))
+
+
+def rollup_ping(db: Session, app_id: int, today: date) -> list[date]:
+    days = collect_new_days(db, "ping:behavior_data", BehaviorData.id, BehaviorData.timestamp)
+    days |= collect_new_days(db, "ping:users", User.id, User.created_at)
+    count_new_sessions(db)
+    days.add(today)
+    for day in sorted(days):
+        upsert_day(db, app_id, day, compute_ping_day(db, app_id, day))
+    return sorted(days)
+
+
+def rollup_sparc(db: Session, app_id: int, today: date) -> list[date]:
+    days = collect_new_days(
+        db, "sparc:game_sessions", SparcGameSession.id, SparcGameSession.started_at
+    )
+    days |= collect_new_days(
+        db, "sparc:wordgame_scores", SparcWordGameScore.id, sparc_score_time()
+    )
+    days.add(today)
+    for day in sorted(days):
+        upsert_day(db, app_id, day, compute_sparc_day(db, app_id, day))
+    return sorted(days)
+
+
+ROLLUPS = {
+    "ping": rollup_ping,
+    "sparc": rollup_sparc,
+}
+
+
+def run_rollup(db: Session, slugs: list[str] | None = None) -> dict[str, list[str]]:
+    """
+    Bring ``AppMetricDaily`` up to date. Only days that received rows since
+    the previous run are recomputed, plus today so late commits with lower
+    ids are still picked up.
+    """
+    today = datetime.now(timezone.utc).date()
+    apps = {app.slug: app for app in db.query(App).filter(App.slug.in_(list(ROLLUPS))).all()}
+    results = {}
+    try:
+        for slug in slugs or list(ROLLUPS):
+            app = apps.get(slug)
+            if not app:
+                continue
+            days = ROLLUPS[slug](db, app.id, today)
+            results[slug] = [day.isoformat() for day in days]
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return results
+
+
+def run_rollup_job():
+    db = AdminSessionLocal()
+    try:
+        run_rollup(db)
+    finally:
+        db.close()
+
+
+rollup_job = register_job(
+    PeriodicJob(
+        "metrics-rollup",
+        METRICS_ROLLUP_INTERVAL_SECONDS,
+        run_rollup_job,
+        enabled=METRICS_ROLLUP_ENABLED,
+    )
+)
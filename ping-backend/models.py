@@ -9,6 +9,7 @@ from sqlalchemy import (
     Enum,
     JSON,
     UniqueConstraint,
+    Index,
 )
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
@@ -266,6 +267,68 @@ class BehaviorData(Base):
     # Timestamp
     timestamp = Column(DateTime(timezone=True), server_default=func.now(), index=True)
 
+    __table_args__ = (
+        # Class/student progress: user_id IN (...) AND module_id IN (...), distinct sessions
+        Index("ix_behavior_data_user_module_session", "user_id", "module_id", "session_id"),
+        # Admin session listing and exports by module and time range
+        Index("ix_behavior_data_module_timestamp", "module_id", "timestamp"),
+        # Guest data export/deletion
+        Index("ix_behavior_data_guest_session_id", "guest_session_id"),
+    )
+
+
+# Per-session aggregates of behavior_data, maintained at ingest time
+class TelemetrySession(Base):
+    __tablename__ = "telemetry_sessions"
+
+    id = Column(Integer, primary_key=True, index=True)
+    module_id = Column(String, nullable=False)
+    session_id = Column(String, nullable=False)
+
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=True, index=True)
+    guest_session_id = Column(String, nullable=True, index=True)
+
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    ended_at = Column(DateTime(timezone=True), nullable=True)
+    event_count = Column(Integer, default=0, nullable=False)
+    text_input_count = Column(Integer, default=0, nullable=False)
+    event_type_counts = Column(JSON, default=dict, nullable=True)  # {"click": 12, ...}
+    file_size = Column(Integer, nullable=True)  # bytes of the .jsonl.zst file, set on session end
+
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    __table_args__ = (
+        UniqueConstraint("session_id", "module_id", name="uq_telemetry_sessions_session_module"),
+        # Admin session listing, newest first (keyset on ended_at, session_id, module_id)
+        Index("ix_telemetry_sessions_ended", "ended_at", "session_id", "module_id"),
+        Index("ix_telemetry_sessions_module_ended", "module_id", "ended_at", "session_id"),
+    )
+
+
+class DataDeletionJob(Base):
+    __tablename__ = "data_deletion_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+
+    # Whose telemetry is being erased; no FK so the job outlives the account
+    user_id = Column(Integer, nullable=True, index=True)
+    guest_session_id = Column(String, nullable=True, index=True)
+
+    status = Column(String, nullable=False, default="pending", index=True)  # pending, running, completed, failed
+    rows_deleted = Column(Integer, default=0, nullable=False)
+    sessions_total = Column(Integer, nullable=True)
+    files_deleted = Column(Integer, default=0, nullable=False)
+    compacted_files_rewritten = Column(Integer, default=0, nullable=False)
+    attempts = Column(Integer, default=0, nullable=False)
+    error = Column(Text, nullable=True)
+
+    requested_at = Column(DateTime(timezone=True), server_default=func.now())
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    # Set after the first pass; the job erases once more after this time
+    recheck_after = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+
 
 class AuditLog(Base):
     __tablename__ = "audit_logs"
@@ -336,6 +399,28 @@ class EmailTemplate(Base):
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
 
+class EmailOutbox(Base):
+    __tablename__ = "email_outbox"
+    __table_args__ = (
+        # The sender's "what is due" scan
+        Index("ix_email_outbox_status_next_attempt", "status", "next_attempt_at"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    recipient = Column(String, nullable=False)
+    subject = Column(Text, nullable=False)
+    # Cleared once sent: password reset mails carry credentials
+    body = Column(Text, nullable=True)
+
+    status = Column(String, nullable=False, default="pending")  # pending, sent, failed
+    attempts = Column(Integer, default=0, nullable=False)
+    next_attempt_at = Column(DateTime(timezone=True), server_default=func.now())
+    last_error = Column(Text, nullable=True)
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    sent_at = Column(DateTime(timezone=True), nullable=True)
+
+
 class SparcWordGameScore(Base):
     __tablename__ = "sparc_wordgame_scores"
 
@@ -350,6 +435,25 @@ class SparcWordGameScore(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
 
+class SparcLeaderboardEntry(Base):
+    __tablename__ = "sparc_leaderboard_entries"
+
+    id = Column(Integer, primary_key=True, index=True)
+    player_name = Column(String, nullable=False)
+    scene = Column(String, nullable=False)  # '__all__' for the overall board
+    total_score = Column(Integer, default=0, nullable=False)
+    best_score = Column(Integer, default=0, nullable=False)
+    games_played = Column(Integer, default=0, nullable=False)
+    last_played = Column(DateTime(timezone=True), nullable=True)
+
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    __table_args__ = (
+        UniqueConstraint("player_name", "scene", name="uq_sparc_leaderboard_player_scene"),
+        Index("ix_sparc_leaderboard_scene_total", "scene", "total_score"),
+    )
+
+
 class SparcGameSession(Base):
     __tablename__ = "sparc_game_sessions"
 
@@ -487,3 +591,22 @@ class AppMetricDaily(Base):
     __table_args__ = (
         UniqueConstraint("app_id", "metric_date", name="uq_app_metrics_daily"),
     )
+
+
+class MetricRollupState(Base):
+    __tablename__ = "metric_rollup_state"
+
+    id = Column(Integer, primary_key=True, index=True)
+    source = Column(String, unique=True, index=True, nullable=False)
+    last_id = Column(Integer, default=0, nullable=False)
+    total = Column(Integer, default=0, nullable=False)  # running count, for sources that keep one
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+
+
+class SeedState(Base):
+    __tablename__ = "seed_state"
+
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String, unique=True, index=True, nullable=False)
+    fingerprint = Column(String, nullable=False)
+    applied_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
@@ -0,0 +1,179 @@
+import os
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from cache_bus import cache_bus
+from models import Module, ModuleWhitelist
+
+WHITELIST_CACHE_TTL_SECONDS = float(os.getenv("WHITELIST_CACHE_TTL_SECONDS", "300"))
+
+TOPIC = "module_whitelist"
+PENDING_KEY = "module_cache_invalidate"
+ALL_ORGS = "*"
+
+
+@dataclass(frozen=True)
+class CachedModule:
+    id: int
+    module_id: str
+    title: str
+    description: Optional[str]
+    subject: str
+    subject_id: Optional[int]
+    build_path: Optional[str]
+    cover_image_url: Optional[str]
+    is_published: bool
+    version: Optional[str]
+    created_at: datetime
+    updated_at: Optional[datetime]
+
+    @classmethod
+    def from_module(cls, module: Module) -> "CachedModule":
+        return cls(
+            id=module.id,
+            module_id=module.module_id,
+            title=module.title,
+            description=module.description,
+            subject=module.subject,
+            subject_id=module.subject_id,
+            build_path=module.build_path,
+            cover_image_url=module.cover_image_url,
+            is_published=module.is_published,
+            version=module.version,
+            created_at=module.created_at,
+            updated_at=module.updated_at,
+        )
+
+
+class OrgWhitelistCache:
+    """
+    Published, enabled modules per organization, ordered by title.
+
+    Each organization has a version that is bumped on invalidation; a load
+    only lands in the cache if the version it started from is still
+    current, so a concurrent admin write never gets shadowed by the
+    pre-write list. The TTL is a backstop for missed invalidations.
+    """
+
+    def __init__(self, ttl_seconds: float):
+        self.ttl_seconds = ttl_seconds
+        self._entries: dict[int, tuple[int, float, tuple[CachedModule, ...]]] = {}
+        self._versions: dict[int, int] = {}
+        self._epoch = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl_seconds > 0
+
+    def get_modules(self, db: Session, organization_id: int | None) -> tuple[CachedModule, ...]:
+        if organization_id is None:
+            return ()
+        with self._lock:
+            version = self._version(organization_id)
+            entry = self._entries.get(organization_id)
+            if (
+                self.enabled
+                and entry is not None
+                and entry[0] == version
+                and entry[1] > time.monotonic()
+            ):
+                self.hits += 1
+                return entry[2]
+            self.misses += 1
+
+        modules = tuple(
+            CachedModule.from_module(module)
+            for module in db.query(Module)
+            .join(ModuleWhitelist, ModuleWhitelist.module_id == Module.id)
+            .filter(
+                ModuleWhitelist.organization_id == organization_id,
+                ModuleWhitelist.is_enabled == True,
+                Module.is_published == True,
+            )
+            .order_by(Module.title.asc())
+            .all()
+        )
+        if self.enabled:
+            with self._lock:
+                if self._version(organization_id) == version:
+                    self._entries[organization_id] = (
+                        version,
+                        time.monotonic() + self.ttl_seconds,
+                        modules,
+                    )
+        return modules
+
+    def get_module_ids(self, db: Session, organization_id: int | None) -> list[str]:
+        return [m.module_id for m in self.get_modules(db, organization_id)]
+
+    def find(self, db: Session, organization_id: int | None, module_id: str) -> CachedModule | None:
+        for module in self.get_modules(db, organization_id):
+            if module.module_id == module_id:
+                return module
+        return None
+
+    def invalidate(self, organization_id) -> None:
+        with self._lock:
+            self.invalidations += 1
+            if organization_id == ALL_ORGS:
+                self._epoch += 1
+                self._entries.clear()
+            else:
+                self._versions[organization_id] = self._versions.get(organization_id, 0) + 1
+                self._entries.pop(organization_id, None)
+
+    def clear(self) -> None:
+        self.invalidate(ALL_ORGS)
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "organizations": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "ttl_seconds": self.ttl_seconds,
+        }
+
+    def _version(self, organization_id: int) -> int:
+        return (self._epoch << 32) + self._versions.get(organization_id, 0)
+
+
+whitelist_cache = OrgWhitelistCache(WHITELIST_CACHE_TTL_SECONDS)
+cache_bus.subscribe(TOPIC, whitelist_cache.invalidate, on_reset=whitelist_cache.clear)
+
+
+@event.listens_for(Session, "after_flush")
+def collect_whitelist_changes(session, flush_context):
+    changed = set()
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, Module):
+            changed.add(ALL_ORGS)
+        elif isinstance(obj, ModuleWhitelist) and obj.organization_id is not None:
+            changed.add(obj.organization_id)
+    if changed:
+        session.info.setdefault(PENDING_KEY, set()).update(changed)
+
+
+@event.listens_for(Session, "after_commit")
+def publish_whitelist_changes(session):
+    pending = session.info.pop(PENDING_KEY, set())
+    if ALL_ORGS in pending:
+        pending = {ALL_ORGS}
+    for organization_id in pending:
+        cache_bus.publish(TOPIC, organization_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def discard_whitelist_changes(session):
+    session.info.pop(PENDING_KEY, None)
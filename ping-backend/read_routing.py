@@ -0,0 +1,207 @@
+import logging
+import os
+import threading
+from http.cookies import SimpleCookie
+from typing import Optional
+
+from sqlalchemy import text
+
+from database import READ_DATABASE_URL, RequestRoute, current_route, read_engine
+
+logger = logging.getLogger(__name__)
+
+READ_REPLICA_MAX_LAG_SECONDS = float(os.getenv("READ_REPLICA_MAX_LAG_SECONDS", "5"))
+READ_REPLICA_CHECK_SECONDS = float(os.getenv("READ_REPLICA_CHECK_SECONDS", "1"))
+# How long a client that wrote keeps reading from the primary at most; the
+# replica takes over earlier once it has replayed past the write.
+READ_YOUR_WRITES_SECONDS = int(os.getenv("READ_YOUR_WRITES_SECONDS", "30"))
+READ_YOUR_WRITES_COOKIE = os.getenv("READ_YOUR_WRITES_COOKIE", "ping_rw")
+
+READ_ONLY_METHODS = {"GET", "HEAD"}
+
+REPLICA_STATUS_SQL = text(
+    """
+    SELECT
+        pg_is_in_recovery(),
+        CASE WHEN pg_is_in_recovery() THEN pg_last_wal_replay_lsn() ELSE pg_current_wal_lsn() END,
+        CASE
+            WHEN NOT pg_is_in_recovery() THEN 0
+            WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+            ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+        END
+    """
+)
+
+
+def parse_lsn(value: Optional[str]) -> Optional[int]:
+    """``'16/B374D848'`` -> comparable integer; None when it is not an LSN."""
+    if not value or "/" not in value:
+        return None
+    high, _, low = value.partition("/")
+    try:
+        return (int(high, 16) << 32) + int(low, 16)
+    except ValueError:
+        return None
+
+
+class ReplicaMonitor:
+    """
+    Polls the read replica for its replay position and lag on a daemon
+    thread. Requests are only routed to the replica while the last check
+    succeeded and the lag was under ``max_lag_seconds``.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = bool(READ_DATABASE_URL),
+        check_seconds: float = READ_REPLICA_CHECK_SECONDS,
+        max_lag_seconds: float = READ_REPLICA_MAX_LAG_SECONDS,
+    ):
+        self.enabled = enabled
+        self.check_seconds = max(0.1, check_seconds)
+        self.max_lag_seconds = max_lag_seconds
+        self.healthy = False
+        self.lag_seconds: Optional[float] = None
+        self.replay_lsn: Optional[int] = None
+        self.checks = 0
+        self.check_failures = 0
+        self.routed_replica = 0
+        self.routed_primary = 0
+        self.fallback_lag = 0
+        self.fallback_recent_write = 0
+        self._thread: threading.Thread | None = None
+        self._stopping = threading.Event()
+
+    def start(self):
+        if not self.enabled or (self._thread is not None and self._thread.is_alive()):
+            return
+        # Route to the primary until the first check has passed.
+        self.check()
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="replica-monitor", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def check(self):
+        self.checks += 1
+        try:
+            with read_engine.connect() as conn:
+                if read_engine.dialect.name == "postgresql":
+                    _, lsn, lag = conn.execute(REPLICA_STATUS_SQL).one()
+                    self.replay_lsn = parse_lsn(str(lsn)) if lsn is not None else None
+                    self.lag_seconds = float(lag or 0)
+                else:
+                    conn.execute(text("SELECT 1"))
+                    self.replay_lsn = None
+                    self.lag_seconds = 0.0
+        except Exception:
+            self.check_failures += 1
+            if self.healthy:
+                logger.exception("Read replica check failed; routing reads to the primary")
+            self.healthy = False
+            self.lag_seconds = None
+            return
+        healthy = self.lag_seconds <= self.max_lag_seconds
+        if healthy and not self.healthy:
+            logger.info("Read replica lag %.1fs: routing reads to the replica", self.lag_seconds)
+        elif self.healthy and not healthy:
+            logger.warning("Read replica lag %.1fs: falling back to the primary", self.lag_seconds)
+        self.healthy = healthy
+
+    def caught_up(self, write_lsn: Optional[str]) -> bool:
+        """Whether the replica has replayed past the client's last write."""
+        wanted = parse_lsn(write_lsn)
+        return wanted is not None and self.replay_lsn is not None and self.replay_lsn >= wanted
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "healthy": self.healthy,
+            "lag_seconds": self.lag_seconds,
+            "max_lag_seconds": self.max_lag_seconds,
+            "checks": self.checks,
+            "check_failures": self.check_failures,
+            "routed_replica": self.routed_replica,
+            "routed_primary": self.routed_primary,
+            "fallback_lag": self.fallback_lag,
+            "fallback_recent_write": self.fallback_recent_write,
+        }
+
+    def _run(self):
+        while not self._stopping.wait(self.check_seconds):
+            self.check()
+
+
+replica_monitor = ReplicaMonitor()
+
+
+def request_cookie(scope, name: str) -> Optional[str]:
+    for key, value in scope.get("headers", ()):
+        if key == b"cookie":
+            morsel = SimpleCookie(value.decode("latin-1")).get(name)
+            if morsel is not None:
+                return morsel.value
+    return None
+
+
+def choose_replica(scope) -> bool:
+    if scope["method"] not in READ_ONLY_METHODS:
+        return False
+    write_lsn = request_cookie(scope, READ_YOUR_WRITES_COOKIE)
+    if write_lsn is not None and not replica_monitor.caught_up(write_lsn):
+        replica_monitor.fallback_recent_write += 1
+        return False
+    if not replica_monitor.healthy:
+        replica_monitor.fallback_lag += 1
+        return False
+    return True
+
+
+def write_cookie(lsn: str) -> bytes:
+    # Off Postgres there is no LSN to compare, so the cookie pins the client
+    # to the primary for its whole lifetime.
+    value = lsn or "pending"
+    return (
+        f"{READ_YOUR_WRITES_COOKIE}={value}; Max-Age={READ_YOUR_WRITES_SECONDS}; "
+        "Path=/; HttpOnly; SameSite=Lax"
+    ).encode("latin-1")
+
+
+class ReadRoutingMiddleware:
+    """
+    Routes read-only requests to the replica (see ``RoutingSession``) and
+    hands clients that wrote a cookie with the primary's WAL position, so
+    their next reads stay on the primary until the replica has caught up.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not replica_monitor.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        route = RequestRoute(replica=choose_replica(scope))
+        if route.replica:
+            replica_monitor.routed_replica += 1
+        else:
+            replica_monitor.routed_primary += 1
+
+        async def send_with_cookie(message):
+            if message["type"] == "http.response.start" and route.committed_lsn is not None:
+                headers = list(message.get("headers", []))
+                headers.append((b"set-cookie", write_cookie(route.committed_lsn)))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        token = current_route.set(route)
+        try:
+            await self.app(scope, receive, send_with_cookie)
+        finally:
+            current_route.reset(token)
@@ -1,16 +1,12 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from fastapi.responses import FileResponse
-from fastapi import BackgroundTasks, Query
+from fastapi.responses import FileResponse, StreamingResponse
+from fastapi import Query
 from sqlalchemy.orm import Session
-from sqlalchemy import func, case
-import os
-import re
-from pathlib import Path
-import tempfile
-import zipfile
+from sqlalchemy import func
+import zstandard as zstd
 from datetime import datetime
 
-from database import get_db
+from database import AdminSessionLocal, estimate_count, get_admin_db, pool_stats
 from models import (
     User,
     UserRole,
@@ -32,8 +28,35 @@ from models import (
     AppSession,
     AppEvent,
     UserModuleCompletion,
+    TelemetrySession,
 )
 from routers.auth_router import get_current_user
+from routers.dashboard_router import overview_cache
+from routers.telemetry_router import ingest_queue
+from auth import password_pool, token_cache
+from background_jobs import jobs
+from cache_bus import cache_bus
+from email_outbox import outbox_sender
+from read_routing import replica_monitor
+from user_cache import user_cache
+from module_cache import whitelist_cache
+from telemetry_files import (
+    sanitize_segment,
+    get_session_file_path,
+    get_file_dictionary_id,
+    module_dictionaries,
+    session_writers,
+    train_module_dictionary,
+    files_exist,
+)
+from telemetry_sessions import encode_session_cursor, list_session_page
+from streaming_zip import file_member, stream_zip
+from telemetry_compaction import (
+    compaction_available,
+    get_compacted_day_path,
+    load_manifest,
+    run_compaction,
+)
 from schemas import (
     EmailTemplateResponse,
     EmailTemplateUpdate,
@@ -52,20 +75,6 @@ from schemas import (
 
 router = APIRouter(prefix="/api/admin", tags=["admin"])
 
-TELEMETRY_DATA_DIR = os.getenv("TELEMETRY_DATA_DIR", "/mnt/data/pingdata/telemetry")
-
-
-def sanitize_segment(value: str) -> str:
-    safe = re.sub(r"[^A-Za-z0-9._-]+", "_", value or "").strip("_")
-    return safe or "unknown"
-
-
-def get_session_file_path(module_id: str, session_id: str) -> Path:
-    safe_module = sanitize_segment(module_id)
-    safe_session = sanitize_segment(session_id)
-    return Path(TELEMETRY_DATA_DIR) / safe_module / f"{safe_session}.jsonl.zst"
-
-
 def parse_date(value: str | None, end_of_day: bool = False) -> datetime | None:
     if not value:
         return None
@@ -104,18 +113,18 @@ def require_platform_admin(current_user: User):
 
 
 @router.get("/organizations", response_model=list[OrganizationResponse])
-async def list_organizations(
-    current_user: User = Depends(get_current_user), db: Session = Depends(get_db)
+def list_organizations(
+    current_user: User = Depends(get_current_user), db: Session = Depends(get_admin_db)
 ):
     require_platform_admin(current_user)
     return db.query(Organization).order_by(Organization.name.asc()).all()
 
 
 @router.post("/organizations", response_model=OrganizationResponse)
-async def create_organization(
+def create_organization(
     payload: OrganizationCreate,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_admin_db),
 ):
     require_platform_admin(current_user)
     existing = (
@@ -142,11 +151,11 @@ async def create_organization(
 
 
 @router.put("/organizations/{org_id}", response_model=OrganizationResponse)
-async def update_organization(
+def update_organization(
     org_id: int,
     payload: OrganizationUpdate,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_admin_db),
 ):
     require_platform_admin(current_user)
     org = db.query(Organization).filter(Organization.id == org_id).first()
@@ -170,8 +179,8 @@ async def update_organization(
 
 
 @router.get("/subjects", response_model=list[SubjectResponse])
-async def list_subjects(
-    current_user: User = Depends(get_current_user), db: Session = Depends(get_db)
+def list_subjects(
+    current_user: User = Depends(get_current_user), db: Session = Depends(get_admin_db)
 ):
     require_platform_admin(current_user)
     return (
@@ -180,10 +189,10 @@ async def list_subjects(
 
 
 @router.post("/subjects", response_model=SubjectResponse)
-async def create_subject(
+def create_subject(
     payload: SubjectCreate,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_admin_db),
 ):
     require_admin(current_user)
     existing = db.query(Subject).filter(Subject.key == payload.key).first()
@@ -204,11 +213,11 @@ async def create_subject(
 
 
 @router.put("/subjects/{subject_id}", response_model=SubjectResponse)
-async def update_subject(
+def update_subject(
     subject_id: int,
     payload: SubjectUpdate,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_admin_db),
 ):
     require_admin(current_user)
     subject = db.query(Subject).filter(Subject.id == subject_id).first()
@@ -228,50 +237,58 @@ async def update_subject(
 
 
 @router.get("/telemetry/sessions")
-async def list_telemetry_sessions(
+def list_telemetry_sessions(
     module_id: str | None = Query(default=None),
     start_date: str | None = Query(default=None),
     end_date: str | None = Query(default=None),
     limit: int = Query(default=50, ge=1, le=500),
     offset: int = Query(default=0, ge=0),
+    cursor: str | None = Query(default=None),
+    count: str = Query(default="approximate", pattern="^(none|approximate|exact)$"),
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_admin_db),
 ):
+    """
+    Telemetry sessions, most recently active first. Pass ``next_cursor``
+    back as ``cursor`` to page; ``offset`` is still accepted for older
+    clients but gets slower the deeper it goes. ``count`` picks between
+    no total, the planner's estimate (default) and an exact count.
+    """
     require_admin(current_user)
 
     start_dt = parse_date(start_date)
     end_dt = parse_date(end_date, end_of_day=True)
 
-    query = db.query(
-        BehaviorData.module_id,
-        BehaviorData.session_id,
-        func.count(BehaviorData.id).label("event_count"),
-        func.min(BehaviorData.timestamp).label("started_at"),
-        func.max(BehaviorData.timestamp).label("ended_at"),
-        func.sum(case((BehaviorData.event_type == "text_input", 1), else_=0)).label(
-            "text_input_count"
-        ),
-    )
+    query = db.query(TelemetrySession)
 
     if module_id:
-        query = query.filter(BehaviorData.module_id == module_id)
+        query = query.filter(TelemetrySession.module_id == module_id)
+    # Sessions overlapping the requested window
     if start_dt:
-        query = query.filter(BehaviorData.timestamp >= start_dt)
+        query = query.filter(TelemetrySession.ended_at >= start_dt)
     if end_dt:
-        query = query.filter(BehaviorData.timestamp <= end_dt)
-
-    query = query.group_by(BehaviorData.module_id, BehaviorData.session_id)
-    total = query.count()
-    rows = (
-        query.order_by(func.max(BehaviorData.timestamp).desc())
-        .offset(offset)
-        .limit(limit)
-        .all()
-    )
+        query = query.filter(TelemetrySession.started_at <= end_dt)
+
+    total = None
+    if count == "exact":
+        total = query.count()
+    elif count == "approximate":
+        total = estimate_count(db, query)
 
+    try:
+        rows = list_session_page(query, limit, cursor=cursor, offset=offset if not cursor else 0)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor"
+        )
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    exists = files_exist(
+        [get_session_file_path(row.module_id, row.session_id) for row in rows]
+    )
     sessions = []
-    for row in rows:
-        file_path = get_session_file_path(row.module_id, row.session_id)
+    for row, file_exists in zip(rows, exists):
         sessions.append(
             {
                 "module_id": row.module_id,
@@ -280,15 +297,22 @@ async def list_telemetry_sessions(
                 "text_input_count": int(row.text_input_count or 0),
                 "started_at": row.started_at.isoformat() if row.started_at else None,
                 "ended_at": row.ended_at.isoformat() if row.ended_at else None,
-                "file_exists": file_path.exists(),
+                "file_exists": file_exists,
             }
         )
 
-    return {"total": total, "limit": limit, "offset": offset, "sessions": sessions}
+    return {
+        "total": total,
+        "total_is_estimate": count == "approximate" and db.get_bind().dialect.name == "postgresql",
+        "limit": limit,
+        "offset": offset if not cursor else None,
+        "next_cursor": encode_session_cursor(rows[-1]) if has_more and rows else None,
+        "sessions": sessions,
+    }
 
 
 @router.get("/telemetry/sessions/{session_id}/download")
-async def download_session_file(
+def download_session_file(
     session_id: str,
     module_id: str = Query(...),
     current_user: User = Depends(get_current_user),
@@ -300,58 +324,203 @@ async def download_session_file(
             status_code=status.HTTP_404_NOT_FOUND, detail="Telemetry file not found"
         )
     filename = f"{sanitize_segment(module_id)}-{sanitize_segment(session_id)}.jsonl.zst"
+    headers = {}
+    dict_id = get_file_dictionary_id(file_path)
+    if dict_id:
+        # Frames were compressed against a module dictionary; consumers need
+        # it (zstd -D) to decode the file.
+        headers["X-Zstd-Dictionary-Id"] = str(dict_id)
+        headers["X-Zstd-Dictionary-Url"] = (
+            f"/api/admin/telemetry/dictionaries/{module_id}/{dict_id}/download"
+        )
     return FileResponse(
-        path=str(file_path), filename=filename, media_type="application/zstd"
+        path=str(file_path),
+        filename=filename,
+        media_type="application/zstd",
+        headers=headers,
+    )
+
+
+@router.get("/telemetry/dictionaries/{module_id}")
+def list_telemetry_dictionaries(
+    module_id: str,
+    current_user: User = Depends(get_current_user),
+):
+    require_platform_admin(current_user)
+    versions = module_dictionaries.list_versions(module_id)
+    current_id = versions[-1]["dict_id"] if versions else None
+    return {
+        "module_id": module_id,
+        "current_dict_id": current_id,
+        "dictionaries": [
+            {
+                "version": item["version"],
+                "dict_id": item["dict_id"],
+                "size": item["size"],
+            }
+            for item in versions
+        ],
+    }
+
+
+@router.post("/telemetry/dictionaries/{module_id}/train")
+def train_telemetry_dictionary(
+    module_id: str,
+    current_user: User = Depends(get_current_user),
+):
+    require_platform_admin(current_user)
+    try:
+        result = train_module_dictionary(module_id)
+    except (ValueError, zstd.ZstdError) as exc:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc))
+    return {
+        "module_id": module_id,
+        "version": result["version"],
+        "dict_id": result["dict_id"],
+        "size": result["size"],
+        "samples": result["samples"],
+        "sample_bytes": result["sample_bytes"],
+        "files": result["files"],
+    }
+
+
+@router.get("/telemetry/dictionaries/{module_id}/{dict_id}/download")
+def download_telemetry_dictionary(
+    module_id: str,
+    dict_id: int,
+    current_user: User = Depends(get_current_user),
+):
+    require_platform_admin(current_user)
+    for item in module_dictionaries.list_versions(module_id):
+        if item["dict_id"] == dict_id:
+            return FileResponse(
+                path=str(item["path"]),
+                filename=f"{sanitize_segment(module_id)}-{dict_id}.zdict",
+                media_type="application/octet-stream",
+            )
+    raise HTTPException(
+        status_code=status.HTTP_404_NOT_FOUND, detail="Dictionary not found"
     )
 
 
 @router.get("/telemetry/exports")
-async def download_all_sessions(
-    background_tasks: BackgroundTasks,
+def download_all_sessions(
     module_id: str = Query(...),
     start_date: str | None = Query(default=None),
     end_date: str | None = Query(default=None),
+    format: str = Query(default="zip", pattern="^(zip|parquet)$"),
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_admin_db),
 ):
     require_platform_admin(current_user)
 
+    if format == "parquet":
+        # Serve the compacted columnar file for a single day.
+        if not start_date or (end_date and end_date != start_date):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Parquet exports cover a single day; pass start_date only",
+            )
+        day = parse_date(start_date).date()
+        day_path = get_compacted_day_path(module_id, day)
+        if not day_path:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Telemetry for this day has not been compacted yet",
+            )
+        return FileResponse(
+            path=str(day_path),
+            filename=f"{sanitize_segment(module_id)}-{day.isoformat()}.parquet",
+            media_type="application/vnd.apache.parquet",
+        )
+
     start_dt = parse_date(start_date)
     end_dt = parse_date(end_date, end_of_day=True)
 
-    query = db.query(BehaviorData.session_id).filter(
-        BehaviorData.module_id == module_id
-    )
-    if start_dt:
-        query = query.filter(BehaviorData.timestamp >= start_dt)
-    if end_dt:
-        query = query.filter(BehaviorData.timestamp <= end_dt)
-
-    session_ids = [row[0] for row in query.distinct().all()]
-
-    temp = tempfile.NamedTemporaryFile(delete=False, suffix=".zip")
-    temp.close()
-    zip_path = Path(temp.name)
+    def iter_members():
+        # The request's DB session is closed before the body is streamed,
+        # so the session lookup runs on its own session inside the generator.
+        stream_db = AdminSessionLocal()
+        try:
+            query = stream_db.query(BehaviorData.session_id).filter(
+                BehaviorData.module_id == module_id
+            )
+            if start_dt:
+                query = query.filter(BehaviorData.timestamp >= start_dt)
+            if end_dt:
+                query = query.filter(BehaviorData.timestamp <= end_dt)
 
-    with zipfile.ZipFile(zip_path, "w", compression=zipfile.ZIP_DEFLATED) as zf:
-        for sess_id in session_ids:
-            file_path = get_session_file_path(module_id, sess_id)
-            if file_path.exists():
+            for (sess_id,) in query.distinct().yield_per(1000):
+                file_path = get_session_file_path(module_id, sess_id)
                 arcname = f"{sanitize_segment(module_id)}/{file_path.name}"
-                zf.write(file_path, arcname=arcname)
+                yield file_member(file_path, arcname)
+        finally:
+            stream_db.close()
+
+        # Ship the module dictionaries so dictionary-compressed members decode.
+        for item in module_dictionaries.list_versions(module_id):
+            arcname = f"{sanitize_segment(module_id)}/_dict/{item['path'].name}"
+            yield file_member(item["path"], arcname)
 
-    background_tasks.add_task(zip_path.unlink, missing_ok=True)
     filename = f"{sanitize_segment(module_id)}-telemetry.zip"
-    return FileResponse(
-        path=str(zip_path), filename=filename, media_type="application/zip"
+    return StreamingResponse(
+        stream_zip(iter_members()),
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
     )
 
 
+@router.get("/telemetry/compaction/{module_id}")
+def get_telemetry_compaction_manifest(
+    module_id: str,
+    current_user: User = Depends(get_current_user),
+):
+    require_platform_admin(current_user)
+    return load_manifest(module_id)
+
+
+@router.post("/telemetry/compaction/run")
+def run_telemetry_compaction(
+    module_id: str | None = Query(default=None),
+    day: str | None = Query(default=None),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_admin_db),
+):
+    require_platform_admin(current_user)
+    if not compaction_available():
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="pyarrow is not installed",
+        )
+    days = [parse_date(day).date()] if day else None
+    results = run_compaction(db, module_id=module_id, days=days, force=bool(day))
+    return {"compacted": results}
+
+
+@router.get("/metrics")
+def get_runtime_metrics(current_user: User = Depends(get_current_user)):
+    require_platform_admin(current_user)
+    return {
+        "telemetry_ingest": ingest_queue.stats(),
+        "telemetry_writers": session_writers.stats(),
+        "password_hashing": password_pool.stats(),
+        "token_cache": token_cache.stats(),
+        "dashboard_cache": overview_cache.stats(),
+        "user_cache": user_cache.stats(),
+        "whitelist_cache": whitelist_cache.stats(),
+        "cache_bus": cache_bus.stats(),
+        "database_pools": pool_stats(),
+        "read_routing": replica_monitor.stats(),
+        "email_outbox": outbox_sender.stats(),
+        "jobs": {name: job.stats() for name, job in jobs.items()},
+    }
+
+
 @router.get("/users", response_model=list[UserResponse])
-async def list_users(
+def list_users(
     q: str | None = Query(default=None),
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_admin_db),
 ):
     require_platform_admin(current_user)
 
@@ -407,11 +576,11 @@ async def list_users(
 
 
 @router.put("/users/{user_id}", response_model=UserResponse)
-async def update_user(
+def update_user(
     user_id: int,
     payload: UserAdminUpdate,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_admin_db),
 ):
     require_platform_admin(current_user)
     user = db.query(User).filter(User.id == user_id).first()
@@ -467,10 +636,10 @@ async def update_user(
 
 
 @router.delete("/users/{user_id}", response_model=UserResponse)
-async def deactivate_user(
+def deactivate_user(
     user_id: int,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_admin_db),
 ):
     require_platform_admin(current_user)
     if current_user.id == user_id:
@@ -502,10 +671,10 @@ async def deactivate_user(
 
 
 @router.delete("/users/{user_id}/hard")
-async def hard_delete_user(
+def hard_delete_user(
     user_id: int,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_admin_db),
 ):
     require_platform_admin(current_user)
 
@@ -564,6 +733,9 @@ async def hard_delete_user(
     db.query(BehaviorData).filter(BehaviorData.user_id == user_id).update(
         {BehaviorData.user_id: None}, synchronize_session=False
     )
+    db.query(TelemetrySession).filter(TelemetrySession.user_id == user_id).update(
+        {TelemetrySession.user_id: None}, synchronize_session=False
+    )
     db.query(ConsentRecord).filter(ConsentRecord.user_id == user_id).update(
         {ConsentRecord.user_id: None}, synchronize_session=False
     )
@@ -595,8 +767,8 @@ async def hard_delete_user(
 
 
 @router.get("/email-templates", response_model=list[EmailTemplateResponse])
-async def list_email_templates(
-    current_user: User = Depends(get_current_user), db: Session = Depends(get_db)
+def list_email_templates(
+    current_user: User = Depends(get_current_user), db: Session = Depends(get_admin_db)
 ):
     require_platform_admin(current_user)
     templates = db.query(EmailTemplate).order_by(EmailTemplate.key.asc()).all()
@@ -604,11 +776,11 @@ async def list_email_templates(
 
 
 @router.put("/email-templates/{template_key}", response_model=EmailTemplateResponse)
-async def update_email_template(
+def update_email_template(
     template_key: str,
     payload: EmailTemplateUpdate,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_admin_db),
 ):
     require_platform_admin(current_user)
     template = db.query(EmailTemplate).filter(EmailTemplate.key == template_key).first()
@@ -632,18 +804,18 @@ async def update_email_template(
 
 
 @router.get("/modules", response_model=list[ModuleResponse])
-async def list_modules(
-    current_user: User = Depends(get_current_user), db: Session = Depends(get_db)
+def list_modules(
+    current_user: User = Depends(get_current_user), db: Session = Depends(get_admin_db)
 ):
     require_platform_admin(current_user)
     return db.query(Module).order_by(Module.created_at.desc()).all()
 
 
 @router.post("/modules", response_model=ModuleResponse)
-async def create_module(
+def create_module(
     payload: ModuleCreate,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_admin_db),
 ):
     require_platform_admin(current_user)
 
@@ -691,11 +863,11 @@ async def create_module(
 
 
 @router.put("/modules/{module_id}", response_model=ModuleResponse)
-async def update_module(
+def update_module(
     module_id: str,
     payload: ModuleUpdate,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_admin_db),
 ):
     require_platform_admin(current_user)
 
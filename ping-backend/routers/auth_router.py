@@ -14,10 +14,12 @@ from schemas import (
     ConsentCreate, ConsentResponse, UserUpdate, PasswordUpdate, PasswordResetRequest
 )
 from auth import (
-    verify_password, get_password_hash, 
+    verify_password, verify_and_update_password, get_password_hash,
     create_access_token, verify_token
 )
-from email_service import send_email, render_template
+from email_service import render_template
+from email_outbox import queue_email
+from user_cache import load_user
 
 from sqlalchemy import or_, func
 
@@ -27,7 +29,7 @@ oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
 oauth2_scheme_optional = OAuth2PasswordBearer(tokenUrl="/api/auth/login", auto_error=False)
 
 # Dependency to get current user
-async def get_current_user(
+def get_current_user(
     token: str = Depends(oauth2_scheme),
     db: Session = Depends(get_db)
 ):
@@ -47,10 +49,7 @@ async def get_current_user(
     if email is None and user_id is None:
         raise credentials_exception
     
-    if user_id:
-        user = db.query(User).filter(User.id == user_id).first()
-    else:
-        user = db.query(User).filter(User.email == email).first()
+    user = load_user(db, user_id=user_id, email=email)
     
     if user is None:
         raise credentials_exception
@@ -58,7 +57,7 @@ async def get_current_user(
     return user
 
 
-async def get_optional_user(
+def get_optional_user(
     token: str | None = Depends(oauth2_scheme_optional),
     db: Session = Depends(get_db)
 ):
@@ -69,17 +68,11 @@ async def get_optional_user(
     if payload is None:
         return None
 
-    email = payload.get("sub")
-    user_id = payload.get("user_id")
-    if user_id:
-        return db.query(User).filter(User.id == user_id).first()
-    if email:
-        return db.query(User).filter(User.email == email).first()
-    return None
+    return load_user(db, user_id=payload.get("user_id"), email=payload.get("sub"))
 
 # User Registration
 @router.post("/register", response_model=UserResponse)
-async def register_user(
+def register_user(
     user_data: UserCreate,
     request: Request,
     db: Session = Depends(get_db)
@@ -205,26 +198,23 @@ async def register_user(
             user_agent=request.headers.get("user-agent")
         ))
 
-    db.commit()
-    db.refresh(new_user)
-
     template = db.query(EmailTemplate).filter(
         EmailTemplate.key == "welcome_user",
         EmailTemplate.is_active == True
     ).first()
     if template and new_user.email:
-        try:
-            subject = render_template(template.subject, {"user_name": new_user.full_name or new_user.username})
-            body = render_template(template.body, {"user_name": new_user.full_name or new_user.username})
-            send_email(new_user.email, subject, body)
-        except Exception:
-            pass
-    
+        subject = render_template(template.subject, {"user_name": new_user.full_name or new_user.username})
+        body = render_template(template.body, {"user_name": new_user.full_name or new_user.username})
+        queue_email(db, new_user.email, subject, body)
+
+    db.commit()
+    db.refresh(new_user)
+
     return new_user
 
 # User Login
 @router.post("/login", response_model=Token)
-async def login(
+def login(
     form_data: OAuth2PasswordRequestForm = Depends(),
     db: Session = Depends(get_db)
 ):
@@ -235,7 +225,11 @@ async def login(
         or_(User.email == form_data.username, User.username == form_data.username)
     ).first()
     
-    if not user or not verify_password(form_data.password, user.hashed_password):
+    verified, new_hash = (
+        verify_and_update_password(form_data.password, user.hashed_password)
+        if user else (False, None)
+    )
+    if not verified:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
@@ -250,6 +244,8 @@ async def login(
     
     # Update last login
     user.last_login = datetime.utcnow()
+    if new_hash:
+        user.hashed_password = new_hash
     db.commit()
     
     # Create access token
@@ -261,12 +257,16 @@ async def login(
 
 # Alternative login endpoint for JSON
 @router.post("/login-json", response_model=Token)
-async def login_json(user_data: UserLogin, db: Session = Depends(get_db)):
+def login_json(user_data: UserLogin, db: Session = Depends(get_db)):
     """Login with JSON body (email and password)"""
     
     user = db.query(User).filter(User.email == user_data.email).first()
     
-    if not user or not verify_password(user_data.password, user.hashed_password):
+    verified, new_hash = (
+        verify_and_update_password(user_data.password, user.hashed_password)
+        if user else (False, None)
+    )
+    if not verified:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password"
@@ -280,6 +280,8 @@ async def login_json(user_data: UserLogin, db: Session = Depends(get_db)):
     
     # Update last login
     user.last_login = datetime.utcnow()
+    if new_hash:
+        user.hashed_password = new_hash
     db.commit()
     
     # Create access token
@@ -291,13 +293,13 @@ async def login_json(user_data: UserLogin, db: Session = Depends(get_db)):
 
 # Get current user info
 @router.get("/me", response_model=UserResponse)
-async def get_me(current_user: User = Depends(get_current_user)):
+def get_me(current_user: User = Depends(get_current_user)):
     """Get current logged in user information"""
     return current_user
 
 
 @router.put("/me", response_model=UserResponse)
-async def update_me(
+def update_me(
     update_data: UserUpdate,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
@@ -322,7 +324,7 @@ async def update_me(
 
 
 @router.post("/password-reset")
-async def reset_password(
+def reset_password(
     payload: PasswordResetRequest,
     db: Session = Depends(get_db)
 ):
@@ -332,7 +334,6 @@ async def reset_password(
 
     new_password = secrets.token_urlsafe(10).replace("-", "").replace("_", "")[:12]
     user.hashed_password = get_password_hash(new_password)
-    db.commit()
 
     template = db.query(EmailTemplate).filter(
         EmailTemplate.key == "password_reset",
@@ -347,16 +348,14 @@ async def reset_password(
     if template:
         subject = render_template(template.subject, {"user_name": user.full_name or user.username or user.email})
         body = render_template(template.body, {"user_name": user.full_name or user.username or user.email, "new_password": new_password})
-    try:
-        send_email(user.email, subject, body)
-    except Exception:
-        pass
+    queue_email(db, user.email, subject, body)
+    db.commit()
 
     return {"success": True}
 
 
 @router.put("/password")
-async def update_password(
+def update_password(
     payload: PasswordUpdate,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
@@ -372,7 +371,7 @@ async def update_password(
 
 
 @router.delete("/me")
-async def deactivate_account(
+def deactivate_account(
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
@@ -384,7 +383,7 @@ async def deactivate_account(
 
 # Guest Session Creation
 @router.post("/guest", response_model=GuestSessionResponse)
-async def create_guest_session(
+def create_guest_session(
     guest_data: GuestSessionCreate,
     db: Session = Depends(get_db)
 ):
@@ -424,7 +423,7 @@ async def create_guest_session(
 
 # Submit Consent
 @router.post("/consent", response_model=ConsentResponse)
-async def submit_consent(
+def submit_consent(
     consent_data: ConsentCreate,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
@@ -456,7 +455,7 @@ async def submit_consent(
 
 # Check if user has valid consent
 @router.get("/consent/check")
-async def check_consent(
+def check_consent(
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
@@ -11,7 +11,6 @@ from models import (
     User,
     Class,
     Module,
-    ModuleWhitelist,
     BehaviorData,
     UserRole,
     ClassStudent,
@@ -37,6 +36,8 @@ from schemas import (
     ClassStudentManageRequest,
 )
 from routers.auth_router import get_current_user
+from class_stats import get_class_stats
+from module_cache import whitelist_cache
 
 router = APIRouter(prefix="/api/classes", tags=["classes"])
 
@@ -78,21 +79,11 @@ def verify_class_access(current_user: User, class_obj: Class):
 
 
 def get_class_module_ids(db: Session, class_obj: Class) -> List[str]:
-    module_ids = (
-        db.query(Module.module_id)
-        .join(ModuleWhitelist, ModuleWhitelist.module_id == Module.id)
-        .filter(
-            ModuleWhitelist.organization_id == class_obj.organization_id,
-            ModuleWhitelist.is_enabled == True,
-            Module.is_published == True,
-        )
-        .all()
-    )
-    return [module_id for (module_id,) in module_ids]
+    return whitelist_cache.get_module_ids(db, class_obj.organization_id)
 
 
 @router.get("/{class_id}/modules", response_model=list[ModuleResponse])
-async def get_class_modules(
+def get_class_modules(
     class_id: int,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db),
@@ -118,23 +109,13 @@ async def get_class_modules(
                 detail="You don't have access to this class",
             )
 
-    modules = (
-        db.query(Module)
-        .join(ModuleWhitelist, ModuleWhitelist.module_id == Module.id)
-        .filter(
-            ModuleWhitelist.organization_id == class_obj.organization_id,
-            ModuleWhitelist.is_enabled == True,
-            Module.is_published == True,
-        )
-        .order_by(Module.title.asc())
-        .all()
-    )
+    modules = whitelist_cache.get_modules(db, class_obj.organization_id)
 
     return modules
 
 
 @router.post("/", response_model=ClassResponse)
-async def create_class(
+def create_class(
     class_data: ClassCreate,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db),
@@ -170,7 +151,7 @@ async def create_class(
 
 
 @router.get("/", response_model=List[ClassWithStats])
-async def get_my_classes(
+def get_my_classes(
     current_user: User = Depends(get_current_user), db: Session = Depends(get_db)
 ):
     """
@@ -198,30 +179,11 @@ async def get_my_classes(
             u.id: u for u in db.query(User).filter(User.id.in_(teacher_ids)).all()
         }
 
+    stats = get_class_stats(db, classes)
     results = []
     for c in classes:
         teacher = teachers.get(c.teacher_id)
-        # Stats from membership
-        member_ids = [
-            row[0]
-            for row in db.query(ClassStudent.user_id)
-            .filter(ClassStudent.class_id == c.id)
-            .all()
-        ]
-        module_ids = get_class_module_ids(db, c)
-        if member_ids and module_ids:
-            total_sessions = (
-                db.query(func.count(func.distinct(BehaviorData.session_id)))
-                .filter(
-                    BehaviorData.user_id.in_(member_ids),
-                    BehaviorData.module_id.in_(module_ids),
-                )
-                .scalar()
-                or 0
-            )
-        else:
-            total_sessions = 0
-
+        class_stats = stats[c.id]
         results.append(
             ClassWithStats(
                 id=c.id,
@@ -236,10 +198,10 @@ async def get_my_classes(
                 organization_id=c.organization_id,
                 is_active=c.is_active,
                 created_at=c.created_at,
-                student_count=len(member_ids),
+                student_count=class_stats.student_count,
                 guest_count=0,
-                total_sessions=int(total_sessions),
-                module_count=len(module_ids),
+                total_sessions=class_stats.total_sessions,
+                module_count=class_stats.module_count,
             )
         )
 
@@ -247,7 +209,7 @@ async def get_my_classes(
 
 
 @router.get("/{class_id}", response_model=ClassWithStats)
-async def get_class_details(
+def get_class_details(
     class_id: int,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db),
@@ -268,25 +230,7 @@ async def get_class_details(
     # Verify teacher owns this class
     verify_class_access(current_user, class_obj)
 
-    member_ids = [
-        row[0]
-        for row in db.query(ClassStudent.user_id)
-        .filter(ClassStudent.class_id == class_obj.id)
-        .all()
-    ]
-    module_ids = get_class_module_ids(db, class_obj)
-    if member_ids and module_ids:
-        total_sessions = (
-            db.query(func.count(func.distinct(BehaviorData.session_id)))
-            .filter(
-                BehaviorData.user_id.in_(member_ids),
-                BehaviorData.module_id.in_(module_ids),
-            )
-            .scalar()
-            or 0
-        )
-    else:
-        total_sessions = 0
+    class_stats = get_class_stats(db, [class_obj])[class_obj.id]
 
     # Build response with stats
     response = ClassWithStats(
@@ -295,17 +239,17 @@ async def get_class_details(
         if class_obj.teacher
         else None,
         teacher_email=class_obj.teacher.email if class_obj.teacher else None,
-        student_count=len(member_ids),
+        student_count=class_stats.student_count,
         guest_count=0,
-        total_sessions=int(total_sessions),
-        module_count=len(module_ids),
+        total_sessions=class_stats.total_sessions,
+        module_count=class_stats.module_count,
     )
 
     return response
 
 
 @router.put("/{class_id}", response_model=ClassResponse)
-async def update_class(
+def update_class(
     class_id: int,
     class_data: ClassUpdate,
     current_user: User = Depends(get_current_user),
@@ -346,7 +290,7 @@ async def update_class(
 
 
 @router.post("/{class_id}/regenerate-code", response_model=ClassResponse)
-async def regenerate_join_code(
+def regenerate_join_code(
     class_id: int,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db),
@@ -382,7 +326,7 @@ async def regenerate_join_code(
 
 
 @router.post("/validate-code")
-async def validate_join_code(
+def validate_join_code(
     code_data: JoinCodeValidate, db: Session = Depends(get_db)
 ):
     """
@@ -416,7 +360,7 @@ async def validate_join_code(
 
 
 @router.post("/join", response_model=ClassResponse)
-async def join_class(
+def join_class(
     join_data: JoinClassRequest,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db),
@@ -457,7 +401,7 @@ async def join_class(
 
 
 @router.get("/joined", response_model=list[JoinedClassResponse])
-async def get_joined_classes(
+def get_joined_classes(
     current_user: User = Depends(get_current_user), db: Session = Depends(get_db)
 ):
     if current_user.role != UserRole.STUDENT:
@@ -499,7 +443,7 @@ async def get_joined_classes(
 
 
 @router.get("/my-tasks", response_model=list[StudentClassTasks])
-async def get_my_tasks(
+def get_my_tasks(
     current_user: User = Depends(get_current_user), db: Session = Depends(get_db)
 ):
     if current_user.role != UserRole.STUDENT:
@@ -527,21 +471,27 @@ async def get_my_tasks(
         }
 
     class_ids = [c.id for c in classes]
-    # Active tasks for joined classes
+    # Active tasks for joined classes, limited to modules the class's
+    # organization still has enabled (same rule as list_class_module_tasks)
     task_rows = (
-        db.query(ClassModuleTask.class_id, Module)
-        .join(Module, Module.id == ClassModuleTask.module_id)
+        db.query(ClassModuleTask.class_id, ClassModuleTask.module_id)
         .filter(
             ClassModuleTask.class_id.in_(class_ids),
             ClassModuleTask.is_active == True,
-            Module.is_published == True,
         )
         .all()
     )
+    org_by_class = {c.id: c.organization_id for c in classes}
+    modules_by_org = {
+        org_id: {m.id: m for m in whitelist_cache.get_modules(db, org_id)}
+        for org_id in set(org_by_class.values())
+    }
 
     modules_by_class = {}
-    for class_id, mod in task_rows:
-        modules_by_class.setdefault(class_id, []).append(mod)
+    for class_id, module_pk in task_rows:
+        mod = modules_by_org[org_by_class[class_id]].get(module_pk)
+        if mod:
+            modules_by_class.setdefault(class_id, []).append(mod)
 
     results = []
     for c in classes:
@@ -568,7 +518,7 @@ async def get_my_tasks(
 
 
 @router.get("/{class_id}/students", response_model=List[StudentProgress])
-async def get_class_students(
+def get_class_students(
     class_id: int,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db),
@@ -667,7 +617,7 @@ async def get_class_students(
 
 
 @router.post("/{class_id}/students")
-async def add_student_to_class(
+def add_student_to_class(
     class_id: int,
     payload: ClassStudentManageRequest,
     current_user: User = Depends(get_current_user),
@@ -718,7 +668,7 @@ async def add_student_to_class(
 
 
 @router.delete("/{class_id}/students/{student_id}")
-async def remove_student_from_class(
+def remove_student_from_class(
     class_id: int,
     student_id: int,
     current_user: User = Depends(get_current_user),
@@ -740,7 +690,7 @@ async def remove_student_from_class(
 
 
 @router.delete("/{class_id}")
-async def delete_class(
+def delete_class(
     class_id: int,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db),
@@ -769,7 +719,7 @@ async def delete_class(
 
 
 @router.put("/{class_id}/teacher", response_model=ClassResponse)
-async def transfer_class_teacher(
+def transfer_class_teacher(
     class_id: int,
     payload: ClassTeacherTransferRequest,
     current_user: User = Depends(get_current_user),
@@ -825,7 +775,7 @@ async def transfer_class_teacher(
 
 
 @router.get("/{class_id}/module-tasks", response_model=list[ClassModuleTaskResponse])
-async def list_class_module_tasks(
+def list_class_module_tasks(
     class_id: int,
     only_active: bool = False,
     current_user: User = Depends(get_current_user),
@@ -867,17 +817,7 @@ async def list_class_module_tasks(
             status_code=status.HTTP_403_FORBIDDEN, detail="Access denied"
         )
 
-    modules = (
-        db.query(Module)
-        .join(ModuleWhitelist, ModuleWhitelist.module_id == Module.id)
-        .filter(
-            ModuleWhitelist.organization_id == class_obj.organization_id,
-            ModuleWhitelist.is_enabled == True,
-            Module.is_published == True,
-        )
-        .order_by(Module.title.asc())
-        .all()
-    )
+    modules = whitelist_cache.get_modules(db, class_obj.organization_id)
 
     module_ids = [m.id for m in modules]
     tasks = {}
@@ -940,7 +880,7 @@ async def list_class_module_tasks(
 
 
 @router.put("/{class_id}/module-tasks/{module_id}")
-async def update_class_module_task(
+def update_class_module_task(
     class_id: int,
     module_id: str,
     payload: ClassModuleTaskUpdate,
@@ -955,26 +895,17 @@ async def update_class_module_task(
         )
     verify_class_access(current_user, class_obj)
 
-    module = (
-        db.query(Module)
-        .filter(Module.module_id == module_id, Module.is_published == True)
-        .first()
-    )
+    module = whitelist_cache.find(db, class_obj.organization_id, module_id)
     if not module:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND, detail="Module not found"
-        )
-
-    wl = (
-        db.query(ModuleWhitelist)
-        .filter(
-            ModuleWhitelist.organization_id == class_obj.organization_id,
-            ModuleWhitelist.module_id == module.id,
-            ModuleWhitelist.is_enabled == True,
+        published = (
+            db.query(Module.id)
+            .filter(Module.module_id == module_id, Module.is_published == True)
+            .first()
         )
-        .first()
-    )
-    if not wl:
+        if not published:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND, detail="Module not found"
+            )
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Module is not enabled for this organization",
@@ -1003,7 +934,7 @@ async def update_class_module_task(
     "/{class_id}/module-tasks/{module_id}/students",
     response_model=list[ClassModuleStudentStatus],
 )
-async def get_class_module_students(
+def get_class_module_students(
     class_id: int,
     module_id: str,
     current_user: User = Depends(get_current_user),
@@ -1,16 +1,22 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
 from sqlalchemy.orm import Session
-from sqlalchemy import func, distinct
-from datetime import datetime, timedelta, date
+from sqlalchemy import func
+from datetime import datetime, timedelta, timezone
 import os
-from database import get_read_db
-from models import User, UserRole, BehaviorData, App, SparcWordGameScore, SparcGameSession
+from database import ReadSessionLocal, SessionLocal
+from models import User, UserRole, BehaviorData, App, AppMetricDaily, MetricRollupState, SparcWordGameScore, SparcGameSession
 from schemas import DashboardOverview, DashboardTotals, DashboardTrendPoint, DashboardAppSummary
 from routers.auth_router import get_current_user
 from app_registry import DEFAULT_APPS
+from metrics_rollup import PING_SESSIONS_SOURCE
+from dashboard_cache import StaleWhileRevalidateCache, payload_etag
+from read_routing import replica_monitor
 
 router = APIRouter(prefix="/api/dashboard", tags=["dashboard"])
 
+DASHBOARD_CACHE_TTL_SECONDS = int(os.getenv("DASHBOARD_CACHE_TTL_SECONDS", "30"))
+DASHBOARD_CACHE_STALE_SECONDS = int(os.getenv("DASHBOARD_CACHE_STALE_SECONDS", "300"))
+
 
 def verify_admin_access(current_user: User):
     if current_user.role not in [UserRole.ORG_ADMIN, UserRole.PLATFORM_ADMIN]:
@@ -20,10 +26,26 @@ def verify_admin_access(current_user: User):
         )
 
 
-def get_ping_metrics(db: Session):
+def get_rollup_totals(db: Session, app_id: int | None):
+    if app_id is None:
+        return 0, 0
+    row = db.query(
+        func.coalesce(func.sum(AppMetricDaily.sessions), 0),
+        func.coalesce(func.sum(AppMetricDaily.events), 0)
+    ).filter(AppMetricDaily.app_id == app_id).one()
+    return int(row[0]), int(row[1])
+
+
+def get_rollup_counter(db: Session, source: str) -> int:
+    total = db.query(MetricRollupState.total).filter(MetricRollupState.source == source).scalar()
+    return int(total or 0)
+
+
+def get_ping_metrics(db: Session, app_id: int | None):
     total_users = db.query(func.count(User.id)).scalar() or 0
-    total_sessions = db.query(func.count(distinct(BehaviorData.session_id))).scalar() or 0
-    total_events = db.query(func.count(BehaviorData.id)).scalar() or 0
+    _, total_events = get_rollup_totals(db, app_id)
+    # Daily session counts overlap across midnight; use the distinct running count.
+    total_sessions = get_rollup_counter(db, PING_SESSIONS_SOURCE) if app_id is not None else 0
     last_event_at = db.query(func.max(BehaviorData.timestamp)).scalar()
 
     return {
@@ -35,29 +57,30 @@ def get_ping_metrics(db: Session):
     }
 
 
-def build_ping_trend(db: Session, range_days: int):
+def build_ping_trend(db: Session, app_id: int | None, range_days: int):
     range_days = max(1, min(range_days, 90))
     start_date = datetime.utcnow().date() - timedelta(days=range_days - 1)
-    start_dt = datetime.combine(start_date, datetime.min.time())
+    start_dt = datetime.combine(start_date, datetime.min.time(), tzinfo=timezone.utc)
 
-    rows = db.query(
-        func.date(BehaviorData.timestamp).label("day"),
-        func.count(BehaviorData.id).label("events"),
-        func.count(distinct(BehaviorData.session_id)).label("sessions")
-    ).filter(
-        BehaviorData.timestamp.isnot(None),
-        BehaviorData.timestamp >= start_dt
-    ).group_by("day").all()
+    rows = []
+    if app_id is not None:
+        rows = db.query(AppMetricDaily).filter(
+            AppMetricDaily.app_id == app_id,
+            AppMetricDaily.metric_date >= start_dt
+        ).all()
 
     row_map = {}
     for row in rows:
-        day_value = row.day
+        day_value = row.metric_date
         if isinstance(day_value, str):
             try:
-                day_value = datetime.fromisoformat(day_value).date()
+                day_value = datetime.fromisoformat(day_value)
             except ValueError:
                 continue
-        row_map[day_value] = row
+        if day_value.tzinfo is None:
+            day_value = day_value.replace(tzinfo=timezone.utc)
+        # Postgres hands timestamptz back in the session time zone; bucket by UTC day.
+        row_map[day_value.astimezone(timezone.utc).date()] = row
     trend = []
     for i in range(range_days):
         day = start_date + timedelta(days=i)
@@ -71,10 +94,9 @@ def build_ping_trend(db: Session, range_days: int):
     return trend
 
 
-def get_sparc_metrics(db: Session):
+def get_sparc_metrics(db: Session, app_id: int | None):
     total_users = db.query(func.count(User.id)).scalar() or 0
-    total_sessions = db.query(func.count(SparcGameSession.id)).scalar() or 0
-    total_events = db.query(func.count(SparcWordGameScore.id)).scalar() or 0
+    total_sessions, total_events = get_rollup_totals(db, app_id)
     last_event_at = db.query(func.max(SparcWordGameScore.played_at)).scalar()
     last_session_at = db.query(func.max(SparcGameSession.started_at)).scalar()
 
@@ -90,17 +112,12 @@ def get_sparc_metrics(db: Session):
     }
 
 
-@router.get("/overview", response_model=DashboardOverview)
-async def get_dashboard_overview(
-    range_days: int = 14,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_read_db)
-):
-    verify_admin_access(current_user)
-
+def build_dashboard_overview(db: Session, range_days: int) -> DashboardOverview:
     app_rows = {app.slug: app for app in db.query(App).all()}
-    ping_metrics = get_ping_metrics(db)
-    sparc_metrics = get_sparc_metrics(db)
+    ping_app_id = app_rows["ping"].id if "ping" in app_rows else None
+    sparc_app_id = app_rows["sparc"].id if "sparc" in app_rows else None
+    ping_metrics = get_ping_metrics(db, ping_app_id)
+    sparc_metrics = get_sparc_metrics(db, sparc_app_id)
 
     app_metrics_map = {
         "ping": ping_metrics,
@@ -147,9 +164,55 @@ async def get_dashboard_overview(
             events=total_events
         ),
         apps=apps_summary,
-        trend=build_ping_trend(db, range_days),
+        trend=build_ping_trend(db, ping_app_id, range_days),
         read_replica=bool(os.getenv("READ_DATABASE_URL")),
         generated_at=datetime.utcnow()
     )
 
     return overview
+
+
+def load_dashboard_overview(range_days: int) -> DashboardOverview:
+    # Cache refreshes run outside any request, so pick the replica here.
+    db = ReadSessionLocal() if replica_monitor.healthy else SessionLocal()
+    try:
+        return build_dashboard_overview(db, range_days)
+    finally:
+        db.close()
+
+
+def overview_etag(overview: DashboardOverview) -> str:
+    return payload_etag(
+        overview.model_dump_json(exclude={"generated_at", "stale"}).encode("utf-8")
+    )
+
+
+overview_cache = StaleWhileRevalidateCache(
+    load_dashboard_overview,
+    overview_etag,
+    ttl_seconds=DASHBOARD_CACHE_TTL_SECONDS,
+    stale_seconds=DASHBOARD_CACHE_STALE_SECONDS,
+)
+
+
+@router.get("/overview", response_model=DashboardOverview)
+def get_dashboard_overview(
+    request: Request,
+    response: Response,
+    range_days: int = 14,
+    current_user: User = Depends(get_current_user)
+):
+    verify_admin_access(current_user)
+
+    range_days = max(1, min(range_days, 90))
+    entry, stale = overview_cache.get(range_days)
+
+    headers = {
+        "ETag": entry.etag,
+        "Cache-Control": f"private, max-age={int(overview_cache.ttl_seconds)}"
+    }
+    if request.headers.get("if-none-match") == entry.etag:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    response.headers.update(headers)
+    return entry.value.model_copy(update={"stale": stale})
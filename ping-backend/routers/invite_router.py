@@ -1,17 +1,33 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from datetime import datetime
+import csv
+import io
+import os
 import random
 import string
 
-from database import get_db
+from database import dialect_insert, get_db
 from models import InviteCode, InviteRole, User, UserRole, Class, EmailTemplate, InviteUse, ClassStudent
-from schemas import InviteCreate, InviteResponse
-from email_service import send_email, render_template
+from schemas import InviteBulkCreate, InviteBulkItem, InviteCreate, InviteResponse
+from email_service import render_template
+from email_outbox import queue_email, queue_emails
 from routers.auth_router import get_current_user
 
 router = APIRouter(prefix="/api/invites", tags=["invites"])
 
+INVITE_BULK_MAX = int(os.getenv("INVITE_BULK_MAX", "1000"))
+INVITE_CODE_ATTEMPTS = 5
+INVITE_CSV_CHUNK_BYTES = 64 * 1024
+INVITE_CSV_COLUMNS = ("code", "role", "recipient_email", "class_id", "max_uses", "expires_at")
+
+# role -> (code prefix, email template key, label)
+INVITE_KINDS = {
+    InviteRole.TEACHER: ("TCH", "invite_teacher", "Teacher"),
+    InviteRole.STUDENT: ("STD", "invite_student", "Student"),
+}
+
 
 def generate_invite_code(prefix: str) -> str:
     part1 = ''.join(random.choices(string.ascii_uppercase + string.digits, k=4))
@@ -37,6 +53,170 @@ def build_template_email(template: EmailTemplate, context: dict) -> tuple[str, s
     return subject, body
 
 
+def get_invite_template(db: Session, template_key: str) -> EmailTemplate | None:
+    return db.query(EmailTemplate).filter(
+        EmailTemplate.key == template_key,
+        EmailTemplate.is_active == True
+    ).first()
+
+
+def invite_email_content(template: EmailTemplate | None, invite, role_label: str) -> tuple[str, str]:
+    if template:
+        return build_template_email(template, {
+            "invite_code": invite.code,
+            "role": role_label,
+            "expires_at": invite.expires_at or "No expiry"
+        })
+    return build_invite_email(invite, role_label)
+
+
+def queue_invite_email(db: Session, invite: InviteCode, recipient: str, template_key: str, role_label: str) -> None:
+    subject, body = invite_email_content(get_invite_template(db, template_key), invite, role_label)
+    queue_email(db, recipient, subject, body)
+
+
+def allocate_invites(db: Session, prefix: str, rows: list[dict]) -> list:
+    """
+    Insert one invite per entry of ``rows`` with a single multi-row INSERT,
+    giving each a random code. Candidates that hit an existing code are
+    skipped by the unique index and retried with fresh ones, instead of
+    probing every candidate with a SELECT first. Returns the inserted rows
+    in the order of ``rows``.
+    """
+    table = InviteCode.__table__
+    allocated: list = [None] * len(rows)
+    pending = list(range(len(rows)))
+    for _ in range(INVITE_CODE_ATTEMPTS):
+        codes: set[str] = set()
+        while len(codes) < len(pending):
+            codes.add(generate_invite_code(prefix))
+        candidates = dict(zip(codes, pending))
+        stmt = (
+            dialect_insert(db, table)
+            .values([{**rows[index], "code": code} for code, index in candidates.items()])
+            .on_conflict_do_nothing(index_elements=[table.c.code])
+            .returning(*table.c)
+        )
+        for row in db.execute(stmt):
+            allocated[candidates[row.code]] = row
+        pending = [index for index in pending if allocated[index] is None]
+        if not pending:
+            return allocated
+    raise HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Could not allocate unique invite codes, please retry"
+    )
+
+
+def get_invite_class(db: Session, class_id: int | None, current_user: User) -> Class:
+    if not class_id:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="class_id is required for student invites"
+        )
+
+    class_obj = db.query(Class).filter(Class.id == class_id).first()
+    if not class_obj or not class_obj.is_active:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Class not found"
+        )
+
+    if class_obj.teacher_id != current_user.id:
+        if current_user.role != UserRole.ORG_ADMIN or class_obj.organization_id != current_user.organization_id:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="You don't have access to this class"
+            )
+    return class_obj
+
+
+def iter_invites_csv(items: list[InviteBulkItem]):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(INVITE_CSV_COLUMNS)
+    for item in items:
+        writer.writerow([
+            item.code,
+            item.role,
+            item.recipient_email or "",
+            item.class_id or "",
+            item.max_uses or "",
+            item.expires_at.isoformat() if item.expires_at else "",
+        ])
+        if buffer.tell() >= INVITE_CSV_CHUNK_BYTES:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def create_bulk_invites(
+    db: Session,
+    payload: InviteBulkCreate,
+    format: str,
+    role: InviteRole,
+    current_user: User,
+    organization_id: int | None,
+    class_id: int | None = None,
+):
+    recipients = list(payload.recipient_emails)
+    count = len(recipients) or payload.count
+    if not count:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Provide count or recipient_emails"
+        )
+    if recipients and payload.count is not None and payload.count != len(recipients):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="count does not match the number of recipient_emails"
+        )
+    if count > INVITE_BULK_MAX:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {INVITE_BULK_MAX} invites per request"
+        )
+
+    prefix, template_key, role_label = INVITE_KINDS[role]
+    row = {
+        "role": role,
+        "created_by": current_user.id,
+        "organization_id": organization_id,
+        "class_id": class_id,
+        "max_uses": payload.max_uses,
+        "expires_at": payload.expires_at,
+        "notes": payload.notes,
+        "uses": 0,
+        "is_active": True,
+    }
+    invites = allocate_invites(db, prefix, [row] * count)
+
+    if recipients:
+        template = get_invite_template(db, template_key)
+        queue_emails(db, [
+            (recipient, *invite_email_content(template, invite, role_label))
+            for recipient, invite in zip(recipients, invites)
+        ])
+    db.commit()
+
+    items = [
+        InviteBulkItem.model_validate(
+            {**invite._mapping, "recipient_email": recipients[index] if recipients else None}
+        )
+        for index, invite in enumerate(invites)
+    ]
+    if format == "csv":
+        return StreamingResponse(
+            iter_invites_csv(items),
+            media_type="text/csv",
+            headers={
+                "Content-Disposition": f'attachment; filename="{role.value}-invites-{datetime.utcnow():%Y%m%d%H%M%S}.csv"'
+            },
+        )
+    return items
+
+
 def verify_admin_access(current_user: User):
     if current_user.role not in [UserRole.ORG_ADMIN, UserRole.PLATFORM_ADMIN]:
         raise HTTPException(
@@ -54,7 +234,7 @@ def verify_teacher_access(current_user: User):
 
 
 @router.post("/teachers", response_model=InviteResponse)
-async def create_teacher_invite(
+def create_teacher_invite(
     invite_data: InviteCreate,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
@@ -76,53 +256,21 @@ async def create_teacher_invite(
     )
 
     db.add(invite)
+    if invite_data.recipient_email:
+        queue_invite_email(db, invite, invite_data.recipient_email, "invite_teacher", "Teacher")
     db.commit()
     db.refresh(invite)
-
-    if invite_data.recipient_email:
-        template = db.query(EmailTemplate).filter(
-            EmailTemplate.key == "invite_teacher",
-            EmailTemplate.is_active == True
-        ).first()
-        if template:
-            subject, body = build_template_email(template, {
-                "invite_code": invite.code,
-                "role": "Teacher",
-                "expires_at": invite.expires_at or "No expiry"
-            })
-        else:
-            subject, body = build_invite_email(invite, "Teacher")
-        send_email(invite_data.recipient_email, subject, body)
     return invite
 
 
 @router.post("/students", response_model=InviteResponse)
-async def create_student_invite(
+def create_student_invite(
     invite_data: InviteCreate,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     verify_teacher_access(current_user)
-
-    if not invite_data.class_id:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="class_id is required for student invites"
-        )
-
-    class_obj = db.query(Class).filter(Class.id == invite_data.class_id).first()
-    if not class_obj or not class_obj.is_active:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Class not found"
-        )
-
-    if class_obj.teacher_id != current_user.id:
-        if current_user.role != UserRole.ORG_ADMIN or class_obj.organization_id != current_user.organization_id:
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="You don't have access to this class"
-            )
+    class_obj = get_invite_class(db, invite_data.class_id, current_user)
 
     code = generate_invite_code("STD")
     while db.query(InviteCode).filter(InviteCode.code == code).first():
@@ -140,28 +288,48 @@ async def create_student_invite(
     )
 
     db.add(invite)
+    if invite_data.recipient_email:
+        queue_invite_email(db, invite, invite_data.recipient_email, "invite_student", "Student")
     db.commit()
     db.refresh(invite)
-
-    if invite_data.recipient_email:
-        template = db.query(EmailTemplate).filter(
-            EmailTemplate.key == "invite_student",
-            EmailTemplate.is_active == True
-        ).first()
-        if template:
-            subject, body = build_template_email(template, {
-                "invite_code": invite.code,
-                "role": "Student",
-                "expires_at": invite.expires_at or "No expiry"
-            })
-        else:
-            subject, body = build_invite_email(invite, "Student")
-        send_email(invite_data.recipient_email, subject, body)
     return invite
 
 
+@router.post("/teachers/bulk", response_model=list[InviteBulkItem])
+def create_teacher_invites_bulk(
+    payload: InviteBulkCreate,
+    format: str = Query(default="json", pattern="^(json|csv)$"),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Create many teacher invites at once, one per recipient when
+    ``recipient_emails`` is given (each gets an email) or ``count``
+    unaddressed codes otherwise. ``format=csv`` returns a CSV download.
+    """
+    verify_admin_access(current_user)
+    return create_bulk_invites(
+        db, payload, format, InviteRole.TEACHER, current_user, current_user.organization_id
+    )
+
+
+@router.post("/students/bulk", response_model=list[InviteBulkItem])
+def create_student_invites_bulk(
+    payload: InviteBulkCreate,
+    format: str = Query(default="json", pattern="^(json|csv)$"),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Student counterpart of ``/teachers/bulk``; ``class_id`` is required."""
+    verify_teacher_access(current_user)
+    class_obj = get_invite_class(db, payload.class_id, current_user)
+    return create_bulk_invites(
+        db, payload, format, InviteRole.STUDENT, current_user, class_obj.organization_id, class_obj.id
+    )
+
+
 @router.get("/mine", response_model=list[InviteResponse])
-async def get_my_invites(
+def get_my_invites(
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
@@ -178,7 +346,7 @@ async def get_my_invites(
 
 
 @router.post("/{invite_id}/toggle", response_model=InviteResponse)
-async def toggle_invite(
+def toggle_invite(
     invite_id: int,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
@@ -200,7 +368,7 @@ async def toggle_invite(
 
 
 @router.delete("/{invite_id}")
-async def delete_invite(
+def delete_invite(
     invite_id: int,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
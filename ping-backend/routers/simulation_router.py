@@ -9,7 +9,7 @@ router = APIRouter(prefix="/api/simulations", tags=["simulations"])
 
 
 @router.get("", response_model=list[ModuleResponse])
-async def list_simulations(subject: str | None = None, db: Session = Depends(get_db)):
+def list_simulations(subject: str | None = None, db: Session = Depends(get_db)):
     query = db.query(Module).filter(Module.is_published == True)
     if subject and subject != "all":
         query = query.filter(Module.subject == subject)
@@ -17,7 +17,7 @@ async def list_simulations(subject: str | None = None, db: Session = Depends(get
 
 
 @router.get("/{module_id}", response_model=ModuleResponse)
-async def get_simulation(module_id: str, db: Session = Depends(get_db)):
+def get_simulation(module_id: str, db: Session = Depends(get_db)):
     module = db.query(Module).filter(Module.module_id == module_id).first()
     if not module:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Simulation not found")
@@ -19,7 +19,15 @@ from models import (
     SparcWordGameScore,
     SparcGameSession,
 )
-from auth import verify_password, get_password_hash, create_access_token, verify_token
+from user_cache import load_user
+from sparc_leaderboard import apply_scores, get_leaderboard, get_player_total
+from auth import (
+    verify_password,
+    verify_and_update_password,
+    get_password_hash,
+    create_access_token,
+    verify_token,
+)
 
 router = APIRouter(prefix="/api/sparc", tags=["sparc"])
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/sparc/auth/login")
@@ -78,15 +86,7 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-    user_id = payload.get("user_id")
-    email = payload.get("sub")
-    if user_id:
-        user = db.query(User).filter(User.id == user_id).first()
-    elif email:
-        user = db.query(User).filter(User.email == email).first()
-    else:
-        user = None
-
+    user = load_user(db, user_id=payload.get("user_id"), email=payload.get("sub"))
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -114,9 +114,7 @@ def map_sparc_role(user: User) -> str:
 
 def build_sparc_user(db: Session, user: User) -> dict:
     username = user.username or (user.email.split("@")[0] if user.email else "user")
-    total_score = db.query(func.coalesce(func.sum(SparcWordGameScore.score), 0)).filter(
-        SparcWordGameScore.player_name == username
-    ).scalar() or 0
+    total_score = get_player_total(db, username)
     games_played = db.query(func.count(SparcGameSession.id)).filter(
         SparcGameSession.user_id == user.id
     ).scalar() or 0
@@ -189,10 +187,17 @@ def sparc_login(payload: SparcLoginIn, db: Session = Depends(get_db)):
     user = db.query(User).filter(
         or_(User.email == payload.email, User.username == payload.email)
     ).first()
-    if not user or not verify_password(payload.password, user.hashed_password):
+    verified, new_hash = (
+        verify_and_update_password(payload.password, user.hashed_password)
+        if user else (False, None)
+    )
+    if not verified:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid credentials")
     if not user.is_active:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Account is inactive")
+    if new_hash:
+        user.hashed_password = new_hash
+        db.commit()
 
     token = create_access_token(
         data={"sub": user.email, "user_id": user.id, "role": user.role.value}
@@ -324,31 +329,7 @@ def sparc_update_profile(
 
 @router.get("/users/leaderboard")
 def sparc_leaderboard(db: Session = Depends(get_db), limit: int = 20):
-    scores = db.query(SparcWordGameScore).all()
-    stats = {}
-    for score in scores:
-        name = score.player_name
-        if name not in stats:
-            stats[name] = {
-                "playerName": name,
-                "totalScore": 0,
-                "gamesPlayed": 0,
-                "bestScore": 0,
-                "lastPlayed": None,
-            }
-        stats[name]["totalScore"] += score.score
-        stats[name]["gamesPlayed"] += 1
-        stats[name]["bestScore"] = max(stats[name]["bestScore"], score.score)
-        if score.played_at and (not stats[name]["lastPlayed"] or score.played_at > stats[name]["lastPlayed"]):
-            stats[name]["lastPlayed"] = score.played_at
-
-    leaderboard = list(stats.values())
-    leaderboard.sort(key=lambda item: item["totalScore"], reverse=True)
-    leaderboard = leaderboard[:limit]
-    for idx, entry in enumerate(leaderboard):
-        entry["rank"] = idx + 1
-        entry["avgScore"] = round(entry["totalScore"] / max(entry["gamesPlayed"], 1), 1)
-    return {"success": True, "data": leaderboard}
+    return {"success": True, "data": get_leaderboard(db, limit=limit)}
 
 
 @router.get("/users/search/{query}")
@@ -516,26 +497,7 @@ def sparc_wordgame_stats(db: Session = Depends(get_db)):
 
 @router.get("/wordgame-scores/leaderboard")
 def sparc_wordgame_leaderboard(db: Session = Depends(get_db), limit: int = 20, scene: str | None = None):
-    scores = db.query(SparcWordGameScore).all()
-    if scene and scene != "all":
-        scores = [score for score in scores if (score.scene or "Unknown") == scene]
-    stats = {}
-    for score in scores:
-        name = score.player_name
-        stats.setdefault(name, {"playerName": name, "totalScore": 0, "gamesPlayed": 0, "bestScore": 0, "lastPlayed": None})
-        stats[name]["totalScore"] += score.score
-        stats[name]["gamesPlayed"] += 1
-        stats[name]["bestScore"] = max(stats[name]["bestScore"], score.score)
-        if score.played_at and (not stats[name]["lastPlayed"] or score.played_at > stats[name]["lastPlayed"]):
-            stats[name]["lastPlayed"] = score.played_at
-
-    leaderboard = list(stats.values())
-    leaderboard.sort(key=lambda item: item["totalScore"], reverse=True)
-    leaderboard = leaderboard[:limit]
-    for idx, entry in enumerate(leaderboard):
-        entry["rank"] = idx + 1
-        entry["avgScore"] = round(entry["totalScore"] / max(entry["gamesPlayed"], 1), 1)
-    return {"success": True, "data": leaderboard}
+    return {"success": True, "data": get_leaderboard(db, scene=scene, limit=limit)}
 
 
 @router.get("/wordgame-scores/scores")
@@ -693,6 +655,7 @@ def seed_wordgame_scores(db: Session):
     except Exception:
         return
 
+    scores = []
     for record in records:
         played_at = None
         if record.get("playedAt"):
@@ -700,11 +663,13 @@ def seed_wordgame_scores(db: Session):
                 played_at = datetime.fromisoformat(record["playedAt"].replace("Z", "+00:00"))
             except ValueError:
                 played_at = None
-        db.add(SparcWordGameScore(
+        scores.append(SparcWordGameScore(
             player_name=record.get("playerName") or "Unknown",
             score=record.get("score") or 0,
             scene=record.get("scene"),
             played_at=played_at,
             original_id=record.get("originalId"),
         ))
+    db.add_all(scores)
+    apply_scores(db, scores)
     db.commit()
@@ -9,7 +9,7 @@ router = APIRouter(prefix="/api/subjects", tags=["subjects"])
 
 
 @router.get("", response_model=list[SubjectPublic])
-async def list_subjects(db: Session = Depends(get_db)):
+def list_subjects(db: Session = Depends(get_db)):
     return (
         db.query(Subject)
         .filter(Subject.is_active == True)
@@ -1,23 +1,44 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Body
+from fastapi import APIRouter, Depends, HTTPException, status, Body, Query
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
+from sqlalchemy import insert
 from typing import List, Optional
-from datetime import datetime, timedelta
-import os
-import re
-from pathlib import Path
+from datetime import datetime, timedelta, timezone
 import json
+import logging
 import uuid
 import hashlib
+
 import zstandard as zstd
 
-from database import get_db
-from models import User, BehaviorData, UserRole, UserModuleCompletion
+from database import AdminSessionLocal, get_db, get_ingest_db
+from models import (
+    User,
+    BehaviorData,
+    UserRole,
+    UserModuleCompletion,
+    TelemetrySession,
+    DataDeletionJob,
+)
 from schemas import TelemetrySessionCreate, TelemetryEventCreate, TelemetryEventBatch
 from routers.auth_router import get_current_user, get_optional_user
+from streaming_zip import ZipMember, file_member, stream_zip
+from telemetry_files import (
+    TELEMETRY_ZSTD_LEVEL,
+    get_file_dictionary_id,
+    get_session_file_path,
+    module_dictionaries,
+    sanitize_segment,
+    session_writers,
+)
+from telemetry_deletion import owner_filter, request_deletion, serialize_job
+from telemetry_ingest import IngestBatch, IngestQueueFull, TelemetryIngestQueue
+from telemetry_sessions import apply_event_rows, get_session_summaries, record_file_sizes
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/api/telemetry", tags=["telemetry"])
 
-TELEMETRY_DATA_DIR = os.getenv("TELEMETRY_DATA_DIR", "/mnt/data/pingdata/telemetry")
 COMPLETION_EVENT_TYPES = {
     "objective_complete",
     "module_complete",
@@ -29,17 +50,6 @@ COMPLETION_EVENT_TYPES = {
 }
 
 
-def sanitize_segment(value: str) -> str:
-    safe = re.sub(r"[^A-Za-z0-9._-]+", "_", value or "").strip("_")
-    return safe or "unknown"
-
-
-def get_session_file_path(module_id: str, session_id: str) -> Path:
-    safe_module = sanitize_segment(module_id)
-    safe_session = sanitize_segment(session_id)
-    return Path(TELEMETRY_DATA_DIR) / safe_module / f"{safe_session}.jsonl.zst"
-
-
 def summarize_payload(event_type: str, payload: dict) -> dict:
     if event_type == "text_input":
         value = payload.get("value", "")
@@ -77,23 +87,20 @@ def is_completion_event(event_type: str, payload: dict) -> bool:
 def write_events_to_file(
     module_id: str, session_id: str, anonymized_id: str, events: list[dict]
 ) -> None:
-    file_path = get_session_file_path(module_id, session_id)
-    file_path.parent.mkdir(parents=True, exist_ok=True)
-    compressor = zstd.ZstdCompressor()
-    with open(file_path, "ab") as f:
-        with compressor.stream_writer(f) as writer:
-            for event in events:
-                record = {
-                    "session_id": session_id,
-                    "module_id": module_id,
-                    "event_type": event.get("event_type"),
-                    "timestamp": event.get("timestamp"),
-                    "client_timestamp": event.get("client_timestamp"),
-                    "anon_id": anonymized_id,
-                    "payload": event.get("payload"),
-                }
-                line = json.dumps(record, ensure_ascii=False) + "\n"
-                writer.write(line.encode("utf-8"))
+    lines = []
+    for event in events:
+        record = {
+            "session_id": session_id,
+            "module_id": module_id,
+            "event_type": event.get("event_type"),
+            "timestamp": event.get("timestamp"),
+            "client_timestamp": event.get("client_timestamp"),
+            "anon_id": anonymized_id,
+            "payload": event.get("payload"),
+        }
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        lines.append(line.encode("utf-8"))
+    session_writers.write(module_id, session_id, lines)
 
 
 # Helper function to anonymize user data
@@ -107,7 +114,7 @@ def anonymize_user_id(user_id: Optional[int], guest_id: Optional[str]) -> str:
 
 
 @router.post("/session/start")
-async def start_telemetry_session(
+def start_telemetry_session(
     session_data: dict = Body(default_factory=dict),
     current_user: User | None = Depends(get_optional_user),
     db: Session = Depends(get_db),
@@ -158,15 +165,78 @@ async def start_telemetry_session(
     }
 
 
+def store_event_batches(db: Session, batches: list[IngestBatch]) -> None:
+    """
+    Persist queued telemetry batches with one multi-row insert and one commit,
+    then append the events to the per-session files.
+    """
+    rows = [row for batch in batches for row in batch.rows]
+    if rows:
+        db.execute(insert(BehaviorData), rows)
+        apply_event_rows(db, rows)
+
+    completions = {}
+    for batch in batches:
+        if not batch.user_id:
+            continue
+        for module_id in batch.completed_modules:
+            completions[(batch.user_id, module_id)] = (
+                batch.session_id,
+                batch.received_at,
+            )
+
+    if completions:
+        user_ids = {user_id for user_id, _ in completions}
+        module_ids = {module_id for _, module_id in completions}
+        existing_rows = (
+            db.query(UserModuleCompletion)
+            .filter(
+                UserModuleCompletion.user_id.in_(user_ids),
+                UserModuleCompletion.module_id.in_(module_ids),
+            )
+            .all()
+        )
+        existing_map = {(row.user_id, row.module_id): row for row in existing_rows}
+
+        for (user_id, module_id), (session_id, completed_at) in completions.items():
+            row = existing_map.get((user_id, module_id))
+            if row:
+                row.completed_at = completed_at
+                row.last_session_id = session_id
+            else:
+                db.add(
+                    UserModuleCompletion(
+                        user_id=user_id,
+                        module_id=module_id,
+                        completed_at=completed_at,
+                        last_session_id=session_id,
+                    )
+                )
+
+    db.commit()
+
+    for batch in batches:
+        for (module_id, sess_id), events in batch.file_events.items():
+            try:
+                write_events_to_file(module_id, sess_id, batch.anonymized_id, events)
+            except Exception:
+                pass
+
+
+ingest_queue = TelemetryIngestQueue(store_event_batches)
+
+
 @router.post("/events")
-async def upload_telemetry_events(
+def upload_telemetry_events(
     batch: TelemetryEventBatch,
     current_user: User | None = Depends(get_optional_user),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_ingest_db),
 ):
     """
     Upload a batch of telemetry events
-    Events are anonymized and stored in behavior_data table
+    Events are anonymized and stored in behavior_data table.
+    In async ingest mode the batch is queued for the background writer and
+    a full queue is reported as 503 so clients back off and retry.
     """
 
     # Verify session belongs to current user
@@ -181,10 +251,6 @@ async def upload_telemetry_events(
     else:
         anonymized_id = anonymize_user_id(None, None)
 
-    # Process each event
-    saved_events = []
-    file_events_by_key = {}
-    completed_modules = set()
     user_id = None
     guest_id = None
     if current_user:
@@ -193,6 +259,15 @@ async def upload_telemetry_events(
             current_user.guest_id if current_user.role == UserRole.GUEST else None
         )
 
+    ingest_batch = IngestBatch(
+        session_id=session_id,
+        anonymized_id=anonymized_id,
+        user_id=user_id,
+        guest_id=guest_id,
+        received_at=datetime.now(timezone.utc),
+    )
+
+    # Process each event
     for event in batch.events:
         # Validate event data (K-12 compliance check)
         if not validate_event_compliance(event):
@@ -201,23 +276,23 @@ async def upload_telemetry_events(
         # Create behavior data record
         payload_data = dict(event.payload)
         payload_data["anon_id"] = anonymized_id
-        behavior_record = BehaviorData(
-            user_id=user_id,
-            guest_session_id=guest_id,
-            module_id=event.module_id,
-            session_id=session_id,
-            event_type=event.event_type,
-            event_data=json.dumps(payload_data),
+        ingest_batch.rows.append(
+            {
+                "user_id": user_id,
+                "guest_session_id": guest_id,
+                "module_id": event.module_id,
+                "session_id": session_id,
+                "event_type": event.event_type,
+                "event_data": json.dumps(payload_data),
+                "timestamp": ingest_batch.received_at,
+            }
         )
 
-        db.add(behavior_record)
-        saved_events.append(behavior_record)
-
         if user_id and is_completion_event(event.event_type, payload_data):
-            completed_modules.add(event.module_id)
+            ingest_batch.completed_modules.add(event.module_id)
 
         file_key = (event.module_id, session_id)
-        file_events_by_key.setdefault(file_key, []).append(
+        ingest_batch.file_events.setdefault(file_key, []).append(
             {
                 "event_type": event.event_type,
                 "payload": dict(event.payload),
@@ -226,51 +301,32 @@ async def upload_telemetry_events(
             }
         )
 
-    if user_id and completed_modules:
-        existing_rows = (
-            db.query(UserModuleCompletion)
-            .filter(
-                UserModuleCompletion.user_id == user_id,
-                UserModuleCompletion.module_id.in_(list(completed_modules)),
-            )
-            .all()
-        )
-        existing_map = {row.module_id: row for row in existing_rows}
-
-        now = datetime.utcnow()
-        for module_id in completed_modules:
-            row = existing_map.get(module_id)
-            if row:
-                row.completed_at = now
-                row.last_session_id = session_id
-            else:
-                db.add(
-                    UserModuleCompletion(
-                        user_id=user_id,
-                        module_id=module_id,
-                        completed_at=now,
-                        last_session_id=session_id,
-                    )
+    queued = False
+    if ingest_batch.rows:
+        if ingest_queue.running:
+            try:
+                ingest_queue.submit(ingest_batch)
+            except IngestQueueFull:
+                raise HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail="Telemetry ingest is busy, retry later",
+                    headers={"Retry-After": "1"},
                 )
-
-    db.commit()
-
-    for (module_id, sess_id), events in file_events_by_key.items():
-        try:
-            write_events_to_file(module_id, sess_id, anonymized_id, events)
-        except Exception:
-            pass
+            queued = True
+        else:
+            store_event_batches(db, [ingest_batch])
 
     return {
         "success": True,
         "events_received": len(batch.events),
-        "events_saved": len(saved_events),
+        "events_saved": len(ingest_batch.rows),
         "session_id": session_id,
+        "queued": queued,
     }
 
 
 @router.post("/session/end")
-async def end_telemetry_session(
+def end_telemetry_session(
     session_id: str,
     current_user: User | None = Depends(get_optional_user),
     db: Session = Depends(get_db),
@@ -279,21 +335,28 @@ async def end_telemetry_session(
     End telemetry session and finalize data
     """
 
-    # Count events for this session
-    event_count = (
-        db.query(BehaviorData).filter(BehaviorData.session_id == session_id).count()
-    )
+    # Uploads of this session may still sit in the ingest queue; let them land
+    # so the file and the summary include the final events.
+    if not ingest_queue.wait_for_session(session_id):
+        logger.warning("Ending telemetry session %s with uploads still queued", session_id)
+
+    # Close the session file's zstd frame now instead of waiting for eviction
+    session_writers.close_session(session_id)
+
+    summaries = get_session_summaries(db, session_id)
+    if summaries:
+        record_file_sizes(db, summaries)
 
     return {
         "success": True,
         "session_id": session_id,
-        "total_events": event_count,
+        "total_events": sum(summary.event_count for summary in summaries),
         "ended_at": datetime.utcnow().isoformat(),
     }
 
 
 @router.get("/session/{session_id}/stats")
-async def get_session_stats(
+def get_session_stats(
     session_id: str,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db),
@@ -302,35 +365,36 @@ async def get_session_stats(
     Get statistics for a telemetry session
     """
 
-    # Verify user owns this session
-    events = db.query(BehaviorData).filter(BehaviorData.session_id == session_id).all()
+    summaries = get_session_summaries(db, session_id)
 
-    if not events:
+    if not summaries:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Session not found"
         )
 
     # Check ownership
-    first_event = events[0]
+    first_summary = summaries[0]
     if current_user.role == UserRole.GUEST:
-        if first_event.guest_session_id != current_user.guest_id:
+        if first_summary.guest_session_id != current_user.guest_id:
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN)
     else:
-        if first_event.user_id != current_user.id:
+        if first_summary.user_id != current_user.id:
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN)
 
-    # Calculate stats
     event_types = {}
-    for event in events:
-        event_type = event.event_type
-        event_types[event_type] = event_types.get(event_type, 0) + 1
+    for summary in summaries:
+        for event_type, count in (summary.event_type_counts or {}).items():
+            event_types[event_type] = event_types.get(event_type, 0) + count
+
+    start_time = min((s.started_at for s in summaries if s.started_at), default=None)
+    end_time = max((s.ended_at for s in summaries if s.ended_at), default=None)
 
     return {
         "session_id": session_id,
-        "total_events": len(events),
+        "total_events": sum(summary.event_count for summary in summaries),
         "event_types": event_types,
-        "start_time": events[0].timestamp.isoformat() if events else None,
-        "end_time": events[-1].timestamp.isoformat() if events else None,
+        "start_time": start_time.isoformat() if start_time else None,
+        "end_time": end_time.isoformat() if end_time else None,
     }
 
 
@@ -382,80 +446,217 @@ def validate_event_compliance(event: TelemetryEventCreate) -> bool:
     return True
 
 
-@router.delete("/user/data")
-async def delete_user_telemetry_data(
+@router.delete("/user/data", status_code=status.HTTP_202_ACCEPTED)
+def delete_user_telemetry_data(
     current_user: User = Depends(get_current_user), db: Session = Depends(get_db)
 ):
     """
     Delete all telemetry data for current user
     Implements "Right to be Forgotten" (GDPR/COPPA)
+    Erasure runs as a background job that removes rows in batches along with
+    the session files; poll the returned status URL for progress.
     """
 
     if current_user.role == UserRole.GUEST:
-        # Delete guest data
-        deleted = (
-            db.query(BehaviorData)
-            .filter(BehaviorData.guest_session_id == current_user.guest_id)
-            .delete()
-        )
+        job = request_deletion(db, None, current_user.guest_id)
     else:
-        # Delete user data
-        deleted = (
-            db.query(BehaviorData)
-            .filter(BehaviorData.user_id == current_user.id)
-            .delete()
+        job = request_deletion(db, current_user.id, None)
+
+    return {
+        "success": True,
+        **serialize_job(job),
+        "status_url": f"/api/telemetry/user/data/deletions/{job.id}",
+    }
+
+
+@router.get("/user/data/deletions/{job_id}")
+def get_deletion_status(
+    job_id: int,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    """
+    Progress of a telemetry deletion job requested by the current user
+    """
+    job = db.get(DataDeletionJob, job_id)
+    if current_user.role == UserRole.PLATFORM_ADMIN:
+        owns = job is not None
+    elif current_user.role == UserRole.GUEST:
+        owns = job is not None and job.guest_session_id == current_user.guest_id
+    else:
+        owns = job is not None and job.user_id == current_user.id
+    if not owns:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Deletion job not found"
         )
+    return serialize_job(job)
 
-    db.commit()
 
-    for (module_id, sess_id), events in file_events_by_key.items():
-        try:
-            write_events_to_file(module_id, sess_id, anonymized_id, events)
-        except Exception:
-            pass
+EXPORT_BATCH_ROWS = 1000
+EXPORT_CHUNK_BYTES = 64 * 1024
+EXPORT_MEDIA_TYPES = {
+    "json": "application/json",
+    "ndjson": "application/x-ndjson",
+    "zstd": "application/zstd",
+}
 
-    return {"success": True, "records_deleted": deleted}
+
+def iter_export_records(user_id: Optional[int], guest_id: Optional[str]):
+    """
+    Yield the owner's events as plain dicts, oldest first, in server-side
+    cursor batches. Opens its own session because the request's session is
+    closed before a streamed body is sent.
+    """
+    db = AdminSessionLocal()
+    try:
+        query = (
+            db.query(
+                BehaviorData.session_id,
+                BehaviorData.module_id,
+                BehaviorData.event_type,
+                BehaviorData.event_data,
+                BehaviorData.timestamp,
+            )
+            .filter(owner_filter(BehaviorData, user_id, guest_id))
+            .order_by(BehaviorData.id)
+        )
+        for row in query.yield_per(EXPORT_BATCH_ROWS):
+            yield {
+                "session_id": row.session_id,
+                "module_id": row.module_id,
+                "event_type": row.event_type,
+                "event_data": row.event_data,
+                "timestamp": row.timestamp.isoformat() if row.timestamp else None,
+            }
+    finally:
+        db.close()
+
+
+def iter_chunked(pieces):
+    """Coalesce small byte strings into chunks of roughly EXPORT_CHUNK_BYTES."""
+    buffer, size = [], 0
+    for piece in pieces:
+        buffer.append(piece)
+        size += len(piece)
+        if size >= EXPORT_CHUNK_BYTES:
+            yield b"".join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield b"".join(buffer)
+
+
+def iter_ndjson(records):
+    for record in records:
+        yield (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+
+
+def iter_json_document(header: dict, records):
+    """Stream ``{...header, "events": [...], "total_events": n}`` without holding the list."""
+    opening = json.dumps(header, ensure_ascii=False)[:-1]
+    yield (opening + (", " if header else "") + '"events": [').encode("utf-8")
+    total = 0
+    for record in records:
+        prefix = ", " if total else ""
+        yield (prefix + json.dumps(record, ensure_ascii=False)).encode("utf-8")
+        total += 1
+    yield f'], "total_events": {total}}}'.encode("utf-8")
+
+
+def iter_zstd(chunks):
+    compressor = zstd.ZstdCompressor(level=TELEMETRY_ZSTD_LEVEL).compressobj()
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def export_events_body(
+    format: str, user_id: Optional[int], guest_id: Optional[str], stamp: datetime
+):
+    """The exported events in ``format``; returns ``(chunks, file extension)``."""
+    records = iter_export_records(user_id, guest_id)
+    if format == "json":
+        header = {
+            "user_id": user_id,
+            "guest_id": guest_id,
+            "export_date": stamp.isoformat(),
+        }
+        return iter_chunked(iter_json_document(header, records)), ".json"
+    body = iter_chunked(iter_ndjson(records))
+    if format == "zstd":
+        return iter_zstd(body), ".ndjson.zst"
+    return body, ".ndjson"
+
+
+def iter_export_members(
+    format: str, user_id: Optional[int], guest_id: Optional[str], stamp: datetime
+):
+    """Zip members: the events in ``format``, then the raw session files and their dictionaries."""
+    body, extension = export_events_body(format, user_id, guest_id, stamp)
+    yield ZipMember(f"events{extension}", body)
+
+    db = AdminSessionLocal()
+    try:
+        sessions = (
+            db.query(TelemetrySession.module_id, TelemetrySession.session_id)
+            .filter(owner_filter(TelemetrySession, user_id, guest_id))
+            .order_by(TelemetrySession.id)
+            .all()
+        )
+    finally:
+        db.close()
+
+    dictionaries = set()
+    for module_id, sess_id in sessions:
+        file_path = get_session_file_path(module_id, sess_id)
+        member = file_member(file_path, f"sessions/{sanitize_segment(module_id)}/{file_path.name}")
+        if member is None:
+            continue
+        dict_id = get_file_dictionary_id(file_path)
+        if dict_id:
+            dictionaries.add((module_id, dict_id))
+        yield member
+
+    for module_id, dict_id in sorted(dictionaries):
+        for item in module_dictionaries.list_versions(module_id):
+            if item["dict_id"] == dict_id:
+                arcname = f"sessions/{sanitize_segment(module_id)}/_dict/{item['path'].name}"
+                yield file_member(item["path"], arcname)
 
 
 @router.get("/user/export")
-async def export_user_telemetry_data(
-    current_user: User = Depends(get_current_user), db: Session = Depends(get_db)
+def export_user_telemetry_data(
+    format: str = Query(default="json", pattern="^(json|ndjson|zstd)$"),
+    include_files: bool = Query(default=False),
+    current_user: User = Depends(get_current_user),
 ):
     """
     Export all telemetry data for current user
     Implements "Right to Data Portability" (GDPR)
+    The body is streamed in cursor batches so memory stays flat however
+    long the history is. ``format`` is a JSON document (default), NDJSON or
+    zstd-compressed NDJSON; ``include_files`` returns a zip with the events
+    in that format plus the raw ``.jsonl.zst`` session files.
     """
 
-    if current_user.role == UserRole.GUEST:
-        events = (
-            db.query(BehaviorData)
-            .filter(BehaviorData.guest_session_id == current_user.guest_id)
-            .all()
-        )
-    else:
-        events = (
-            db.query(BehaviorData).filter(BehaviorData.user_id == current_user.id).all()
-        )
-
-    # Convert to exportable format
-    export_data = []
-    for event in events:
-        export_data.append(
-            {
-                "session_id": event.session_id,
-                "module_id": event.module_id,
-                "event_type": event.event_type,
-                "event_data": event.event_data,
-                "timestamp": event.timestamp.isoformat(),
-            }
+    is_guest = current_user.role == UserRole.GUEST
+    user_id = None if is_guest else current_user.id
+    guest_id = current_user.guest_id if is_guest else None
+    stamp = datetime.utcnow()
+    basename = f"telemetry-export-{stamp:%Y%m%d%H%M%S}"
+
+    if include_files:
+        return StreamingResponse(
+            stream_zip(iter_export_members(format, user_id, guest_id, stamp)),
+            media_type="application/zip",
+            headers={"Content-Disposition": f'attachment; filename="{basename}.zip"'},
         )
 
-    return {
-        "user_id": current_user.id if current_user.role != UserRole.GUEST else None,
-        "guest_id": current_user.guest_id
-        if current_user.role == UserRole.GUEST
-        else None,
-        "export_date": datetime.utcnow().isoformat(),
-        "total_events": len(export_data),
-        "events": export_data,
-    }
+    body, extension = export_events_body(format, user_id, guest_id, stamp)
+    filename = f"{basename}{extension}"
+    return StreamingResponse(
+        body,
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
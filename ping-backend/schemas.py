@@ -275,6 +275,20 @@ class InviteResponse(BaseModel):
         from_attributes = True
 
 
+class InviteBulkCreate(BaseModel):
+    # Either a number of unaddressed codes or one code per recipient
+    count: Optional[int] = Field(default=None, ge=1)
+    recipient_emails: List[EmailStr] = Field(default_factory=list)
+    expires_at: Optional[datetime] = None
+    max_uses: Optional[int] = None
+    class_id: Optional[int] = None
+    notes: Optional[str] = None
+
+
+class InviteBulkItem(InviteResponse):
+    recipient_email: Optional[str] = None
+
+
 class UserUpdate(BaseModel):
     full_name: Optional[str] = None
     school: Optional[str] = None
@@ -464,3 +478,4 @@ class DashboardOverview(BaseModel):
     trend: List[DashboardTrendPoint]
     read_replica: bool
     generated_at: datetime
+    stale: bool = False
@@ -0,0 +1,503 @@
+import hashlib
+import json
+import logging
+import os
+
+from sqlalchemy import and_, exists, func, literal, select, text, true
+from sqlalchemy.orm import Session
+
+from app_registry import DEFAULT_APPS
+from auth import get_password_hash, verify_and_update_password
+from cache_bus import cache_bus
+from database import SessionLocal, advisory_lock, dialect_insert, engine
+from models import (
+    App,
+    BehaviorData,
+    EmailTemplate,
+    Module,
+    ModuleWhitelist,
+    Organization,
+    SeedState,
+    Subject,
+    TelemetrySession,
+    User,
+    UserRole,
+)
+from module_cache import ALL_ORGS, TOPIC as WHITELIST_TOPIC
+from routers.sparc_router import seed_wordgame_scores
+from sparc_leaderboard import ensure_leaderboard
+from telemetry_partitions import TELEMETRY_PARTITIONING_ENABLED, ensure_partitioning, is_partitioned
+from telemetry_sessions import ensure_session_summaries
+
+logger = logging.getLogger(__name__)
+
+# Bump when a schema hook below changes in a way the fingerprint cannot see.
+SEED_VERSION = 1
+SEED_FORCE = os.getenv("SEED_FORCE", "false").lower() == "true"
+# Put the admin/teacher accounts back on their default passwords when seeding runs.
+SEED_RESET_DEFAULT_PASSWORDS = (
+    os.getenv("SEED_RESET_DEFAULT_PASSWORDS", "false").lower() == "true"
+)
+
+SEED_STATE_NAME = "startup"
+DEFAULT_ORG_NAME = "Default Organization"
+
+DEFAULT_SUBJECTS = [
+    {"key": "physics", "name": "Physics", "sort_order": 0},
+    {"key": "math", "name": "Math", "sort_order": 10},
+    {"key": "chemistry", "name": "Chemistry", "sort_order": 20},
+    {"key": "biology", "name": "Biology", "sort_order": 30},
+    {"key": "earth-science", "name": "Earth & Space", "sort_order": 40},
+]
+
+DEFAULT_MODULE_SUBJECT = "physics"
+DEFAULT_MODULES = [
+    {
+        "module_id": "newton1",
+        "title": "Newton's First Law",
+        "description": "Explore inertia and why objects keep moving unless a force changes them.",
+        "build_path": "/games/newton1/Build/newton1",
+        "cover_image_url": "/images/newton1-cover.png",
+    },
+    {
+        "module_id": "newton2",
+        "title": "Newton's Second Law",
+        "description": "Test how force, mass, and acceleration relate in interactive challenges.",
+        "build_path": "/games/newton2/Build/newton2",
+        "cover_image_url": "/images/newton2-cover.png",
+    },
+    {
+        "module_id": "newton3",
+        "title": "Newton's Third Law",
+        "description": "Discover action-reaction pairs through hands-on force interactions.",
+        "build_path": "/games/newton3/Build/newton3",
+        "cover_image_url": "/images/newton3-cover.png",
+    },
+    {
+        "module_id": "race-game",
+        "title": "Race Game",
+        "description": "Race through physics-driven scenarios and complete objectives.",
+        "build_path": "/games/racegame/Build/racegame",
+        "cover_image_url": "/images/racegame-cover.png",
+    },
+    {
+        "module_id": "geotech-lab1",
+        "title": "GeoTech Lab 1",
+        "description": "Complete GeoTech laboratory experiment set 1.",
+        "build_path": "/games/geotech-lab1/Build/geotech-lab1",
+        "cover_image_url": "/images/geotech-cover.png",
+    },
+    {
+        "module_id": "geotech-lab2",
+        "title": "GeoTech Lab 2",
+        "description": "Complete GeoTech laboratory experiment set 2.",
+        "build_path": "/games/geotech-lab2/Build/geotech-lab2",
+        "cover_image_url": "/images/geotech-cover.png",
+    },
+]
+
+# Superseded modules kept for their history but hidden from the catalogue.
+RETIRED_MODULES = ["forces-motion-basics", "geotech-game"]
+
+DEFAULT_EMAIL_TEMPLATES = [
+    {
+        "key": "invite_teacher",
+        "name": "Teacher Invite",
+        "subject": "Your teacher invite code",
+        "body": "You have been invited to PING.\nInvite code: {{invite_code}}\nRole: Teacher\nExpires: {{expires_at}}\n",
+    },
+    {
+        "key": "invite_student",
+        "name": "Student Invite",
+        "subject": "Your student invite code",
+        "body": "You have been invited to PING.\nInvite code: {{invite_code}}\nRole: Student\nExpires: {{expires_at}}\n",
+    },
+    {
+        "key": "welcome_user",
+        "name": "Welcome",
+        "subject": "Welcome to PING",
+        "body": "Hello {{user_name}},\nWelcome to PING. Your account is ready.",
+    },
+    {
+        "key": "password_reset",
+        "name": "Password Reset",
+        "subject": "Your PING password has been reset",
+        "body": "Hello {{user_name}},\nYour new password is: {{new_password}}\nPlease log in and change it.",
+    },
+]
+
+DEFAULT_USERS = [
+    {
+        "username": "admin",
+        "email": "admin@ping.local",
+        "full_name": "Admin",
+        "password": "admin",
+        "role": UserRole.PLATFORM_ADMIN,
+    },
+    {
+        "username": "teacher",
+        "email": "teacher@ping.local",
+        "full_name": "Teacher",
+        "password": "teacher",
+        "role": UserRole.TEACHER,
+    },
+]
+
+# Tables whose declared indexes ensure_indexes backfills on existing databases.
+INDEXED_TABLES = (BehaviorData.__table__, TelemetrySession.__table__)
+
+
+def seed_fingerprint() -> str:
+    """Hash of everything seeding depends on; a change triggers a new run."""
+    material = {
+        "version": SEED_VERSION,
+        "apps": DEFAULT_APPS,
+        "subjects": DEFAULT_SUBJECTS,
+        "modules": DEFAULT_MODULES,
+        "retired_modules": RETIRED_MODULES,
+        "email_templates": DEFAULT_EMAIL_TEMPLATES,
+        "users": [{**user, "role": user["role"].value} for user in DEFAULT_USERS],
+        "reset_passwords": SEED_RESET_DEFAULT_PASSWORDS,
+        "partitioning": TELEMETRY_PARTITIONING_ENABLED,
+        "indexes": sorted(
+            index.name for table in INDEXED_TABLES for index in table.indexes
+        ),
+    }
+    encoded = json.dumps(material, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()
+
+
+def seed_is_current(fingerprint: str) -> bool:
+    if SEED_FORCE:
+        return False
+    db = SessionLocal()
+    try:
+        stored = (
+            db.query(SeedState.fingerprint)
+            .filter(SeedState.name == SEED_STATE_NAME)
+            .scalar()
+        )
+    finally:
+        db.close()
+    return stored == fingerprint
+
+
+def record_seed(db: Session, fingerprint: str) -> None:
+    table = SeedState.__table__
+    stmt = dialect_insert(db, table).values(name=SEED_STATE_NAME, fingerprint=fingerprint)
+    db.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[table.c.name],
+            set_={"fingerprint": stmt.excluded.fingerprint, "applied_at": func.now()},
+        )
+    )
+
+
+def run_startup_seed() -> bool:
+    """
+    Bring schema and reference data up to date. Every worker calls this at
+    startup; when the stored fingerprint already matches it costs one
+    SELECT, otherwise one worker does the work under an advisory lock
+    while the others wait and then find it done. Returns True if it ran.
+    """
+    fingerprint = seed_fingerprint()
+    if seed_is_current(fingerprint):
+        return False
+
+    with advisory_lock("startup:seed", wait=True):
+        if seed_is_current(fingerprint):
+            return False
+
+        ensure_schema_updates()
+        ensure_partitioning()
+        ensure_indexes()
+
+        db = SessionLocal()
+        try:
+            seed_reference_data(db)
+            db.commit()
+            # Seeding writes through Core, which the ORM flush hooks don't see.
+            cache_bus.publish(WHITELIST_TOPIC, ALL_ORGS)
+
+            seed_wordgame_scores(db)
+            ensure_leaderboard(db)
+            ensure_session_summaries(db)
+
+            record_seed(db, fingerprint)
+            db.commit()
+        finally:
+            db.close()
+    logger.info("Startup seeding applied (%s)", fingerprint[:12])
+    return True
+
+
+def seed_reference_data(db: Session) -> None:
+    """Organization, apps, subjects, modules, whitelist, templates and users in one transaction."""
+    organization_id = ensure_default_org(db)
+    insert_missing(db, App.__table__, "slug", DEFAULT_APPS)
+    insert_missing(
+        db, Subject.__table__, "key", [{**row, "is_active": True} for row in DEFAULT_SUBJECTS]
+    )
+    insert_missing(
+        db,
+        EmailTemplate.__table__,
+        "key",
+        [{**row, "is_active": True} for row in DEFAULT_EMAIL_TEMPLATES],
+    )
+    upsert_default_modules(db)
+    enable_default_modules(db, organization_id)
+    ensure_default_users(db, organization_id)
+
+
+def ensure_default_org(db: Session) -> int:
+    existing = db.query(Organization.id).order_by(Organization.id.asc()).first()
+    if existing:
+        return existing[0]
+
+    default_org = Organization(name=DEFAULT_ORG_NAME, domain=None, is_active=True)
+    db.add(default_org)
+    db.flush()
+    return default_org.id
+
+
+def insert_missing(db: Session, table, key: str, rows: list[dict]) -> None:
+    """Insert ``rows`` whose ``key`` is not taken yet, leaving existing rows as edited."""
+    stmt = dialect_insert(db, table).on_conflict_do_nothing(index_elements=[table.c[key]])
+    db.execute(stmt, rows)
+
+
+def upsert_default_modules(db: Session) -> None:
+    subject_id = (
+        db.query(Subject.id).filter(Subject.key == DEFAULT_MODULE_SUBJECT).scalar()
+    )
+    table = Module.__table__
+    stmt = dialect_insert(db, table)
+    excluded = stmt.excluded
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.module_id],
+        set_={
+            "title": excluded.title,
+            "description": excluded.description,
+            "subject": excluded.subject,
+            "subject_id": excluded.subject_id,
+            "build_path": excluded.build_path,
+            "cover_image_url": excluded.cover_image_url,
+            "is_published": True,
+            "version": func.coalesce(table.c.version, excluded.version),
+        },
+    )
+    db.execute(
+        stmt,
+        [
+            {
+                **item,
+                "subject": DEFAULT_MODULE_SUBJECT,
+                "subject_id": subject_id,
+                "is_published": True,
+                "version": "1.0.0",
+            }
+            for item in DEFAULT_MODULES
+        ],
+    )
+    db.execute(
+        table.update()
+        .where(table.c.module_id.in_(RETIRED_MODULES), table.c.is_published == True)
+        .values(is_published=False)
+    )
+
+
+def enable_default_modules(db: Session, organization_id: int) -> None:
+    """Whitelist the default modules for the default organization in two statements."""
+    modules = Module.__table__
+    whitelist = ModuleWhitelist.__table__
+    default_ids = select(modules.c.id).where(
+        modules.c.module_id.in_([item["module_id"] for item in DEFAULT_MODULES])
+    )
+    db.execute(
+        whitelist.update()
+        .where(
+            whitelist.c.organization_id == organization_id,
+            whitelist.c.module_id.in_(default_ids),
+            whitelist.c.is_enabled == False,
+        )
+        .values(is_enabled=True)
+    )
+    missing = select(literal(organization_id), modules.c.id, true()).where(
+        modules.c.module_id.in_([item["module_id"] for item in DEFAULT_MODULES]),
+        ~exists().where(
+            and_(
+                whitelist.c.organization_id == organization_id,
+                whitelist.c.module_id == modules.c.id,
+            )
+        ),
+    )
+    db.execute(
+        whitelist.insert().from_select(
+            ["organization_id", "module_id", "is_enabled"], missing
+        )
+    )
+
+
+def ensure_default_users(db: Session, organization_id: int) -> None:
+    """
+    Create the admin and teacher accounts, or repair their role and
+    organization. bcrypt only runs for a new account, a password that no
+    longer matches the default (when resets are on) or a hash made with an
+    outdated cost.
+    """
+    usernames = [user["username"] for user in DEFAULT_USERS]
+    existing = {
+        user.username: user
+        for user in db.query(User).filter(User.username.in_(usernames)).all()
+    }
+    for spec in DEFAULT_USERS:
+        user = existing.get(spec["username"])
+        if user is None:
+            db.add(
+                User(
+                    email=spec["email"],
+                    username=spec["username"],
+                    full_name=spec["full_name"],
+                    hashed_password=get_password_hash(spec["password"]),
+                    role=spec["role"],
+                    is_active=True,
+                    is_verified=True,
+                    organization_id=organization_id,
+                )
+            )
+            continue
+
+        if not user.organization_id:
+            user.organization_id = organization_id
+        if user.role != spec["role"]:
+            user.role = spec["role"]
+        if not user.is_active:
+            user.is_active = True
+
+        if not user.hashed_password:
+            user.hashed_password = get_password_hash(spec["password"])
+        elif SEED_RESET_DEFAULT_PASSWORDS:
+            try:
+                verified, new_hash = verify_and_update_password(
+                    spec["password"], user.hashed_password
+                )
+            except ValueError:  # not a hash passlib recognises
+                verified, new_hash = False, None
+            if not verified:
+                user.hashed_password = get_password_hash(spec["password"])
+            elif new_hash:
+                user.hashed_password = new_hash
+    db.flush()
+
+
+def ensure_schema_updates():
+    if engine.dialect.name != "postgresql":
+        return
+    with engine.connect() as conn:
+        conn.execute(
+            text("""
+            DO $$
+            BEGIN
+                IF NOT EXISTS (
+                    SELECT 1 FROM information_schema.columns
+                    WHERE table_name = 'classes' AND column_name = 'description'
+                ) THEN
+                    ALTER TABLE classes ADD COLUMN description TEXT;
+                END IF;
+                IF NOT EXISTS (
+                    SELECT 1 FROM information_schema.columns
+                    WHERE table_name = 'users' AND column_name = 'school'
+                ) THEN
+                    ALTER TABLE users ADD COLUMN school TEXT;
+                END IF;
+                IF NOT EXISTS (
+                    SELECT 1 FROM information_schema.columns
+                    WHERE table_name = 'users' AND column_name = 'course'
+                ) THEN
+                    ALTER TABLE users ADD COLUMN course TEXT;
+                END IF;
+                IF NOT EXISTS (
+                    SELECT 1 FROM information_schema.columns
+                    WHERE table_name = 'users' AND column_name = 'bio'
+                ) THEN
+                    ALTER TABLE users ADD COLUMN bio TEXT;
+                END IF;
+                IF NOT EXISTS (
+                    SELECT 1 FROM information_schema.columns
+                    WHERE table_name = 'users' AND column_name = 'avatar'
+                ) THEN
+                    ALTER TABLE users ADD COLUMN avatar TEXT;
+                END IF;
+                IF NOT EXISTS (
+                    SELECT 1 FROM information_schema.tables
+                    WHERE table_name = 'subjects'
+                ) THEN
+                    CREATE TABLE subjects (
+                        id SERIAL PRIMARY KEY,
+                        key TEXT UNIQUE NOT NULL,
+                        name TEXT NOT NULL,
+                        is_active BOOLEAN DEFAULT TRUE,
+                        sort_order INTEGER DEFAULT 0,
+                        created_at TIMESTAMPTZ DEFAULT NOW(),
+                        updated_at TIMESTAMPTZ
+                    );
+                END IF;
+                IF NOT EXISTS (
+                    SELECT 1 FROM information_schema.columns
+                    WHERE table_name = 'modules' AND column_name = 'subject_id'
+                ) THEN
+                    ALTER TABLE modules ADD COLUMN subject_id INTEGER;
+                END IF;
+                IF NOT EXISTS (
+                    SELECT 1 FROM information_schema.columns
+                    WHERE table_name = 'modules' AND column_name = 'cover_image_url'
+                ) THEN
+                    ALTER TABLE modules ADD COLUMN cover_image_url TEXT;
+                END IF;
+                IF NOT EXISTS (
+                    SELECT 1 FROM information_schema.tables
+                    WHERE table_name = 'user_module_completions'
+                ) THEN
+                    CREATE TABLE user_module_completions (
+                        id SERIAL PRIMARY KEY,
+                        user_id INTEGER NOT NULL REFERENCES users(id),
+                        module_id TEXT NOT NULL,
+                        completed_at TIMESTAMPTZ DEFAULT NOW() NOT NULL,
+                        last_session_id TEXT,
+                        CONSTRAINT uq_user_module_completions UNIQUE (user_id, module_id)
+                    );
+                    CREATE INDEX idx_user_module_completions_user_id ON user_module_completions(user_id);
+                    CREATE INDEX idx_user_module_completions_module_id ON user_module_completions(module_id);
+                END IF;
+            END $$;
+        """)
+        )
+        conn.commit()
+
+
+def ensure_indexes():
+    """
+    Create indexes declared on existing tables, which create_all skips.
+    On Postgres they are built CONCURRENTLY so a large behavior_data table
+    stays writable meanwhile.
+    """
+    with advisory_lock("schema:indexes", wait=True):
+        for table in INDEXED_TABLES:
+            for index in table.indexes:
+                if engine.dialect.name == "postgresql":
+                    columns = ", ".join(column.name for column in index.columns)
+                    with engine.connect().execution_options(
+                        isolation_level="AUTOCOMMIT"
+                    ) as conn:
+                        # CONCURRENTLY is not supported on a partitioned parent;
+                        # there the index is built per partition instead.
+                        partitioned = table is BehaviorData.__table__ and is_partitioned(conn)
+                        concurrently = "" if partitioned else "CONCURRENTLY "
+                        conn.execute(
+                            text(
+                                f"CREATE INDEX {concurrently}IF NOT EXISTS {index.name} "
+                                f"ON {table.name} ({columns})"
+                            )
+                        )
+                else:
+                    index.create(bind=engine, checkfirst=True)
@@ -0,0 +1,151 @@
+from sqlalchemy import case, func, literal, select
+from sqlalchemy.orm import Session
+
+from database import dialect_insert
+from models import SparcLeaderboardEntry, SparcWordGameScore
+
+ALL_SCENES = "__all__"
+UNKNOWN_SCENE = "Unknown"
+
+LEADERBOARD_COLUMNS = (
+    "player_name",
+    "scene",
+    "total_score",
+    "best_score",
+    "games_played",
+    "last_played",
+)
+
+
+def scene_key(scene: str | None) -> str:
+    return scene or UNKNOWN_SCENE
+
+
+def later_of(current, incoming):
+    return case(
+        (incoming.is_(None), current),
+        (current.is_(None), incoming),
+        (incoming > current, incoming),
+        else_=current,
+    )
+
+
+def apply_scores(db: Session, scores: list[SparcWordGameScore]) -> None:
+    """
+    Fold newly inserted scores into the overall and per-scene leaderboard
+    rows. Runs in the caller's transaction.
+    """
+    deltas: dict[tuple[str, str], dict] = {}
+    for score in scores:
+        value = score.score or 0
+        for key in ((score.player_name, ALL_SCENES), (score.player_name, scene_key(score.scene))):
+            delta = deltas.setdefault(
+                key,
+                {
+                    "player_name": key[0],
+                    "scene": key[1],
+                    "total_score": 0,
+                    "best_score": value,
+                    "games_played": 0,
+                    "last_played": None,
+                },
+            )
+            delta["total_score"] += value
+            delta["games_played"] += 1
+            delta["best_score"] = max(delta["best_score"], value)
+            if score.played_at and (
+                not delta["last_played"] or score.played_at > delta["last_played"]
+            ):
+                delta["last_played"] = score.played_at
+
+    if not deltas:
+        return
+
+    table = SparcLeaderboardEntry.__table__
+    stmt = dialect_insert(db, table)
+    excluded = stmt.excluded
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.player_name, table.c.scene],
+        set_={
+            "total_score": table.c.total_score + excluded.total_score,
+            "games_played": table.c.games_played + excluded.games_played,
+            "best_score": case(
+                (excluded.best_score > table.c.best_score, excluded.best_score),
+                else_=table.c.best_score,
+            ),
+            "last_played": later_of(table.c.last_played, excluded.last_played),
+            "updated_at": func.now(),
+        },
+    )
+    db.execute(stmt, list(deltas.values()))
+
+
+def aggregate_scores(scene_column):
+    return select(
+        SparcWordGameScore.player_name,
+        scene_column,
+        func.coalesce(func.sum(SparcWordGameScore.score), 0),
+        func.coalesce(func.max(SparcWordGameScore.score), 0),
+        func.count(SparcWordGameScore.id),
+        func.max(SparcWordGameScore.played_at),
+    )
+
+
+def rebuild_leaderboard(db: Session) -> None:
+    """Recompute every leaderboard row from the raw scores in two set-based inserts."""
+    table = SparcLeaderboardEntry.__table__
+    db.execute(table.delete())
+
+    overall = aggregate_scores(literal(ALL_SCENES)).group_by(SparcWordGameScore.player_name)
+    scene = func.coalesce(SparcWordGameScore.scene, UNKNOWN_SCENE)
+    per_scene = aggregate_scores(scene).group_by(SparcWordGameScore.player_name, scene)
+    for query in (overall, per_scene):
+        db.execute(table.insert().from_select(LEADERBOARD_COLUMNS, query))
+    db.commit()
+
+
+def ensure_leaderboard(db: Session) -> None:
+    """Backfill the leaderboard for databases seeded before it existed."""
+    if db.query(SparcLeaderboardEntry.id).first():
+        return
+    if not db.query(SparcWordGameScore.id).first():
+        return
+    rebuild_leaderboard(db)
+
+
+def get_leaderboard(db: Session, scene: str | None = None, limit: int = 20) -> list[dict]:
+    key = ALL_SCENES if not scene or scene == "all" else scene
+    rows = (
+        db.query(SparcLeaderboardEntry)
+        .filter(SparcLeaderboardEntry.scene == key)
+        .order_by(
+            SparcLeaderboardEntry.total_score.desc(),
+            SparcLeaderboardEntry.player_name,
+        )
+        .limit(max(limit, 0))
+        .all()
+    )
+    return [
+        {
+            "playerName": row.player_name,
+            "totalScore": row.total_score,
+            "gamesPlayed": row.games_played,
+            "bestScore": row.best_score,
+            "lastPlayed": row.last_played,
+            "rank": idx + 1,
+            "avgScore": round(row.total_score / max(row.games_played, 1), 1),
+        }
+        for idx, row in enumerate(rows)
+    ]
+
+
+def get_player_total(db: Session, player_name: str) -> int:
+    total = (
+        db.query(SparcLeaderboardEntry.total_score)
+        .filter(
+            SparcLeaderboardEntry.player_name == player_name,
+            SparcLeaderboardEntry.scene == ALL_SCENES,
+        )
+        .scalar()
+    )
+    return total or 0
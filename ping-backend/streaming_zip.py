@@ -0,0 +1,99 @@
+import io
+import time
+import zipfile
+from pathlib import Path
+from typing import Iterable, Iterator, Optional
+
+CHUNK_SIZE = 256 * 1024
+
+# Members that are already compressed are stored as-is instead of deflated again.
+STORED_SUFFIXES = (".zst", ".parquet", ".zip", ".gz")
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only, non-seekable sink that zipfile writes into while we drain it."""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks: list[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        if data:
+            self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> Iterator[bytes]:
+        if self._chunks:
+            chunks, self._chunks = self._chunks, []
+            yield b"".join(chunks)
+
+
+class ZipMember:
+    def __init__(
+        self,
+        arcname: str,
+        chunks: Iterable[bytes],
+        size: Optional[int] = None,
+        modified: Optional[float] = None,
+        compress_type: Optional[int] = None,
+    ):
+        self.arcname = arcname
+        self.chunks = chunks
+        self.size = size
+        self.modified = modified if modified is not None else time.time()
+        if compress_type is None:
+            compress_type = (
+                zipfile.ZIP_STORED
+                if arcname.endswith(STORED_SUFFIXES)
+                else zipfile.ZIP_DEFLATED
+            )
+        self.compress_type = compress_type
+
+
+def iter_file_chunks(path: Path, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    with open(path, "rb") as handle:
+        while True:
+            chunk = handle.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+
+def file_member(path: Path, arcname: str) -> Optional[ZipMember]:
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        return None
+    return ZipMember(
+        arcname, iter_file_chunks(path), size=stat.st_size, modified=stat.st_mtime
+    )
+
+
+def stream_zip(members: Iterable[Optional[ZipMember]]) -> Iterator[bytes]:
+    """
+    Yield a zip archive incrementally. Entries are written with data
+    descriptors, so nothing is buffered beyond the current chunk and the
+    central directory.
+    """
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, mode="w", allowZip64=True) as archive:
+        for member in members:
+            if member is None:
+                continue
+            info = zipfile.ZipInfo(
+                member.arcname, date_time=time.localtime(member.modified)[:6]
+            )
+            info.compress_type = member.compress_type
+            if member.size is not None:
+                info.file_size = member.size
+            with archive.open(
+                info, mode="w", force_zip64=member.size is None
+            ) as entry:
+                for chunk in member.chunks:
+                    entry.write(chunk)
+                    yield from sink.drain()
+            yield from sink.drain()
+    yield from sink.drain()
@@ -0,0 +1,391 @@
+import json
+import os
+import threading
+from contextlib import contextmanager
+from datetime import date, datetime, time as dt_time, timedelta, timezone
+from pathlib import Path
+
+from sqlalchemy import distinct, exists, or_
+from sqlalchemy.orm import Session, aliased
+
+from background_jobs import PeriodicJob, register_job
+from database import AdminSessionLocal, advisory_lock
+from models import BehaviorData, TelemetrySession
+from telemetry_files import (
+    TELEMETRY_DATA_DIR,
+    get_session_file_path,
+    iter_session_records,
+    sanitize_segment,
+)
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - optional dependency
+    pa = None
+    pc = None
+    pq = None
+
+TELEMETRY_COMPACTION_ENABLED = (
+    os.getenv("TELEMETRY_COMPACTION_ENABLED", "true").lower() == "true"
+)
+TELEMETRY_COMPACTION_INTERVAL_SECONDS = int(
+    os.getenv("TELEMETRY_COMPACTION_INTERVAL_SECONDS", "3600")
+)
+TELEMETRY_COMPACTION_LOOKBACK_DAYS = int(
+    os.getenv("TELEMETRY_COMPACTION_LOOKBACK_DAYS", "7")
+)
+TELEMETRY_COMPACTION_CLOSED_AFTER_MINUTES = int(
+    os.getenv("TELEMETRY_COMPACTION_CLOSED_AFTER_MINUTES", "120")
+)
+
+COMPACTED_DIR_NAME = "_compacted"
+MANIFEST_NAME = "manifest.json"
+PAYLOAD_COLUMNS = ("x", "y", "code")
+
+
+def compaction_available() -> bool:
+    return pa is not None
+
+
+def get_compacted_dir(module_id: str) -> Path:
+    return Path(TELEMETRY_DATA_DIR) / COMPACTED_DIR_NAME / sanitize_segment(module_id)
+
+
+_manifest_locks: dict[str, threading.Lock] = {}
+_manifest_locks_guard = threading.Lock()
+
+
+@contextmanager
+def manifest_lock(module_id: str):
+    """
+    Serialize changes to a module's compacted files and manifest between
+    threads of this process and across worker processes. Hold it around the
+    whole load/modify/save, not just the save. Not reentrant.
+    """
+    with _manifest_locks_guard:
+        lock = _manifest_locks.setdefault(module_id, threading.Lock())
+    with lock, advisory_lock(f"telemetry:manifest:{sanitize_segment(module_id)}", wait=True):
+        yield
+
+
+def load_manifest(module_id: str) -> dict:
+    path = get_compacted_dir(module_id) / MANIFEST_NAME
+    if not path.exists():
+        return {"module_id": module_id, "days": {}}
+    with open(path, "r", encoding="utf-8") as handle:
+        return json.load(handle)
+
+
+def save_manifest(module_id: str, manifest: dict) -> None:
+    directory = get_compacted_dir(module_id)
+    directory.mkdir(parents=True, exist_ok=True)
+    tmp_path = directory / f"{MANIFEST_NAME}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as handle:
+        json.dump(manifest, handle, indent=2, sort_keys=True)
+    tmp_path.replace(directory / MANIFEST_NAME)
+
+
+def get_compacted_day_path(module_id: str, day: date) -> Path | None:
+    entry = load_manifest(module_id)["days"].get(day.isoformat())
+    if not entry:
+        return None
+    path = get_compacted_dir(module_id) / entry["file"]
+    return path if path.exists() else None
+
+
+def day_bounds(day: date) -> tuple[datetime, datetime]:
+    start = datetime.combine(day, dt_time.min, tzinfo=timezone.utc)
+    return start, start + timedelta(days=1)
+
+
+def parse_epoch_ms(value) -> int | None:
+    if isinstance(value, (int, float)):
+        return int(value)
+    if not isinstance(value, str) or not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return int(parsed.timestamp() * 1000)
+
+
+def to_float(value) -> float | None:
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    return None
+
+
+def get_day_sessions(
+    db: Session, module_id: str, day: date, cutoff: datetime
+) -> tuple[list[str], int]:
+    """
+    Sessions of ``module_id`` whose first event falls on ``day``. Returns the
+    closed ones, with no event and no session end at or after ``cutoff``,
+    and how many are still open.
+    """
+    start, end = day_bounds(day)
+    earlier = aliased(BehaviorData)
+    later = aliased(BehaviorData)
+    still_open = or_(
+        exists().where(
+            later.session_id == BehaviorData.session_id,
+            later.module_id == module_id,
+            later.timestamp >= cutoff,
+        ),
+        exists().where(
+            TelemetrySession.session_id == BehaviorData.session_id,
+            TelemetrySession.module_id == module_id,
+            TelemetrySession.ended_at >= cutoff,
+        ),
+    )
+    rows = (
+        db.query(BehaviorData.session_id, still_open)
+        .filter(
+            BehaviorData.module_id == module_id,
+            BehaviorData.timestamp >= start,
+            BehaviorData.timestamp < end,
+            ~exists().where(
+                earlier.session_id == BehaviorData.session_id,
+                earlier.module_id == module_id,
+                earlier.timestamp < start,
+            ),
+        )
+        .distinct()
+        .all()
+    )
+    closed = sorted(session_id for session_id, is_open in rows if not is_open)
+    return closed, sum(1 for _, is_open in rows if is_open)
+
+
+def get_compaction_cutoff(now: datetime | None = None) -> datetime:
+    """Sessions idle since before this are considered closed."""
+    now = now or datetime.now(timezone.utc)
+    return now - timedelta(minutes=TELEMETRY_COMPACTION_CLOSED_AFTER_MINUTES)
+
+
+def build_day_table(module_id: str, session_ids: list[str]):
+    columns = {
+        "session_id": [],
+        "event_type": [],
+        "anon_id": [],
+        "timestamp": [],
+        "client_timestamp": [],
+        "x": [],
+        "y": [],
+        "code": [],
+        "payload": [],
+    }
+    for session_id in session_ids:
+        path = get_session_file_path(module_id, session_id)
+        if not path.exists():
+            continue
+        for record in iter_session_records(module_id, path):
+            payload = record.get("payload") or {}
+            if not isinstance(payload, dict):
+                payload = {"value": payload}
+            extra = {k: v for k, v in payload.items() if k not in PAYLOAD_COLUMNS}
+            code = payload.get("code")
+            columns["session_id"].append(record.get("session_id") or session_id)
+            columns["event_type"].append(record.get("event_type"))
+            columns["anon_id"].append(record.get("anon_id"))
+            columns["timestamp"].append(parse_epoch_ms(record.get("timestamp")))
+            columns["client_timestamp"].append(
+                parse_epoch_ms(record.get("client_timestamp"))
+            )
+            columns["x"].append(to_float(payload.get("x")))
+            columns["y"].append(to_float(payload.get("y")))
+            columns["code"].append(code if isinstance(code, str) else None)
+            columns["payload"].append(
+                json.dumps(extra, ensure_ascii=False) if extra else None
+            )
+
+    dictionary_string = pa.dictionary(pa.int32(), pa.string())
+    schema = pa.schema(
+        [
+            ("session_id", dictionary_string),
+            ("event_type", dictionary_string),
+            ("anon_id", dictionary_string),
+            ("timestamp", pa.int64()),
+            ("client_timestamp", pa.int64()),
+            ("x", pa.float64()),
+            ("y", pa.float64()),
+            ("code", dictionary_string),
+            ("payload", pa.string()),
+        ],
+        metadata={"module_id": module_id, "timestamp_unit": "ms"},
+    )
+    return pa.Table.from_pydict(columns, schema=schema)
+
+
+def compact_module_day(
+    db: Session,
+    module_id: str,
+    day: date,
+    cutoff: datetime | None = None,
+    force: bool = False,
+) -> dict | None:
+    """
+    Roll the closed sessions of one module/day into a single Parquet file.
+    A day that still had open sessions is marked incomplete and compacted
+    again on later runs, once those sessions have closed.
+    """
+    if not compaction_available():
+        raise RuntimeError("pyarrow is required for telemetry compaction")
+
+    cutoff = cutoff or get_compaction_cutoff()
+    with manifest_lock(module_id):
+        entry = load_manifest(module_id)["days"].get(day.isoformat())
+        if entry and entry.get("complete", True) and not force:
+            return None
+
+        session_ids, open_sessions = get_day_sessions(db, module_id, day, cutoff)
+        if not session_ids:
+            return None
+
+        table = build_day_table(module_id, session_ids)
+        directory = get_compacted_dir(module_id)
+        directory.mkdir(parents=True, exist_ok=True)
+        filename = f"{day.isoformat()}.parquet"
+        tmp_path = directory / f"{filename}.tmp"
+        pq.write_table(table, tmp_path, compression="zstd")
+        tmp_path.replace(directory / filename)
+
+        entry = {
+            "file": filename,
+            "sessions": len(session_ids),
+            "open_sessions": open_sessions,
+            "complete": open_sessions == 0,
+            "rows": table.num_rows,
+            "bytes": (directory / filename).stat().st_size,
+            "compacted_at": datetime.now(timezone.utc).isoformat(),
+        }
+        manifest = load_manifest(module_id)
+        manifest["days"][day.isoformat()] = entry
+        save_manifest(module_id, manifest)
+    return entry
+
+
+def remove_compacted_sessions(module_id: str, session_ids: set[str]) -> int:
+    """
+    Rewrite the module's compacted day files without ``session_ids``.
+    Days left empty are removed from the manifest. Returns the number of
+    files rewritten or removed.
+    """
+    if not compaction_available() or not session_ids:
+        return 0
+
+    with manifest_lock(module_id):
+        return _remove_compacted_sessions(module_id, session_ids)
+
+
+def _remove_compacted_sessions(module_id: str, session_ids: set[str]) -> int:
+    manifest = load_manifest(module_id)
+    directory = get_compacted_dir(module_id)
+    value_set = pa.array(sorted(session_ids), type=pa.string())
+    changed = 0
+    for day, entry in list(manifest["days"].items()):
+        path = directory / entry["file"]
+        if not path.exists():
+            continue
+        sessions = pq.read_table(path, columns=["session_id"]).column("session_id")
+        if not pc.any(pc.is_in(sessions.cast(pa.string()), value_set=value_set)).as_py():
+            continue
+
+        table = pq.read_table(path)
+        matches = pc.is_in(table.column("session_id").cast(pa.string()), value_set=value_set)
+        kept = table.filter(pc.invert(matches))
+        changed += 1
+        if kept.num_rows == 0:
+            path.unlink()
+            del manifest["days"][day]
+            continue
+        tmp_path = directory / f"{entry['file']}.tmp"
+        pq.write_table(kept, tmp_path, compression="zstd")
+        tmp_path.replace(path)
+        entry["rows"] = kept.num_rows
+        entry["sessions"] = len(pc.unique(kept.column("session_id").cast(pa.string())))
+        entry["bytes"] = path.stat().st_size
+    if changed:
+        save_manifest(module_id, manifest)
+    return changed
+
+
+def get_compactable_days(now: datetime | None = None) -> list[date]:
+    now = now or datetime.now(timezone.utc)
+    cutoff = get_compaction_cutoff(now)
+    days = []
+    for offset in range(TELEMETRY_COMPACTION_LOOKBACK_DAYS, 0, -1):
+        day = now.date() - timedelta(days=offset)
+        if day_bounds(day)[1] <= cutoff:
+            days.append(day)
+    return days
+
+
+def get_incomplete_days(module_id: str) -> list[date]:
+    return [
+        date.fromisoformat(day)
+        for day, entry in load_manifest(module_id)["days"].items()
+        if not entry.get("complete", True)
+    ]
+
+
+def run_compaction(
+    db: Session,
+    module_id: str | None = None,
+    days: list[date] | None = None,
+    force: bool = False,
+) -> list[dict]:
+    scheduled = not days
+    days = sorted(days) if days else get_compactable_days()
+    if not days:
+        return []
+
+    if module_id:
+        module_ids = [module_id]
+    else:
+        start, _ = day_bounds(days[0])
+        _, end = day_bounds(days[-1])
+        module_ids = [
+            row[0]
+            for row in db.query(distinct(BehaviorData.module_id))
+            .filter(BehaviorData.timestamp >= start, BehaviorData.timestamp < end)
+            .all()
+        ]
+
+    cutoff = get_compaction_cutoff()
+    results = []
+    for mod in module_ids:
+        module_days = days
+        if scheduled:
+            # Late-closing sessions of days that have left the lookback window.
+            module_days = sorted(set(days) | set(get_incomplete_days(mod)))
+        for day in module_days:
+            entry = compact_module_day(db, mod, day, cutoff=cutoff, force=force)
+            if entry:
+                results.append({"module_id": mod, "day": day.isoformat(), **entry})
+    return results
+
+
+def run_compaction_job():
+    db = AdminSessionLocal()
+    try:
+        run_compaction(db)
+    finally:
+        db.close()
+
+
+compaction_job = register_job(
+    PeriodicJob(
+        "telemetry-compaction",
+        TELEMETRY_COMPACTION_INTERVAL_SECONDS,
+        run_compaction_job,
+        enabled=TELEMETRY_COMPACTION_ENABLED and compaction_available(),
+    )
+)
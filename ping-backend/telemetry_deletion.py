@@ -0,0 +1,235 @@
+import logging
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from sqlalchemy.orm import Session
+
+from background_jobs import PeriodicJob, register_job
+from database import AdminSessionLocal
+from models import BehaviorData, DataDeletionJob, TelemetrySession
+from telemetry_compaction import remove_compacted_sessions
+from telemetry_files import get_session_file_path, session_writers
+
+logger = logging.getLogger(__name__)
+
+DATA_DELETION_BATCH_ROWS = int(os.getenv("DATA_DELETION_BATCH_ROWS", "5000"))
+DATA_DELETION_BATCH_PAUSE_MS = int(os.getenv("DATA_DELETION_BATCH_PAUSE_MS", "50"))
+DATA_DELETION_INTERVAL_SECONDS = int(os.getenv("DATA_DELETION_INTERVAL_SECONDS", "60"))
+DATA_DELETION_MAX_ATTEMPTS = int(os.getenv("DATA_DELETION_MAX_ATTEMPTS", "5"))
+# Long enough for other workers to flush queued uploads and close idle
+# session writers (TELEMETRY_WRITER_IDLE_SECONDS) before the second pass.
+DATA_DELETION_GRACE_SECONDS = int(os.getenv("DATA_DELETION_GRACE_SECONDS", "300"))
+
+PENDING = "pending"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+ACTIVE_STATUSES = (PENDING, RUNNING)
+
+
+def owner_filter(model, user_id: Optional[int], guest_id: Optional[str]):
+    if user_id is not None:
+        return model.user_id == user_id
+    if guest_id:
+        return model.guest_session_id == guest_id
+    # Never fall through to "IS NULL", which would match everyone's rows.
+    raise ValueError("A user id or guest id is required")
+
+
+def request_deletion(db: Session, user_id: Optional[int], guest_id: Optional[str]) -> DataDeletionJob:
+    """Queue erasure of an owner's telemetry, reusing a job that is already queued or running."""
+    existing = (
+        db.query(DataDeletionJob)
+        .filter(
+            owner_filter(DataDeletionJob, user_id, guest_id),
+            DataDeletionJob.status.in_(ACTIVE_STATUSES),
+        )
+        .order_by(DataDeletionJob.id.desc())
+        .first()
+    )
+    if existing:
+        return existing
+    job = DataDeletionJob(user_id=user_id, guest_session_id=guest_id, status=PENDING)
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    deletion_job.trigger()
+    return job
+
+
+def collect_sessions(db: Session, job: DataDeletionJob) -> set[tuple[str, str]]:
+    criterion_rows = owner_filter(BehaviorData, job.user_id, job.guest_session_id)
+    criterion_summaries = owner_filter(TelemetrySession, job.user_id, job.guest_session_id)
+    sessions = {
+        (module_id, session_id)
+        for module_id, session_id in db.query(BehaviorData.module_id, BehaviorData.session_id)
+        .filter(criterion_rows)
+        .distinct()
+    }
+    sessions.update(
+        db.query(TelemetrySession.module_id, TelemetrySession.session_id)
+        .filter(criterion_summaries)
+        .all()
+    )
+    return sessions
+
+
+def delete_session_files(job: DataDeletionJob, sessions: set[tuple[str, str]]) -> None:
+    by_module: dict[str, set[str]] = {}
+    for module_id, session_id in sessions:
+        # Closing flushes this worker's writer before the unlink. Writers and
+        # queued uploads in other workers can still recreate the file; the
+        # second pass after the grace period removes what they wrote.
+        session_writers.close_session(session_id, module_id)
+        path = get_session_file_path(module_id, session_id)
+        try:
+            path.unlink()
+            job.files_deleted += 1
+        except FileNotFoundError:
+            pass
+        by_module.setdefault(module_id, set()).add(session_id)
+
+    for module_id, session_ids in by_module.items():
+        job.compacted_files_rewritten += remove_compacted_sessions(module_id, session_ids)
+
+
+def delete_rows_in_batches(db: Session, job: DataDeletionJob) -> None:
+    """
+    Delete behavior_data rows a batch at a time, committing after each so
+    no single statement holds locks or builds WAL for the whole history.
+    """
+    criterion = owner_filter(BehaviorData, job.user_id, job.guest_session_id)
+    pause = DATA_DELETION_BATCH_PAUSE_MS / 1000.0
+    while True:
+        ids = [
+            row[0]
+            for row in db.query(BehaviorData.id)
+            .filter(criterion)
+            .limit(DATA_DELETION_BATCH_ROWS)
+            .all()
+        ]
+        if not ids:
+            break
+        deleted = (
+            db.query(BehaviorData)
+            .filter(BehaviorData.id.in_(ids))
+            .delete(synchronize_session=False)
+        )
+        job.rows_deleted += deleted
+        db.commit()
+        if pause:
+            time.sleep(pause)
+
+
+def erase_owner_data(db: Session, job: DataDeletionJob) -> None:
+    sessions = collect_sessions(db, job)
+    job.sessions_total = max(job.sessions_total or 0, len(sessions))
+    db.commit()
+
+    delete_session_files(job, sessions)
+    db.commit()
+
+    delete_rows_in_batches(db, job)
+
+    # Summaries go last: they are how a retried job finds the files.
+    db.query(TelemetrySession).filter(
+        owner_filter(TelemetrySession, job.user_id, job.guest_session_id)
+    ).delete(synchronize_session=False)
+
+
+def recheck_due(job: DataDeletionJob, now: datetime) -> bool:
+    recheck_after = job.recheck_after
+    if recheck_after.tzinfo is None:
+        recheck_after = recheck_after.replace(tzinfo=timezone.utc)
+    return recheck_after <= now
+
+
+def process_deletion_job(db: Session, job: DataDeletionJob) -> None:
+    """
+    Erase in two passes. Other worker processes may still hold the owner's
+    uploads in their ingest queue or buffered in a session writer, and
+    those land after the first pass; the second pass, once they have had
+    ``DATA_DELETION_GRACE_SECONDS`` to flush, removes them before the job
+    is reported complete. The job stays ``running`` in between.
+
+    ``attempts`` counts runs that did not finish a pass, plus the one in
+    progress; a successful first pass does not count, so the second pass
+    gets the full ``DATA_DELETION_MAX_ATTEMPTS``.
+    """
+    now = datetime.now(timezone.utc)
+    if job.recheck_after is not None and not recheck_due(job, now):
+        return
+
+    job.status = RUNNING
+    job.attempts += 1
+    job.error = None
+    job.started_at = job.started_at or now
+    db.commit()
+
+    try:
+        erase_owner_data(db, job)
+        if job.recheck_after is None:
+            job.recheck_after = datetime.now(timezone.utc) + timedelta(
+                seconds=DATA_DELETION_GRACE_SECONDS
+            )
+            job.attempts -= 1
+        else:
+            job.status = COMPLETED
+            job.finished_at = datetime.now(timezone.utc)
+        db.commit()
+    except Exception as exc:
+        db.rollback()
+        logger.exception("Data deletion job %s failed", job.id)
+        job = db.get(DataDeletionJob, job.id)
+        job.error = str(exc)[:2000]
+        if job.attempts >= DATA_DELETION_MAX_ATTEMPTS:
+            job.status = FAILED
+            job.finished_at = datetime.now(timezone.utc)
+        else:
+            job.status = PENDING
+        db.commit()
+
+
+def run_deletion_jobs():
+    # PeriodicJob holds an advisory lock, so "running" rows here are either
+    # waiting for their second pass or leftovers from a worker that died
+    # mid-job, and are safe to resume.
+    db = AdminSessionLocal()
+    try:
+        job_ids = [
+            row[0]
+            for row in db.query(DataDeletionJob.id)
+            .filter(DataDeletionJob.status.in_(ACTIVE_STATUSES))
+            .order_by(DataDeletionJob.id)
+            .all()
+        ]
+        for job_id in job_ids:
+            job = db.get(DataDeletionJob, job_id)
+            if job is not None and job.status in ACTIVE_STATUSES:
+                process_deletion_job(db, job)
+    finally:
+        db.close()
+
+
+def serialize_job(job: DataDeletionJob) -> dict:
+    return {
+        "job_id": job.id,
+        "status": job.status,
+        "rows_deleted": job.rows_deleted,
+        "sessions_total": job.sessions_total,
+        "files_deleted": job.files_deleted,
+        "compacted_files_rewritten": job.compacted_files_rewritten,
+        "attempts": job.attempts,
+        "error": job.error,
+        "requested_at": job.requested_at.isoformat() if job.requested_at else None,
+        "started_at": job.started_at.isoformat() if job.started_at else None,
+        "recheck_after": job.recheck_after.isoformat() if job.recheck_after else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+    }
+
+
+deletion_job = register_job(
+    PeriodicJob("telemetry-deletion", DATA_DELETION_INTERVAL_SECONDS, run_deletion_jobs)
+)
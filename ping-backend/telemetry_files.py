@@ -0,0 +1,533 @@
+import fcntl
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import zstandard as zstd
+
+from cache_bus import cache_bus
+
+logger = logging.getLogger(__name__)
+
+TELEMETRY_DATA_DIR = os.getenv("TELEMETRY_DATA_DIR", "/mnt/data/pingdata/telemetry")
+TELEMETRY_ZSTD_LEVEL = int(os.getenv("TELEMETRY_ZSTD_LEVEL", "3"))
+TELEMETRY_WRITER_MAX_OPEN = int(os.getenv("TELEMETRY_WRITER_MAX_OPEN", "256"))
+TELEMETRY_WRITER_IDLE_SECONDS = float(os.getenv("TELEMETRY_WRITER_IDLE_SECONDS", "120"))
+TELEMETRY_WRITER_FLUSH_SECONDS = float(os.getenv("TELEMETRY_WRITER_FLUSH_SECONDS", "30"))
+TELEMETRY_WRITER_FLUSH_BYTES = int(os.getenv("TELEMETRY_WRITER_FLUSH_BYTES", "262144"))
+TELEMETRY_FILE_CHECK_WORKERS = int(os.getenv("TELEMETRY_FILE_CHECK_WORKERS", "16"))
+
+TELEMETRY_DICT_SIZE = int(os.getenv("TELEMETRY_DICT_SIZE", "65536"))
+TELEMETRY_DICT_SAMPLE_FILES = int(os.getenv("TELEMETRY_DICT_SAMPLE_FILES", "500"))
+TELEMETRY_DICT_SAMPLE_BYTES = int(os.getenv("TELEMETRY_DICT_SAMPLE_BYTES", "16777216"))
+
+DICTIONARY_DIR_NAME = "_dict"
+DICTIONARY_TOPIC = "telemetry_dictionary"
+FRAME_HEADER_MAX_BYTES = 18
+
+
+def sanitize_segment(value: str) -> str:
+    safe = re.sub(r"[^A-Za-z0-9._-]+", "_", value or "").strip("_")
+    return safe or "unknown"
+
+
+def get_session_file_path(module_id: str, session_id: str) -> Path:
+    safe_module = sanitize_segment(module_id)
+    safe_session = sanitize_segment(session_id)
+    return Path(TELEMETRY_DATA_DIR) / safe_module / f"{safe_session}.jsonl.zst"
+
+
+# stat() on network storage is slow enough that a page of sessions checked
+# one by one dominates the request; the calls release the GIL.
+_file_check_executor = ThreadPoolExecutor(
+    max_workers=max(1, TELEMETRY_FILE_CHECK_WORKERS), thread_name_prefix="telemetry-stat"
+)
+
+
+def files_exist(paths: list[Path]) -> list[bool]:
+    if len(paths) <= 1:
+        return [path.exists() for path in paths]
+    return list(_file_check_executor.map(Path.exists, paths))
+
+
+def get_module_dictionary_dir(module_id: str) -> Path:
+    return Path(TELEMETRY_DATA_DIR) / sanitize_segment(module_id) / DICTIONARY_DIR_NAME
+
+
+def get_file_dictionary_id(path: Path) -> int:
+    """
+    Dictionary ID recorded in the first frame header of a session file
+    (0 = none). Files start with an empty frame written at creation, so this
+    is the dictionary every writer appends with.
+    """
+    try:
+        with open(path, "rb") as handle:
+            header = handle.read(FRAME_HEADER_MAX_BYTES)
+    except FileNotFoundError:
+        return 0
+    if not header:
+        return 0
+    try:
+        return zstd.get_frame_parameters(header).dict_id
+    except zstd.ZstdError:
+        return 0
+
+
+class ModuleDictionaries:
+    """
+    Versioned zstd dictionaries per module, stored next to the module's data
+    as ``<module>/_dict/v<version>-<dict_id>.zdict``. The newest version is
+    used for new session files; older versions stay loadable by ID so
+    existing files remain decodable.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._current: dict[str, zstd.ZstdCompressionDict | None] = {}
+        self._by_id: dict[tuple[str, int], zstd.ZstdCompressionDict] = {}
+
+    def get(self, module_id: str) -> zstd.ZstdCompressionDict | None:
+        with self._lock:
+            if module_id not in self._current:
+                versions = self.list_versions(module_id)
+                self._current[module_id] = (
+                    self._load_file(module_id, versions[-1]["path"])
+                    if versions
+                    else None
+                )
+            return self._current[module_id]
+
+    def get_by_id(self, module_id: str, dict_id: int) -> zstd.ZstdCompressionDict | None:
+        if not dict_id:
+            return None
+        with self._lock:
+            cached = self._by_id.get((module_id, dict_id))
+            if cached is not None:
+                return cached
+            for version in self.list_versions(module_id):
+                if version["dict_id"] == dict_id:
+                    return self._load_file(module_id, version["path"])
+        return None
+
+    def reload(self, module_id: str | None = None):
+        with self._lock:
+            if module_id is None:
+                self._current.clear()
+                self._by_id.clear()
+            else:
+                self._current.pop(module_id, None)
+                for key in [key for key in self._by_id if key[0] == module_id]:
+                    self._by_id.pop(key)
+
+    def list_versions(self, module_id: str) -> list[dict]:
+        dict_dir = get_module_dictionary_dir(module_id)
+        if not dict_dir.is_dir():
+            return []
+        versions = []
+        for path in sorted(dict_dir.glob("v*-*.zdict")):
+            version, _, dict_id = path.stem[1:].partition("-")
+            try:
+                versions.append(
+                    {
+                        "version": int(version),
+                        "dict_id": int(dict_id),
+                        "path": path,
+                        "size": path.stat().st_size,
+                    }
+                )
+            except ValueError:
+                continue
+        versions.sort(key=lambda item: item["version"])
+        return versions
+
+    def save(self, module_id: str, dict_data: zstd.ZstdCompressionDict) -> dict:
+        dict_dir = get_module_dictionary_dir(module_id)
+        dict_dir.mkdir(parents=True, exist_ok=True)
+        versions = self.list_versions(module_id)
+        version = versions[-1]["version"] + 1 if versions else 1
+        path = dict_dir / f"v{version:04d}-{dict_data.dict_id()}.zdict"
+        tmp_path = path.with_suffix(".tmp")
+        tmp_path.write_bytes(dict_data.as_bytes())
+        tmp_path.replace(path)
+        # Every worker caches the current version; tell them all to pick up
+        # the new one for the session files they create from now on.
+        cache_bus.publish(DICTIONARY_TOPIC, module_id)
+        return {
+            "version": version,
+            "dict_id": dict_data.dict_id(),
+            "path": path,
+            "size": path.stat().st_size,
+        }
+
+    def _load_file(self, module_id: str, path: Path) -> zstd.ZstdCompressionDict:
+        dict_data = zstd.ZstdCompressionDict(path.read_bytes())
+        self._by_id[(module_id, dict_data.dict_id())] = dict_data
+        return dict_data
+
+
+module_dictionaries = ModuleDictionaries()
+cache_bus.subscribe(DICTIONARY_TOPIC, module_dictionaries.reload, on_reset=module_dictionaries.reload)
+
+
+def create_session_file(path: Path, dict_data: zstd.ZstdCompressionDict | None) -> bool:
+    """
+    Create ``path`` holding an empty zstd frame that records ``dict_data``'s
+    ID, unless the file already exists. The file is linked into place whole,
+    so workers racing to create it agree on one dictionary. Returns whether
+    this call created it.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if dict_data is not None:
+        compressor = zstd.ZstdCompressor(level=TELEMETRY_ZSTD_LEVEL, dict_data=dict_data)
+    else:
+        compressor = zstd.ZstdCompressor(level=TELEMETRY_ZSTD_LEVEL)
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    tmp_path.write_bytes(compressor.compress(b""))
+    try:
+        os.link(tmp_path, path)
+        return True
+    except FileExistsError:
+        return False
+    finally:
+        tmp_path.unlink()
+
+
+class _SessionWriter:
+    def __init__(self, path: Path, dict_data: zstd.ZstdCompressionDict | None):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self.fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        if dict_data is not None:
+            self.compressor = zstd.ZstdCompressor(
+                level=TELEMETRY_ZSTD_LEVEL, dict_data=dict_data
+            )
+        else:
+            self.compressor = zstd.ZstdCompressor(level=TELEMETRY_ZSTD_LEVEL)
+        # Guards the compressor and the descriptor. Held while a frame is
+        # compressed and written, so it is never taken under the cache lock.
+        self.lock = threading.Lock()
+        self.buffer: list[bytes] = []
+        self.buffered_bytes = 0
+        self.pending: deque[bytes] = deque()
+        self.frames_written = 0
+        self.last_write = time.monotonic()
+        self.last_flush = self.last_write
+
+    def append(self, data: bytes):
+        self.buffer.append(data)
+        self.buffered_bytes += len(data)
+        self.last_write = time.monotonic()
+
+    def cut(self):
+        """Queue the buffered lines as the next frame; called under the cache lock."""
+        self.last_flush = time.monotonic()
+        if not self.buffer:
+            return
+        self.pending.append(b"".join(self.buffer))
+        self.buffer = []
+        self.buffered_bytes = 0
+
+    def drain(self) -> tuple[int, int]:
+        """Compress and write queued frames in order; returns (frames, bytes)."""
+        frames = written_bytes = 0
+        with self.lock:
+            while self.pending:
+                frame = self.compressor.compress(self.pending.popleft())
+                # write() may return short, so hold an exclusive file lock until
+                # the whole frame is in; another worker process appending to
+                # the same session waits rather than splicing a frame into ours.
+                fcntl.flock(self.fd, fcntl.LOCK_EX)
+                try:
+                    view = memoryview(frame)
+                    while view:
+                        written = os.write(self.fd, view)
+                        view = view[written:]
+                finally:
+                    fcntl.flock(self.fd, fcntl.LOCK_UN)
+                self.frames_written += 1
+                frames += 1
+                written_bytes += len(frame)
+        return frames, written_bytes
+
+    def close(self) -> tuple[int, int]:
+        try:
+            return self.drain()
+        finally:
+            with self.lock:
+                os.close(self.fd)
+
+
+class SessionWriterCache:
+    """
+    Long-lived writers for per-session ``.jsonl.zst`` files.
+
+    Each active ``(module_id, session_id)`` keeps an open append descriptor
+    and a reusable compressor. Upload batches are buffered and written as a
+    single zstd frame once the buffer reaches ``flush_bytes`` or has been
+    held for ``flush_seconds``, so a session produces a handful of large
+    frames instead of one tiny frame per upload. Writers are closed on
+    session end, when idle for ``idle_seconds`` or when evicted by the LRU
+    bound. Buffered data that has not been flushed yet only lives in
+    memory; the rows are already in ``behavior_data``.
+    """
+
+    def __init__(
+        self,
+        max_open: int = TELEMETRY_WRITER_MAX_OPEN,
+        idle_seconds: float = TELEMETRY_WRITER_IDLE_SECONDS,
+        flush_seconds: float = TELEMETRY_WRITER_FLUSH_SECONDS,
+        flush_bytes: int = TELEMETRY_WRITER_FLUSH_BYTES,
+        dictionaries: ModuleDictionaries = module_dictionaries,
+    ):
+        self.max_open = max(1, max_open)
+        self.idle_seconds = idle_seconds
+        self.flush_seconds = flush_seconds
+        self.flush_bytes = flush_bytes
+        self.dictionaries = dictionaries
+        self._writers: OrderedDict[tuple[str, str], _SessionWriter] = OrderedDict()
+        self._lock = threading.RLock()
+        self._thread: threading.Thread | None = None
+        self._stopping = threading.Event()
+        self._stats = {
+            "opened": 0,
+            "closed": 0,
+            "evicted": 0,
+            "frames_written": 0,
+            "bytes_written": 0,
+            "write_failures": 0,
+            "sweep_failures": 0,
+        }
+
+    def write(self, module_id: str, session_id: str, lines: list[bytes]):
+        key = (module_id, session_id)
+        with self._lock:
+            writer = self._buffer(key, lines)
+        evicted = []
+        if writer is None:
+            # Creating the file and loading its dictionary hit the disk, so
+            # open outside the cache lock. If another upload for the session
+            # got in first, keep its writer and close this one.
+            opened = self._open(module_id, session_id)
+            with self._lock:
+                writer = self._buffer(key, lines)
+                if writer is None:
+                    self._writers[key] = opened
+                    self._stats["opened"] += 1
+                    evicted = self._evict_overflow()
+                    writer = self._buffer(key, lines)
+                else:
+                    evicted = [opened]
+        # Compression and file I/O happen per writer, outside the cache lock,
+        # so one slow session does not stall uploads for every other one.
+        self._drain(writer)
+        self._close_writers(evicted)
+
+    def close_session(self, session_id: str, module_id: str | None = None):
+        with self._lock:
+            keys = [
+                key
+                for key in self._writers
+                if key[1] == session_id and (module_id is None or key[0] == module_id)
+            ]
+            writers = [self._detach(key) for key in keys]
+        self._close_writers(writers)
+
+    def close_module(self, module_id: str):
+        with self._lock:
+            writers = [
+                self._detach(key) for key in [key for key in self._writers if key[0] == module_id]
+            ]
+        self._close_writers(writers)
+
+    def close_all(self):
+        with self._lock:
+            writers = [self._detach(key) for key in list(self._writers)]
+        self._close_writers(writers)
+
+    def sweep(self):
+        now = time.monotonic()
+        idle = []
+        due = []
+        with self._lock:
+            for key, writer in list(self._writers.items()):
+                if now - writer.last_write >= self.idle_seconds:
+                    idle.append(self._detach(key))
+                elif writer.buffer and now - writer.last_flush >= self.flush_seconds:
+                    writer.cut()
+                    due.append(writer)
+        for writer in due:
+            self._drain(writer)
+        self._close_writers(idle)
+
+    def start(self, interval: float = 1.0):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(
+            target=self._run, args=(interval,), name="telemetry-file-writer", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(5)
+            self._thread = None
+        self.close_all()
+
+    def stats(self) -> dict:
+        with self._lock:
+            data = dict(self._stats)
+            data["open_writers"] = len(self._writers)
+            data["buffered_bytes"] = sum(
+                w.buffered_bytes for w in self._writers.values()
+            )
+        return data
+
+    def _run(self, interval: float):
+        while not self._stopping.wait(interval):
+            try:
+                self.sweep()
+            except Exception:
+                logger.exception("Telemetry file writer sweep failed")
+                self._count("sweep_failures")
+
+    def _open(self, module_id: str, session_id: str) -> _SessionWriter:
+        path = get_session_file_path(module_id, session_id)
+        if not path.exists():
+            create_session_file(path, self.dictionaries.get(module_id))
+        # Append with the dictionary the file was created with, whichever
+        # worker created it, so the file's frames share one dictionary.
+        dict_data = self.dictionaries.get_by_id(module_id, get_file_dictionary_id(path))
+        return _SessionWriter(path, dict_data)
+
+    def _buffer(self, key: tuple[str, str], lines: list[bytes]) -> _SessionWriter | None:
+        """Append ``lines`` to the open writer for ``key``; call under the cache lock."""
+        writer = self._writers.get(key)
+        if writer is None:
+            return None
+        self._writers.move_to_end(key)
+        for line in lines:
+            writer.append(line)
+        if writer.buffered_bytes >= self.flush_bytes:
+            writer.cut()
+        return writer
+
+    def _count(self, key: str, amount: int = 1):
+        with self._lock:
+            self._stats[key] += amount
+
+    def _drain(self, writer: _SessionWriter, close: bool = False):
+        try:
+            frames, written = writer.close() if close else writer.drain()
+        except Exception:
+            logger.exception("Writing telemetry file %s failed", writer.path)
+            self._count("write_failures")
+            return
+        if frames:
+            with self._lock:
+                self._stats["frames_written"] += frames
+                self._stats["bytes_written"] += written
+
+    def _detach(self, key: tuple[str, str]) -> _SessionWriter:
+        writer = self._writers.pop(key)
+        writer.cut()
+        self._stats["closed"] += 1
+        return writer
+
+    def _close_writers(self, writers: list[_SessionWriter]):
+        for writer in writers:
+            self._drain(writer, close=True)
+
+    def _evict_overflow(self) -> list[_SessionWriter]:
+        evicted = []
+        while len(self._writers) > self.max_open:
+            evicted.append(self._detach(next(iter(self._writers))))
+            self._stats["evicted"] += 1
+        return evicted
+
+
+session_writers = SessionWriterCache()
+
+
+def read_session_bytes(module_id: str, path: Path) -> bytes:
+    """
+    Decompress every frame of a session file. Each frame is decoded with the
+    dictionary named in its own header, so files written before dictionary
+    IDs were fixed at creation, with frames from several versions, still read.
+    """
+    data = path.read_bytes()
+    decompressors: dict[int, zstd.ZstdDecompressor] = {}
+    chunks = []
+    while data:
+        dict_id = zstd.get_frame_parameters(data).dict_id
+        decompressor = decompressors.get(dict_id)
+        if decompressor is None:
+            dict_data = module_dictionaries.get_by_id(module_id, dict_id)
+            if dict_data is not None:
+                decompressor = zstd.ZstdDecompressor(dict_data=dict_data)
+            else:
+                decompressor = zstd.ZstdDecompressor()
+            decompressors[dict_id] = decompressor
+        frame = decompressor.decompressobj()
+        chunks.append(frame.decompress(data))
+        data = frame.unused_data
+    return b"".join(chunks)
+
+
+def iter_session_records(module_id: str, path: Path):
+    for line in read_session_bytes(module_id, path).splitlines():
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError:
+            continue
+
+
+def train_module_dictionary(
+    module_id: str,
+    dict_size: int = TELEMETRY_DICT_SIZE,
+    max_files: int = TELEMETRY_DICT_SAMPLE_FILES,
+    max_bytes: int = TELEMETRY_DICT_SAMPLE_BYTES,
+) -> dict:
+    """
+    Train a zstd dictionary from the module's most recent session files and
+    store it as the module's next dictionary version. Each JSON line is one
+    training sample, which matches how records repeat across sessions.
+    """
+    module_dir = Path(TELEMETRY_DATA_DIR) / sanitize_segment(module_id)
+    files = sorted(
+        module_dir.glob("*.jsonl.zst"),
+        key=lambda item: item.stat().st_mtime,
+        reverse=True,
+    )[:max_files]
+
+    samples = []
+    sample_bytes = 0
+    for path in files:
+        try:
+            data = read_session_bytes(module_id, path)
+        except (OSError, zstd.ZstdError):
+            continue
+        for line in data.splitlines(keepends=True):
+            samples.append(line)
+            sample_bytes += len(line)
+        if sample_bytes >= max_bytes:
+            break
+
+    if not samples:
+        raise ValueError("No telemetry files available to train a dictionary")
+
+    dict_data = zstd.train_dictionary(dict_size, samples)
+    saved = module_dictionaries.save(module_id, dict_data)
+    saved["samples"] = len(samples)
+    saved["sample_bytes"] = sample_bytes
+    saved["files"] = len(files)
+    return saved
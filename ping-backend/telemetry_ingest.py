@@ -0,0 +1,230 @@
+import logging
+import os
+import queue
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Callable, Optional
+
+from sqlalchemy.orm import Session
+
+from database import IngestSessionLocal
+
+logger = logging.getLogger(__name__)
+
+TELEMETRY_INGEST_MODE = os.getenv("TELEMETRY_INGEST_MODE", "async").lower()
+TELEMETRY_INGEST_QUEUE_SIZE = int(os.getenv("TELEMETRY_INGEST_QUEUE_SIZE", "2000"))
+TELEMETRY_INGEST_FLUSH_ROWS = int(os.getenv("TELEMETRY_INGEST_FLUSH_ROWS", "5000"))
+TELEMETRY_INGEST_FLUSH_MS = int(os.getenv("TELEMETRY_INGEST_FLUSH_MS", "200"))
+TELEMETRY_INGEST_MAX_RETRIES = int(os.getenv("TELEMETRY_INGEST_MAX_RETRIES", "3"))
+TELEMETRY_INGEST_DRAIN_SECONDS = float(os.getenv("TELEMETRY_INGEST_DRAIN_SECONDS", "5"))
+
+
+class IngestQueueFull(Exception):
+    """Raised when the ingest queue cannot accept another batch."""
+
+
+@dataclass
+class IngestBatch:
+    session_id: str
+    anonymized_id: str
+    user_id: Optional[int]
+    guest_id: Optional[str]
+    received_at: datetime
+    rows: list[dict] = field(default_factory=list)
+    file_events: dict[tuple[str, str], list[dict]] = field(default_factory=dict)
+    completed_modules: set[str] = field(default_factory=set)
+
+
+class TelemetryIngestQueue:
+    """
+    Bounded in-process queue for validated telemetry batches.
+
+    Request handlers only enqueue; a single background writer drains the
+    queue and hands groups of batches to ``store`` so rows from many
+    requests land in one multi-row insert and one commit.
+    """
+
+    def __init__(
+        self,
+        store: Callable[[Session, list[IngestBatch]], None],
+        maxsize: int = TELEMETRY_INGEST_QUEUE_SIZE,
+        flush_rows: int = TELEMETRY_INGEST_FLUSH_ROWS,
+        flush_ms: int = TELEMETRY_INGEST_FLUSH_MS,
+    ):
+        self.store = store
+        self.flush_rows = max(1, flush_rows)
+        self.flush_seconds = max(flush_ms, 1) / 1000.0
+        self._queue: queue.Queue = queue.Queue(maxsize=max(1, maxsize))
+        self._thread: threading.Thread | None = None
+        self._stopping = threading.Event()
+        # Batches per session that are queued or being written.
+        self._pending: dict[str, int] = {}
+        self._pending_changed = threading.Condition()
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "batches_enqueued": 0,
+            "batches_rejected": 0,
+            "batches_written": 0,
+            "batches_dropped": 0,
+            "rows_written": 0,
+            "flushes": 0,
+            "last_flush_ms": 0.0,
+        }
+
+    @property
+    def enabled(self) -> bool:
+        return TELEMETRY_INGEST_MODE == "async"
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if not self.enabled or self.running:
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="telemetry-ingest-writer", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self, timeout: float = 10.0):
+        if not self.running:
+            return
+        self._stopping.set()
+        self._thread.join(timeout)
+        self._thread = None
+
+    def submit(self, batch: IngestBatch):
+        with self._pending_changed:
+            self._pending[batch.session_id] = self._pending.get(batch.session_id, 0) + 1
+        try:
+            self._queue.put_nowait(batch)
+        except queue.Full:
+            self._settle([batch])
+            self._bump("batches_rejected")
+            raise IngestQueueFull()
+        self._bump("batches_enqueued")
+
+    def wait_for_session(
+        self, session_id: str, timeout: float = TELEMETRY_INGEST_DRAIN_SECONDS
+    ) -> bool:
+        """
+        Block until every batch of ``session_id`` submitted to this process
+        has been written (or dropped). Returns False on timeout.
+        """
+        with self._pending_changed:
+            return self._pending_changed.wait_for(
+                lambda: session_id not in self._pending, timeout
+            )
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            data = dict(self._stats)
+        data["mode"] = TELEMETRY_INGEST_MODE
+        data["queue_depth"] = self._queue.qsize()
+        data["queue_capacity"] = self._queue.maxsize
+        data["running"] = self.running
+        return data
+
+    def _settle(self, batches: list[IngestBatch]):
+        with self._pending_changed:
+            for batch in batches:
+                left = self._pending.get(batch.session_id, 0) - 1
+                if left > 0:
+                    self._pending[batch.session_id] = left
+                else:
+                    self._pending.pop(batch.session_id, None)
+            self._pending_changed.notify_all()
+
+    def _bump(self, key: str, amount: int = 1):
+        with self._stats_lock:
+            self._stats[key] += amount
+
+    def _collect(self) -> list[IngestBatch]:
+        try:
+            first = self._queue.get(timeout=0.5)
+        except queue.Empty:
+            return []
+
+        batches = [first]
+        row_count = len(first.rows)
+        deadline = time.monotonic() + self.flush_seconds
+        while row_count < self.flush_rows:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batches.append(batch)
+            row_count += len(batch.rows)
+        return batches
+
+    def _run(self):
+        while not (self._stopping.is_set() and self._queue.empty()):
+            batches = self._collect()
+            if batches:
+                self._flush(batches)
+
+    def _flush(self, batches: list[IngestBatch]):
+        started = time.perf_counter()
+        for attempt in range(TELEMETRY_INGEST_MAX_RETRIES):
+            if self._try_store(batches, attempt):
+                written = batches
+                break
+            time.sleep(min(2**attempt * 0.2, 2.0))
+        else:
+            # Still failing after the retries: most likely one bad batch, so
+            # don't let it take every other client's events down with it.
+            written = self._isolate(batches)
+        self._settle(batches)
+
+        with self._stats_lock:
+            self._stats["batches_written"] += len(written)
+            self._stats["rows_written"] += sum(len(b.rows) for b in written)
+            self._stats["flushes"] += 1
+            self._stats["last_flush_ms"] = round(
+                (time.perf_counter() - started) * 1000, 2
+            )
+
+    def _try_store(self, batches: list[IngestBatch], attempt: int = 0) -> bool:
+        db = IngestSessionLocal()
+        try:
+            self.store(db, batches)
+            return True
+        except Exception:
+            db.rollback()
+            logger.exception(
+                "Telemetry ingest flush of %s batches failed (attempt %s)",
+                len(batches),
+                attempt + 1,
+            )
+            return False
+        finally:
+            db.close()
+
+    def _isolate(self, batches: list[IngestBatch]) -> list[IngestBatch]:
+        """Bisect a failing group, storing the halves that succeed; returns what was written."""
+        if len(batches) == 1:
+            batch = batches[0]
+            modules = sorted({row["module_id"] for row in batch.rows} | {key[0] for key in batch.file_events})
+            logger.error(
+                "Dropping telemetry batch for session %s, modules %s (%s rows)",
+                batch.session_id,
+                ", ".join(modules) or "-",
+                len(batch.rows),
+            )
+            self._bump("batches_dropped")
+            return []
+        middle = len(batches) // 2
+        written = []
+        for half in (batches[:middle], batches[middle:]):
+            if self._try_store(half):
+                written.extend(half)
+            else:
+                written.extend(self._isolate(half))
+        return written
@@ -0,0 +1,301 @@
+import logging
+import os
+import re
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+from background_jobs import PeriodicJob, register_job
+from database import admin_engine, advisory_lock
+from models import BehaviorData, Organization, TelemetrySession
+from telemetry_compaction import (
+    day_bounds,
+    get_compacted_dir,
+    load_manifest,
+    manifest_lock,
+    save_manifest,
+)
+from telemetry_files import get_session_file_path
+
+logger = logging.getLogger(__name__)
+
+TELEMETRY_PARTITIONING_ENABLED = (
+    os.getenv("TELEMETRY_PARTITIONING_ENABLED", "false").lower() == "true"
+)
+TELEMETRY_PARTITION_MONTHS_AHEAD = int(os.getenv("TELEMETRY_PARTITION_MONTHS_AHEAD", "2"))
+TELEMETRY_RETENTION_ENABLED = (
+    os.getenv("TELEMETRY_RETENTION_ENABLED", "true").lower() == "true"
+)
+TELEMETRY_RETENTION_INTERVAL_SECONDS = int(
+    os.getenv("TELEMETRY_RETENTION_INTERVAL_SECONDS", "86400")
+)
+
+TABLE = BehaviorData.__tablename__
+LEGACY_TABLE = f"{TABLE}_legacy"
+DEFAULT_PARTITION = f"{TABLE}_default"
+UPPER_BOUND_RE = re.compile(r"TO \('([^']+)'\)")
+
+
+def partitioning_supported() -> bool:
+    return admin_engine.dialect.name == "postgresql"
+
+
+def month_start(value: date) -> date:
+    return value.replace(day=1)
+
+
+def add_months(value: date, months: int) -> date:
+    month = value.month - 1 + months
+    return date(value.year + month // 12, month % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"{TABLE}_p{month:%Y%m}"
+
+
+def is_partitioned(conn: Connection) -> bool:
+    relkind = conn.execute(
+        text("SELECT relkind FROM pg_class WHERE oid = to_regclass(:table)"),
+        {"table": TABLE},
+    ).scalar()
+    return relkind == "p"
+
+
+def create_month_partition(conn: Connection, month: date) -> None:
+    start = month_start(month)
+    end = add_months(start, 1)
+    conn.execute(
+        text(
+            f"CREATE TABLE IF NOT EXISTS {partition_name(start)} PARTITION OF {TABLE} "
+            f"FOR VALUES FROM ('{start.isoformat()} 00:00:00+00') "
+            f"TO ('{end.isoformat()} 00:00:00+00')"
+        )
+    )
+
+
+def migrate_to_partitioned(conn: Connection) -> None:
+    """
+    Turn the plain behavior_data table into a table partitioned by month on
+    ``timestamp``. Existing rows stay where they are: the old table is
+    attached as one partition covering everything before the current
+    month. Runs in the caller's transaction.
+    """
+    today = datetime.now(timezone.utc).date()
+    first_month = add_months(month_start(today), 1)
+
+    conn.execute(text(f"UPDATE {TABLE} SET timestamp = now() WHERE timestamp IS NULL"))
+    conn.execute(text(f"ALTER TABLE {TABLE} RENAME TO {LEGACY_TABLE}"))
+    # The parent's key has to include the partition column, and ATTACH needs
+    # the partition to carry a matching one; this also frees the name.
+    conn.execute(text(f"ALTER TABLE {LEGACY_TABLE} DROP CONSTRAINT {TABLE}_pkey"))
+    # Index names are schema-wide; free them up for the partitioned parent.
+    for (index_name,) in conn.execute(
+        text(
+            "SELECT indexname FROM pg_indexes "
+            "WHERE tablename = :table AND indexname LIKE :prefix"
+        ),
+        {"table": LEGACY_TABLE, "prefix": f"ix_{TABLE}_%"},
+    ).all():
+        conn.execute(text(f"ALTER INDEX {index_name} RENAME TO {index_name}_legacy"))
+
+    conn.execute(
+        text(
+            f"CREATE TABLE {TABLE} (LIKE {LEGACY_TABLE} INCLUDING DEFAULTS) "
+            f"PARTITION BY RANGE (timestamp)"
+        )
+    )
+    conn.execute(text(f"ALTER TABLE {TABLE} ALTER COLUMN timestamp SET NOT NULL"))
+    conn.execute(text(f"ALTER TABLE {TABLE} ADD PRIMARY KEY (id, timestamp)"))
+    conn.execute(
+        text(f"ALTER TABLE {TABLE} ADD FOREIGN KEY (user_id) REFERENCES users (id)")
+    )
+    # The id sequence must outlive the legacy partition once retention drops it.
+    conn.execute(text(f"ALTER SEQUENCE {TABLE}_id_seq OWNED BY {TABLE}.id"))
+
+    conn.execute(
+        text(
+            f"ALTER TABLE {LEGACY_TABLE} ALTER COLUMN timestamp SET NOT NULL, "
+            f"ADD CONSTRAINT {LEGACY_TABLE}_pkey PRIMARY KEY (id, timestamp)"
+        )
+    )
+    conn.execute(
+        text(
+            f"ALTER TABLE {TABLE} ATTACH PARTITION {LEGACY_TABLE} "
+            f"FOR VALUES FROM (MINVALUE) TO ('{first_month.isoformat()} 00:00:00+00')"
+        )
+    )
+    conn.execute(text(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF {TABLE} DEFAULT"))
+
+    # Partitioned indexes cascade to every partition and adopt the legacy ones.
+    for index in BehaviorData.__table__.indexes:
+        columns = ", ".join(column.name for column in index.columns)
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS {index.name} ON {TABLE} ({columns})"))
+
+
+def ensure_future_partitions(conn: Connection, months_ahead: int = TELEMETRY_PARTITION_MONTHS_AHEAD) -> list[str]:
+    """Create monthly partitions from the current month up to ``months_ahead``."""
+    bounds = [upper for _, upper in list_partitions(conn) if upper is not None]
+    covered_until = max(bounds).date() if bounds else date.min
+    start = month_start(datetime.now(timezone.utc).date())
+    created = []
+    for offset in range(months_ahead + 1):
+        month = add_months(start, offset)
+        # Partitions are contiguous, so anything below the highest bound exists.
+        if month < covered_until:
+            continue
+        create_month_partition(conn, month)
+        created.append(partition_name(month))
+    return created
+
+
+def ensure_partitioning() -> None:
+    """Startup hook: migrate when enabled, then make sure upcoming months exist."""
+    if not TELEMETRY_PARTITIONING_ENABLED or not partitioning_supported():
+        return
+    with advisory_lock("schema:behavior_data_partitions", wait=True):
+        with admin_engine.begin() as conn:
+            if not is_partitioned(conn):
+                logger.info("Migrating %s to monthly partitions", TABLE)
+                migrate_to_partitioned(conn)
+            ensure_future_partitions(conn)
+
+
+def list_partitions(conn: Connection) -> list[tuple[str, datetime | None]]:
+    """Child partitions with their exclusive upper bound (None for DEFAULT)."""
+    rows = conn.execute(
+        text(
+            "SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) "
+            "FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = to_regclass(:table)"
+        ),
+        {"table": TABLE},
+    ).all()
+    partitions = []
+    for name, bound in rows:
+        match = UPPER_BOUND_RE.search(bound or "")
+        upper = None
+        if match:
+            upper = datetime.fromisoformat(match.group(1))
+            if upper.tzinfo is None:
+                upper = upper.replace(tzinfo=timezone.utc)
+        partitions.append((name, upper))
+    return sorted(partitions, key=lambda item: (item[1] is None, item[1] or datetime.min))
+
+
+def get_retention_cutoff(conn: Connection) -> datetime | None:
+    """
+    Oldest timestamp every organization still needs. None when any
+    organization keeps data indefinitely or there are no organizations.
+    """
+    row = conn.execute(
+        text(
+            "SELECT count(*), count(data_retention_days), max(data_retention_days) "
+            f"FROM {Organization.__tablename__}"
+        )
+    ).one()
+    total, with_retention, longest = row
+    if not total or with_retention != total or longest is None:
+        return None
+    return datetime.now(timezone.utc) - timedelta(days=int(longest))
+
+
+def get_partition_files(conn: Connection, partition: str, upper: datetime) -> list[Path]:
+    """Session files whose every event lives in ``partition``."""
+    rows = conn.execute(
+        text(
+            f"SELECT DISTINCT p.module_id, p.session_id FROM {partition} p "
+            f"WHERE NOT EXISTS (SELECT 1 FROM {TABLE} b "
+            "WHERE b.session_id = p.session_id AND b.timestamp >= :upper)"
+        ),
+        {"upper": upper},
+    ).all()
+    return [get_session_file_path(module_id, session_id) for module_id, session_id in rows]
+
+
+def delete_files(paths: list[Path]) -> int:
+    removed = 0
+    for path in paths:
+        try:
+            path.unlink()
+            removed += 1
+        except FileNotFoundError:
+            pass
+    return removed
+
+
+def delete_compacted_days(module_ids: set[str], cutoff: datetime) -> None:
+    for module_id in module_ids:
+        with manifest_lock(module_id):
+            manifest = load_manifest(module_id)
+            expired = [
+                day for day in manifest["days"]
+                if day_bounds(date.fromisoformat(day))[1] <= cutoff
+            ]
+            if not expired:
+                continue
+            for day in expired:
+                entry = manifest["days"].pop(day)
+                (get_compacted_dir(module_id) / entry["file"]).unlink(missing_ok=True)
+            save_manifest(module_id, manifest)
+
+
+def drop_expired_partitions() -> list[dict]:
+    """Detach and drop every partition that lies wholly before the retention cutoff."""
+    if not partitioning_supported():
+        return []
+    dropped = []
+    cleanup = []
+    with admin_engine.begin() as conn:
+        if not is_partitioned(conn):
+            return []
+        cutoff = get_retention_cutoff(conn)
+        if cutoff is None:
+            return []
+        for name, upper in list_partitions(conn):
+            if upper is None or upper > cutoff:
+                continue
+            module_ids = {
+                row[0]
+                for row in conn.execute(text(f"SELECT DISTINCT module_id FROM {name}")).all()
+            }
+            files = get_partition_files(conn, name, upper)
+            conn.execute(
+                TelemetrySession.__table__.delete().where(TelemetrySession.ended_at < upper)
+            )
+            conn.execute(text(f"ALTER TABLE {TABLE} DETACH PARTITION {name}"))
+            conn.execute(text(f"DROP TABLE {name}"))
+            dropped.append({"partition": name, "upper_bound": upper.isoformat(), "files_deleted": 0})
+            cleanup.append((dropped[-1], files, module_ids, upper))
+
+    # Files go only once the drop has committed; if it rolled back, the
+    # rows are still there and so must their files be.
+    for item, files, module_ids, upper in cleanup:
+        item["files_deleted"] = delete_files(files)
+        delete_compacted_days(module_ids, upper)
+        logger.info(
+            "Dropped telemetry partition %s (%s session files)",
+            item["partition"],
+            item["files_deleted"],
+        )
+    return dropped
+
+
+def run_partition_maintenance():
+    with admin_engine.begin() as conn:
+        if not is_partitioned(conn):
+            return
+        ensure_future_partitions(conn)
+    if TELEMETRY_RETENTION_ENABLED:
+        drop_expired_partitions()
+
+
+partition_job = register_job(
+    PeriodicJob(
+        "telemetry-partitions",
+        TELEMETRY_RETENTION_INTERVAL_SECONDS,
+        run_partition_maintenance,
+        enabled=TELEMETRY_PARTITIONING_ENABLED and partitioning_supported(),
+    )
+)
@@ -0,0 +1,271 @@
+import base64
+import json
+import logging
+from collections import Counter
+from datetime import datetime
+
+from sqlalchemy import case, func, tuple_, update
+from sqlalchemy.orm import Session
+
+from database import advisory_lock, dialect_insert
+from models import BehaviorData, TelemetrySession
+from telemetry_files import get_session_file_path
+
+logger = logging.getLogger(__name__)
+
+BACKFILL_CHUNK_SESSIONS = 1000
+
+SUMMARY_COLUMNS = (
+    "module_id",
+    "session_id",
+    "user_id",
+    "guest_session_id",
+    "started_at",
+    "ended_at",
+    "event_count",
+    "text_input_count",
+)
+
+
+def earlier_of(current, incoming):
+    return case(
+        (incoming.is_(None), current),
+        (current.is_(None), incoming),
+        (incoming < current, incoming),
+        else_=current,
+    )
+
+
+def later_of(current, incoming):
+    return case(
+        (incoming.is_(None), current),
+        (current.is_(None), incoming),
+        (incoming > current, incoming),
+        else_=current,
+    )
+
+
+def apply_event_rows(db: Session, rows: list[dict]) -> None:
+    """
+    Fold freshly inserted behavior_data rows into their session summaries.
+    Runs in the caller's transaction, before its commit.
+    """
+    deltas: dict[tuple[str, str], dict] = {}
+    type_counts: dict[tuple[str, str], Counter] = {}
+    for row in rows:
+        key = (row["session_id"], row["module_id"])
+        timestamp = row.get("timestamp")
+        delta = deltas.get(key)
+        if delta is None:
+            delta = deltas[key] = {
+                "module_id": row["module_id"],
+                "session_id": row["session_id"],
+                "user_id": row.get("user_id"),
+                "guest_session_id": row.get("guest_session_id"),
+                "started_at": timestamp,
+                "ended_at": timestamp,
+                "event_count": 0,
+                "text_input_count": 0,
+            }
+            type_counts[key] = Counter()
+        elif timestamp is not None:
+            if delta["started_at"] is None or timestamp < delta["started_at"]:
+                delta["started_at"] = timestamp
+            if delta["ended_at"] is None or timestamp > delta["ended_at"]:
+                delta["ended_at"] = timestamp
+        delta["event_count"] += 1
+        if row["event_type"] == "text_input":
+            delta["text_input_count"] += 1
+        type_counts[key][row["event_type"]] += 1
+
+    if not deltas:
+        return
+
+    table = TelemetrySession.__table__
+    stmt = dialect_insert(db, table)
+    excluded = stmt.excluded
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.session_id, table.c.module_id],
+        set_={
+            "event_count": table.c.event_count + excluded.event_count,
+            "text_input_count": table.c.text_input_count + excluded.text_input_count,
+            "started_at": earlier_of(table.c.started_at, excluded.started_at),
+            "ended_at": later_of(table.c.ended_at, excluded.ended_at),
+            "user_id": func.coalesce(table.c.user_id, excluded.user_id),
+            "guest_session_id": func.coalesce(
+                table.c.guest_session_id, excluded.guest_session_id
+            ),
+            "updated_at": func.now(),
+        },
+    )
+    # Sorted so concurrent writers lock summary rows in the same order.
+    keys = sorted(deltas)
+    db.execute(stmt, [deltas[key] for key in keys])
+
+    # The upsert above holds the row locks, so merging the per-type counts
+    # in Python cannot lose a concurrent writer's increments.
+    summaries = (
+        db.query(
+            TelemetrySession.id,
+            TelemetrySession.session_id,
+            TelemetrySession.module_id,
+            TelemetrySession.event_type_counts,
+        )
+        .filter(TelemetrySession.session_id.in_({key[0] for key in keys}))
+        .all()
+    )
+    updates = []
+    for summary in summaries:
+        counts = type_counts.get((summary.session_id, summary.module_id))
+        if counts is None:
+            continue
+        merged = Counter(summary.event_type_counts or {})
+        merged.update(counts)
+        updates.append({"id": summary.id, "event_type_counts": dict(merged)})
+    if updates:
+        db.execute(update(TelemetrySession), updates)
+
+
+def encode_session_cursor(summary: TelemetrySession) -> str:
+    """Opaque token for the position just after ``summary`` in the admin listing."""
+    payload = {
+        "e": summary.ended_at.isoformat() if summary.ended_at else None,
+        "s": summary.session_id,
+        "m": summary.module_id,
+    }
+    raw = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_session_cursor(token: str) -> tuple[datetime | None, str, str]:
+    """Inverse of ``encode_session_cursor``; raises ValueError on a malformed token."""
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        payload = json.loads(raw)
+        ended_at = datetime.fromisoformat(payload["e"]) if payload["e"] is not None else None
+        return ended_at, str(payload["s"]), str(payload["m"])
+    except (TypeError, KeyError, ValueError) as exc:
+        raise ValueError("Invalid cursor") from exc
+
+
+def list_session_page(query, limit: int, cursor: str | None = None, offset: int = 0):
+    """
+    Up to ``limit`` + 1 rows of a newest-first session query, starting after
+    ``cursor`` (or ``offset`` rows in). Sessions without an end time come
+    last. They are read as a second run rather than with NULLS LAST, which
+    Postgres could not serve from ix_telemetry_sessions_ended without a
+    sort. Raises ValueError on a malformed cursor.
+    """
+    position = decode_session_cursor(cursor) if cursor else None
+    ids = tuple_(TelemetrySession.session_id, TelemetrySession.module_id)
+
+    rows = []
+    if position is None or position[0] is not None:
+        dated = query.filter(TelemetrySession.ended_at.isnot(None))
+        if position:
+            dated = dated.filter(
+                tuple_(
+                    TelemetrySession.ended_at,
+                    TelemetrySession.session_id,
+                    TelemetrySession.module_id,
+                )
+                < tuple_(*position)
+            )
+        rows = (
+            dated.order_by(
+                TelemetrySession.ended_at.desc(),
+                TelemetrySession.session_id.desc(),
+                TelemetrySession.module_id.desc(),
+            )
+            .offset(offset)
+            .limit(limit + 1)
+            .all()
+        )
+        if len(rows) > limit:
+            return rows
+        # Only skip undated rows if the offset ran past every dated one.
+        offset = max(0, offset - dated.count()) if offset and not rows else 0
+
+    undated = query.filter(TelemetrySession.ended_at.is_(None))
+    if position and position[0] is None:
+        undated = undated.filter(ids < tuple_(position[1], position[2]))
+    rows += (
+        undated.order_by(TelemetrySession.session_id.desc(), TelemetrySession.module_id.desc())
+        .offset(offset)
+        .limit(limit + 1 - len(rows))
+        .all()
+    )
+    return rows
+
+
+def get_session_summaries(db: Session, session_id: str) -> list[TelemetrySession]:
+    return (
+        db.query(TelemetrySession)
+        .filter(TelemetrySession.session_id == session_id)
+        .order_by(TelemetrySession.started_at.asc())
+        .all()
+    )
+
+
+def record_file_sizes(db: Session, summaries: list[TelemetrySession]) -> None:
+    """Store the on-disk size of each summary's session file; call after the writer closed."""
+    for summary in summaries:
+        path = get_session_file_path(summary.module_id, summary.session_id)
+        try:
+            summary.file_size = path.stat().st_size
+        except FileNotFoundError:
+            summary.file_size = None
+    db.commit()
+
+
+def rebuild_session_summaries(db: Session) -> None:
+    """Recompute every session summary from behavior_data."""
+    table = TelemetrySession.__table__
+    db.execute(table.delete())
+    aggregates = db.query(
+        BehaviorData.module_id,
+        BehaviorData.session_id,
+        func.max(BehaviorData.user_id),
+        func.max(BehaviorData.guest_session_id),
+        func.min(BehaviorData.timestamp),
+        func.max(BehaviorData.timestamp),
+        func.count(BehaviorData.id),
+        func.sum(case((BehaviorData.event_type == "text_input", 1), else_=0)),
+    ).group_by(BehaviorData.module_id, BehaviorData.session_id)
+    db.execute(table.insert().from_select(SUMMARY_COLUMNS, aggregates.statement))
+    db.commit()
+
+    summary_ids = [row[0] for row in db.query(TelemetrySession.id).order_by(TelemetrySession.id)]
+    for offset in range(0, len(summary_ids), BACKFILL_CHUNK_SESSIONS):
+        chunk = summary_ids[offset : offset + BACKFILL_CHUNK_SESSIONS]
+        per_type = (
+            db.query(TelemetrySession.id, BehaviorData.event_type, func.count(BehaviorData.id))
+            .join(
+                BehaviorData,
+                (BehaviorData.session_id == TelemetrySession.session_id)
+                & (BehaviorData.module_id == TelemetrySession.module_id),
+            )
+            .filter(TelemetrySession.id.between(chunk[0], chunk[-1]))
+            .group_by(TelemetrySession.id, BehaviorData.event_type)
+            .all()
+        )
+        counts: dict[int, dict] = {}
+        for summary_id, event_type, count in per_type:
+            counts.setdefault(summary_id, {})[event_type] = int(count)
+        if counts:
+            db.execute(
+                update(TelemetrySession),
+                [{"id": key, "event_type_counts": value} for key, value in counts.items()],
+            )
+            db.commit()
+
+
+def ensure_session_summaries(db: Session) -> None:
+    """Backfill summaries for databases that collected telemetry before they existed."""
+    with advisory_lock("telemetry:session-summaries", wait=True):
+        if db.query(TelemetrySession.id).first():
+            return
+        if not db.query(BehaviorData.id).first():
+            return
+        logger.info("Backfilling telemetry session summaries")
+        rebuild_session_summaries(db)
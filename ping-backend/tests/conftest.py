@@ -0,0 +1,73 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+# Configure the app before any of its modules are imported: they read their
+# settings from the environment at import time.
+TEST_DIR = tempfile.mkdtemp(prefix="ping-tests-")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{TEST_DIR}/ping.db")
+os.environ.setdefault("TELEMETRY_DATA_DIR", f"{TEST_DIR}/telemetry")
+os.environ.setdefault("TELEMETRY_INGEST_MODE", "sync")
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from database import Base, SessionLocal, engine  # noqa: E402
+import models  # noqa: E402,F401
+from module_cache import whitelist_cache  # noqa: E402
+from user_cache import user_cache  # noqa: E402
+
+
+@pytest.fixture
+def db():
+    """A session on an empty schema."""
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    # Row IDs restart with every schema; don't serve the last test's users.
+    user_cache.clear()
+    whitelist_cache.clear()
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+@pytest.fixture
+def statement_counter():
+    """Counts statements sent to the primary engine while active."""
+    from sqlalchemy import event
+
+    class Counter:
+        count = 0
+
+    def count(*args):
+        Counter.count += 1
+
+    event.listen(engine, "before_cursor_execute", count)
+    try:
+        yield Counter
+    finally:
+        event.remove(engine, "before_cursor_execute", count)
+
+
+@pytest.fixture
+def client_as():
+    """``client_as(user)`` -> TestClient authenticated as ``user``."""
+    from fastapi.testclient import TestClient
+
+    import main
+    from auth import create_access_token
+
+    def make(user):
+        token = create_access_token(
+            {"sub": user.email, "user_id": user.id, "role": user.role.value}
+        )
+        client = TestClient(main.app)
+        client.headers["Authorization"] = f"Bearer {token}"
+        return client
+
+    return make
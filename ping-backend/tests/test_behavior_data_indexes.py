@@ -0,0 +1,106 @@
+import os
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import create_engine, func, insert, text
+from sqlalchemy.orm import Session
+
+from database import Base, engine
+from models import BehaviorData, User
+from seeding import ensure_indexes
+
+ROWS = 60000
+START = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+# Set to a scratch Postgres database to also check the planner there.
+TEST_POSTGRES_URL = os.getenv("TEST_POSTGRES_URL")
+
+
+def synthetic_rows(count: int = ROWS) -> list[dict]:
+    """Mostly signed-in traffic over 200 modules, every fifth row a guest."""
+    return [
+        {
+            "user_id": None if i % 5 == 0 else i % 2000 + 1,
+            "guest_session_id": f"guest-{i % 3000}" if i % 5 == 0 else None,
+            "module_id": f"module-{i % 200}",
+            "session_id": f"session-{i // 50}",
+            "event_type": "click",
+            "timestamp": START + timedelta(seconds=30 * i),
+        }
+        for i in range(count)
+    ]
+
+
+def hot_queries(db: Session) -> dict:
+    return {
+        # Class and student progress.
+        "ix_behavior_data_user_module_session": db.query(
+            func.count(func.distinct(BehaviorData.session_id))
+        ).filter(
+            BehaviorData.user_id.in_([1, 2, 3]),
+            BehaviorData.module_id.in_(["module-1", "module-2"]),
+        ),
+        # Admin session listing and exports.
+        "ix_behavior_data_module_timestamp": db.query(BehaviorData.session_id).filter(
+            BehaviorData.module_id == "module-3",
+            BehaviorData.timestamp >= START + timedelta(days=2),
+            BehaviorData.timestamp < START + timedelta(days=9),
+        ),
+        # Guest export and deletion.
+        "ix_behavior_data_guest_session_id": db.query(BehaviorData.id).filter(
+            BehaviorData.guest_session_id == "guest-5"
+        ),
+    }
+
+
+def compile_sql(query, bind) -> str:
+    return str(query.statement.compile(bind, compile_kwargs={"literal_binds": True}))
+
+
+def seed(bind):
+    with bind.begin() as conn:
+        conn.execute(insert(User), [
+            {"email": f"user{i}@example.org", "username": f"user{i}"} for i in range(1, 2001)
+        ])
+        conn.execute(insert(BehaviorData), synthetic_rows())
+        conn.execute(text("ANALYZE"))
+
+
+def test_existing_database_gets_indexes(db):
+    with engine.begin() as conn:
+        for name in hot_queries(db):
+            conn.execute(text(f"DROP INDEX {name}"))
+
+    ensure_indexes()
+
+    with engine.connect() as conn:
+        names = {row[1] for row in conn.execute(text("PRAGMA index_list(behavior_data)"))}
+    assert set(hot_queries(db)) <= names
+
+
+def test_sqlite_plans_use_indexes(db):
+    seed(engine)
+
+    for index_name, query in hot_queries(db).items():
+        plan = " | ".join(
+            row[-1] for row in db.execute(text("EXPLAIN QUERY PLAN " + compile_sql(query, engine)))
+        )
+        assert index_name in plan, plan
+
+
+@pytest.mark.skipif(not TEST_POSTGRES_URL, reason="TEST_POSTGRES_URL not set")
+def test_postgres_plans_use_indexes():
+    pg_engine = create_engine(TEST_POSTGRES_URL)
+    Base.metadata.drop_all(bind=pg_engine)
+    Base.metadata.create_all(bind=pg_engine)
+    try:
+        seed(pg_engine)
+        with Session(pg_engine) as db:
+            for index_name, query in hot_queries(db).items():
+                plan = "\n".join(
+                    row[0] for row in db.execute(text("EXPLAIN " + compile_sql(query, pg_engine)))
+                )
+                assert index_name in plan, plan
+    finally:
+        Base.metadata.drop_all(bind=pg_engine)
+        pg_engine.dispose()
@@ -0,0 +1,120 @@
+from class_stats import get_class_stats
+from models import (
+    BehaviorData,
+    Class,
+    ClassStudent,
+    Module,
+    ModuleWhitelist,
+    Organization,
+    User,
+    UserRole,
+)
+
+
+def seed_teacher(db):
+    organization = Organization(name="School")
+    db.add(organization)
+    db.flush()
+    teacher = User(
+        email="teacher@example.org",
+        username="teacher",
+        role=UserRole.TEACHER,
+        organization_id=organization.id,
+        is_active=True,
+    )
+    module = Module(module_id="newton1", title="Newton", subject="physics", is_published=True)
+    db.add_all([teacher, module])
+    db.flush()
+    db.add(ModuleWhitelist(organization_id=organization.id, module_id=module.id, is_enabled=True))
+    db.commit()
+    return teacher
+
+
+def add_classes(db, teacher, count):
+    """``count`` more classes, each with two students who have one session."""
+    existing = db.query(Class).count()
+    classes = []
+    for index in range(existing, existing + count):
+        cls = Class(
+            name=f"Class {index}",
+            join_code=f"CODE{index:04d}",
+            teacher_id=teacher.id,
+            organization_id=teacher.organization_id,
+        )
+        students = [
+            User(
+                email=f"student{index}-{n}@example.org",
+                username=f"student{index}-{n}",
+                role=UserRole.STUDENT,
+                is_active=True,
+            )
+            for n in range(2)
+        ]
+        db.add(cls)
+        db.add_all(students)
+        db.flush()
+        for student in students:
+            db.add(ClassStudent(class_id=cls.id, user_id=student.id))
+            db.add(
+                BehaviorData(
+                    user_id=student.id,
+                    module_id="newton1",
+                    session_id=f"session-{student.id}",
+                    event_type="click",
+                )
+            )
+        classes.append(cls)
+    db.commit()
+    return classes
+
+
+def count_statements(counter, func):
+    counter.count = 0
+    result = func()
+    return counter.count, result
+
+
+def test_get_class_stats_counts(db):
+    teacher = seed_teacher(db)
+    classes = add_classes(db, teacher, 3)
+
+    stats = get_class_stats(db, classes)
+
+    for cls in classes:
+        assert stats[cls.id].student_count == 2
+        assert stats[cls.id].module_count == 1
+        assert stats[cls.id].total_sessions == 2
+
+
+def test_get_class_stats_query_count_is_constant(db, statement_counter):
+    teacher = seed_teacher(db)
+    add_classes(db, teacher, 2)
+    # Load the classes up front; the commits expired the seeded instances.
+    few = db.query(Class).all()
+    few_queries, _ = count_statements(statement_counter, lambda: get_class_stats(db, few))
+
+    add_classes(db, teacher, 25)
+    many = db.query(Class).all()
+    many_queries, _ = count_statements(statement_counter, lambda: get_class_stats(db, many))
+
+    assert many_queries == few_queries
+
+
+def test_get_my_classes_query_count_is_constant(db, statement_counter, client_as):
+    teacher = seed_teacher(db)
+    client = client_as(teacher)
+    add_classes(db, teacher, 2)
+    # Warm the user cache so both measured requests authenticate the same way.
+    assert client.get("/api/classes/").status_code == 200
+
+    few_queries, response = count_statements(statement_counter, lambda: client.get("/api/classes/"))
+    assert response.status_code == 200
+    assert len(response.json()) == 2
+
+    add_classes(db, teacher, 25)
+    many_queries, response = count_statements(statement_counter, lambda: client.get("/api/classes/"))
+    assert response.status_code == 200
+    assert len(response.json()) == 27
+    assert all(item["student_count"] == 2 for item in response.json())
+
+    assert many_queries == few_queries
@@ -0,0 +1,157 @@
+import socket
+import socketserver
+import threading
+from datetime import datetime, timezone
+
+import pytest
+
+from email_outbox import FAILED, PENDING, SENT, OutboxSender, queue_email
+from models import EmailOutbox
+
+
+class SmtpStandIn(socketserver.ThreadingTCPServer):
+    """Just enough of an SMTP server for smtplib: accepts, rejects (5xx) or defers (4xx) recipients."""
+
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), SmtpHandler)
+        self.connections = 0
+        self.messages: list[tuple[str, str]] = []
+        self.rejected: set[str] = set()
+        self.deferred: set[str] = set()
+
+
+class SmtpHandler(socketserver.StreamRequestHandler):
+    def reply(self, line: str):
+        self.wfile.write(f"{line}\r\n".encode())
+
+    def handle(self):
+        server = self.server
+        server.connections += 1
+        self.reply("220 stand-in ready")
+        recipient = None
+        while True:
+            line = self.rfile.readline().decode().strip()
+            if not line:
+                return
+            command = line[:4].upper()
+            if command in ("EHLO", "HELO"):
+                self.reply("250 stand-in")
+            elif command == "MAIL":
+                self.reply("250 ok")
+            elif command == "RCPT":
+                recipient = line.split("<", 1)[1].rstrip(">")
+                if recipient in server.rejected:
+                    self.reply("550 no such user")
+                elif recipient in server.deferred:
+                    self.reply("451 try again later")
+                else:
+                    self.reply("250 ok")
+            elif command == "DATA":
+                self.reply("354 end with .")
+                lines = []
+                while True:
+                    data = self.rfile.readline().decode()
+                    if data.strip() == ".":
+                        break
+                    lines.append(data)
+                server.messages.append((recipient, "".join(lines)))
+                self.reply("250 queued")
+            elif command in ("NOOP", "RSET"):
+                self.reply("250 ok")
+            elif command == "QUIT":
+                self.reply("221 bye")
+                return
+            else:
+                self.reply("502 not implemented")
+
+
+def configure_smtp(monkeypatch, port: int):
+    monkeypatch.setenv("SMTP_HOST", "127.0.0.1")
+    monkeypatch.setenv("SMTP_PORT", str(port))
+    monkeypatch.setenv("SMTP_FROM", "noreply@example.org")
+    monkeypatch.setenv("SMTP_TLS", "false")
+    monkeypatch.delenv("SMTP_USER", raising=False)
+    monkeypatch.delenv("SMTP_PASSWORD", raising=False)
+
+
+@pytest.fixture
+def smtp_server(monkeypatch):
+    server = SmtpStandIn()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    configure_smtp(monkeypatch, server.server_address[1])
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def unused_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def queue(db, *recipients):
+    for recipient in recipients:
+        queue_email(db, recipient, "Invitation", f"Hello {recipient}")
+    db.commit()
+
+
+def outbox(db) -> dict[str, EmailOutbox]:
+    db.expire_all()
+    return {message.recipient: message for message in db.query(EmailOutbox)}
+
+
+def test_batch_is_sent_over_one_connection(db, smtp_server):
+    queue(db, "a@example.org", "b@example.org", "c@example.org")
+
+    OutboxSender().run()
+
+    assert sorted(recipient for recipient, _ in smtp_server.messages) == [
+        "a@example.org",
+        "b@example.org",
+        "c@example.org",
+    ]
+    assert smtp_server.connections == 1
+    for message in outbox(db).values():
+        assert message.status == SENT
+        assert message.attempts == 1
+        assert message.body is None
+
+
+def test_rejected_recipients(db, smtp_server):
+    smtp_server.rejected.add("gone@example.org")
+    smtp_server.deferred.add("busy@example.org")
+    queue(db, "gone@example.org", "busy@example.org", "ok@example.org")
+
+    OutboxSender().run()
+
+    messages = outbox(db)
+    assert messages["gone@example.org"].status == FAILED
+    assert messages["busy@example.org"].status == PENDING
+    assert messages["busy@example.org"].attempts == 1
+    assert messages["ok@example.org"].status == SENT
+    # One bad recipient does not cost the others their connection.
+    assert smtp_server.connections == 1
+
+
+def test_connection_errors_do_not_count_as_attempts(db, monkeypatch):
+    configure_smtp(monkeypatch, unused_port())
+    queue(db, "a@example.org", "b@example.org")
+
+    sender = OutboxSender()
+    for _ in range(3):
+        sender.run()
+        for message in db.query(EmailOutbox):
+            message.next_attempt_at = datetime.now(timezone.utc)
+        db.commit()
+
+    for message in outbox(db).values():
+        assert message.status == PENDING
+        assert message.attempts == 0
+    assert outbox(db)["a@example.org"].last_error
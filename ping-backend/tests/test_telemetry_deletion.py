@@ -0,0 +1,102 @@
+from datetime import datetime, timezone
+
+import pytest
+
+import telemetry_deletion
+from models import BehaviorData, DataDeletionJob, TelemetrySession, User
+from telemetry_deletion import COMPLETED, FAILED, PENDING, RUNNING, process_deletion_job
+from telemetry_files import get_session_file_path
+
+SESSIONS = [("newton1", "session-1"), ("newton1", "session-2"), ("kepler2", "session-3")]
+
+
+@pytest.fixture
+def no_pause(monkeypatch):
+    monkeypatch.setattr(telemetry_deletion, "DATA_DELETION_BATCH_PAUSE_MS", 0)
+
+
+def upload(db, user, module_id, session_id):
+    """What an ingest flush leaves behind: rows, a summary and the session file."""
+    db.add(
+        BehaviorData(
+            user_id=user.id,
+            module_id=module_id,
+            session_id=session_id,
+            event_type="click",
+            timestamp=datetime.now(timezone.utc),
+        )
+    )
+    if not db.query(TelemetrySession).filter_by(module_id=module_id, session_id=session_id).first():
+        db.add(TelemetrySession(module_id=module_id, session_id=session_id, user_id=user.id))
+    db.commit()
+    path = get_session_file_path(module_id, session_id)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(b"frame")
+    return path
+
+
+def seed_owner(db):
+    user = User(email="leaver@example.org", username="leaver", is_active=True)
+    db.add(user)
+    db.commit()
+    paths = [upload(db, user, module_id, session_id) for module_id, session_id in SESSIONS]
+    job = DataDeletionJob(user_id=user.id, status=PENDING)
+    db.add(job)
+    db.commit()
+    return user, job, paths
+
+
+def test_second_pass_removes_late_uploads(db, monkeypatch, no_pause):
+    monkeypatch.setattr(telemetry_deletion, "DATA_DELETION_GRACE_SECONDS", 0)
+    user, job, paths = seed_owner(db)
+
+    process_deletion_job(db, job)
+    assert job.status == RUNNING
+    assert job.recheck_after is not None
+    assert job.attempts == 0
+    assert not any(path.exists() for path in paths)
+
+    # Another worker flushes a queued upload between the passes.
+    late = upload(db, user, *SESSIONS[0])
+
+    process_deletion_job(db, job)
+    assert job.status == COMPLETED
+    assert job.attempts == 1
+    assert not late.exists()
+    assert db.query(BehaviorData).filter_by(user_id=user.id).count() == 0
+    assert db.query(TelemetrySession).filter_by(user_id=user.id).count() == 0
+
+
+def test_job_stays_running_until_recheck_is_due(db, monkeypatch, no_pause):
+    monkeypatch.setattr(telemetry_deletion, "DATA_DELETION_GRACE_SECONDS", 300)
+    user, job, paths = seed_owner(db)
+
+    process_deletion_job(db, job)
+    late = upload(db, user, *SESSIONS[1])
+    process_deletion_job(db, job)
+
+    assert job.status == RUNNING
+    assert job.attempts == 0
+    assert late.exists()
+
+
+def test_failed_second_pass_gets_every_retry(db, monkeypatch, no_pause):
+    monkeypatch.setattr(telemetry_deletion, "DATA_DELETION_GRACE_SECONDS", 0)
+    monkeypatch.setattr(telemetry_deletion, "DATA_DELETION_MAX_ATTEMPTS", 2)
+    user, job, paths = seed_owner(db)
+    process_deletion_job(db, job)
+
+    def fail(db, job):
+        raise OSError("disk unavailable")
+
+    monkeypatch.setattr(telemetry_deletion, "erase_owner_data", fail)
+    process_deletion_job(db, job)
+    job = db.get(DataDeletionJob, job.id)
+    assert job.status == PENDING
+    assert job.attempts == 1
+
+    process_deletion_job(db, job)
+    job = db.get(DataDeletionJob, job.id)
+    assert job.status == FAILED
+    assert job.attempts == 2
+    assert job.error == "disk unavailable"
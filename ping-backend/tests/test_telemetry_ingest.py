@@ -0,0 +1,79 @@
+from datetime import datetime, timezone
+
+import pytest
+
+import telemetry_ingest
+from telemetry_ingest import IngestBatch, IngestQueueFull, TelemetryIngestQueue
+
+
+def make_batch(session_id: str, rows: int = 2) -> IngestBatch:
+    return IngestBatch(
+        session_id=session_id,
+        anonymized_id=f"anon-{session_id}",
+        user_id=None,
+        guest_id=f"guest-{session_id}",
+        received_at=datetime.now(timezone.utc),
+        rows=[{"module_id": "newton1", "event_type": "click"} for _ in range(rows)],
+    )
+
+
+class StubStore:
+    """Records stored batches; fails any group that contains a session from ``failing``."""
+
+    def __init__(self, *failing: str):
+        self.failing = set(failing)
+        self.stored: list[str] = []
+
+    def __call__(self, db, batches):
+        if any(batch.session_id in self.failing for batch in batches):
+            raise ValueError("bad batch")
+        self.stored.extend(batch.session_id for batch in batches)
+
+
+@pytest.fixture
+def async_ingest(monkeypatch):
+    monkeypatch.setattr(telemetry_ingest, "TELEMETRY_INGEST_MODE", "async")
+    monkeypatch.setattr(telemetry_ingest, "TELEMETRY_INGEST_MAX_RETRIES", 1)
+
+
+def test_failing_batch_is_dropped_alone(async_ingest):
+    store = StubStore("session-bad")
+    ingest = TelemetryIngestQueue(store, maxsize=10, flush_rows=1000, flush_ms=500)
+    sessions = ["session-1", "session-2", "session-bad", "session-3", "session-4"]
+    ingest.start()
+    try:
+        for session_id in sessions:
+            ingest.submit(make_batch(session_id))
+        for session_id in sessions:
+            assert ingest.wait_for_session(session_id, timeout=10)
+    finally:
+        ingest.stop()
+
+    assert sorted(store.stored) == ["session-1", "session-2", "session-3", "session-4"]
+    stats = ingest.stats()
+    assert stats["batches_dropped"] == 1
+    assert stats["batches_written"] == 4
+    assert stats["rows_written"] == 8
+    assert ingest._pending == {}
+
+
+def test_wait_for_session_times_out_while_queued(async_ingest):
+    ingest = TelemetryIngestQueue(StubStore(), maxsize=10)
+    ingest.submit(make_batch("session-1"))
+
+    assert not ingest.wait_for_session("session-1", timeout=0.05)
+    assert ingest.wait_for_session("session-2", timeout=0)
+
+
+def test_full_queue_rejects_without_pending_entry(async_ingest):
+    ingest = TelemetryIngestQueue(StubStore(), maxsize=1)
+    ingest.submit(make_batch("session-1"))
+
+    with pytest.raises(IngestQueueFull):
+        ingest.submit(make_batch("session-2"))
+    with pytest.raises(IngestQueueFull):
+        ingest.submit(make_batch("session-1"))
+
+    assert ingest._pending == {"session-1": 1}
+    assert ingest.wait_for_session("session-2", timeout=0)
+    assert ingest.stats()["batches_rejected"] == 2
@@ -0,0 +1,173 @@
+import os
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import create_engine, insert, text
+from sqlalchemy.orm import Session
+
+import telemetry_partitions
+from database import Base
+from models import BehaviorData, Organization, TelemetrySession, User
+from telemetry_compaction import get_compacted_dir, load_manifest, save_manifest
+from telemetry_files import get_session_file_path
+
+# Set to a scratch Postgres database; partitioning is Postgres-only.
+TEST_POSTGRES_URL = os.getenv("TEST_POSTGRES_URL")
+
+MIGRATED_AT = datetime(2026, 5, 10, tzinfo=timezone.utc)
+MODULE = "newton1"
+
+
+def frozen_clock(moment: datetime):
+    class Clock(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return moment.astimezone(tz) if tz else moment.replace(tzinfo=None)
+
+    return Clock
+
+
+def add_rows(conn, session_id: str, *timestamps: datetime, user_id=None):
+    conn.execute(insert(BehaviorData), [
+        {
+            "user_id": user_id,
+            "module_id": MODULE,
+            "session_id": session_id,
+            "event_type": "click",
+            "timestamp": timestamp,
+        }
+        for timestamp in timestamps
+    ])
+
+
+def add_session(conn, session_id: str, ended_at: datetime):
+    conn.execute(insert(TelemetrySession), {
+        "module_id": MODULE,
+        "session_id": session_id,
+        "started_at": ended_at,
+        "ended_at": ended_at,
+    })
+    path = get_session_file_path(MODULE, session_id)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(b"frame")
+
+
+def add_compacted_days(*days: str):
+    directory = get_compacted_dir(MODULE)
+    directory.mkdir(parents=True, exist_ok=True)
+    manifest = {"module_id": MODULE, "days": {}}
+    for day in days:
+        (directory / f"{day}.parquet").write_bytes(b"parquet")
+        manifest["days"][day] = {"file": f"{day}.parquet", "complete": True}
+    save_manifest(MODULE, manifest)
+
+
+def constraints(conn, contype: str) -> list[str]:
+    return conn.execute(
+        text(
+            "SELECT pg_get_constraintdef(oid) FROM pg_constraint "
+            "WHERE conrelid = 'behavior_data'::regclass AND contype = :contype"
+        ),
+        {"contype": contype},
+    ).scalars().all()
+
+
+@pytest.fixture
+def pg_engine(monkeypatch):
+    engine = create_engine(TEST_POSTGRES_URL)
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    monkeypatch.setattr(telemetry_partitions, "admin_engine", engine)
+    monkeypatch.setattr(telemetry_partitions, "datetime", frozen_clock(MIGRATED_AT))
+    try:
+        yield engine
+    finally:
+        Base.metadata.drop_all(bind=engine)
+        engine.dispose()
+
+
+@pytest.mark.skipif(not TEST_POSTGRES_URL, reason="TEST_POSTGRES_URL not set")
+def test_migration_keeps_rows_keys_and_indexes(pg_engine):
+    with pg_engine.begin() as conn:
+        conn.execute(insert(User), {"email": "student@example.org", "username": "student"})
+        user_id = conn.execute(text("SELECT id FROM users")).scalar()
+        add_rows(conn, "session-1", *(MIGRATED_AT - timedelta(days=n) for n in range(40)), user_id=user_id)
+        add_rows(conn, "session-2", MIGRATED_AT)
+        before = conn.execute(text("SELECT count(*), max(id) FROM behavior_data")).one()
+
+    with pg_engine.begin() as conn:
+        telemetry_partitions.migrate_to_partitioned(conn)
+        telemetry_partitions.ensure_future_partitions(conn)
+
+    with pg_engine.connect() as conn:
+        assert telemetry_partitions.is_partitioned(conn)
+        assert [name for name, _ in telemetry_partitions.list_partitions(conn)] == [
+            "behavior_data_legacy",
+            "behavior_data_p202606",
+            "behavior_data_p202607",
+            "behavior_data_default",
+        ]
+        assert conn.execute(text("SELECT count(*) FROM behavior_data")).scalar() == before[0]
+        assert constraints(conn, "p") == ['PRIMARY KEY (id, "timestamp")']
+        assert constraints(conn, "f") == ["FOREIGN KEY (user_id) REFERENCES users(id)"]
+        indexes = set(
+            conn.execute(
+                text("SELECT indexname FROM pg_indexes WHERE tablename = 'behavior_data'")
+            ).scalars()
+        )
+        assert {index.name for index in BehaviorData.__table__.indexes} <= indexes
+        assert conn.execute(text("SELECT pg_get_serial_sequence('behavior_data', 'id')")).scalar()
+
+    # New rows keep drawing ids from the old sequence.
+    with Session(pg_engine) as db:
+        row = BehaviorData(module_id=MODULE, session_id="session-3", event_type="click",
+                           timestamp=MIGRATED_AT)
+        db.add(row)
+        db.commit()
+        assert row.id > before[1]
+
+
+@pytest.mark.skipif(not TEST_POSTGRES_URL, reason="TEST_POSTGRES_URL not set")
+def test_retention_drops_only_expired_partition(pg_engine, monkeypatch):
+    june = datetime(2026, 6, 15, tzinfo=timezone.utc)
+    with pg_engine.begin() as conn:
+        add_rows(conn, "old", MIGRATED_AT - timedelta(days=30), MIGRATED_AT - timedelta(days=2))
+        add_rows(conn, "spanning", MIGRATED_AT - timedelta(days=1))
+        add_session(conn, "old", MIGRATED_AT - timedelta(days=2))
+    with pg_engine.begin() as conn:
+        telemetry_partitions.migrate_to_partitioned(conn)
+        telemetry_partitions.ensure_future_partitions(conn)
+        add_rows(conn, "spanning", june)
+        add_rows(conn, "recent", june)
+        add_session(conn, "spanning", june)
+        add_session(conn, "recent", june)
+        conn.execute(insert(Organization), {"name": "School", "data_retention_days": 20})
+    add_compacted_days("2026-05-08", "2026-06-15")
+
+    # Mid-July with 20 days of retention: May (the legacy partition) has
+    # expired, June has not.
+    monkeypatch.setattr(
+        telemetry_partitions, "datetime", frozen_clock(datetime(2026, 7, 10, tzinfo=timezone.utc))
+    )
+    dropped = telemetry_partitions.drop_expired_partitions()
+
+    assert [(item["partition"], item["files_deleted"]) for item in dropped] == [
+        ("behavior_data_legacy", 1)
+    ]
+    with pg_engine.connect() as conn:
+        assert [name for name, _ in telemetry_partitions.list_partitions(conn)] == [
+            "behavior_data_p202606",
+            "behavior_data_p202607",
+            "behavior_data_default",
+        ]
+        assert sorted(
+            conn.execute(text("SELECT DISTINCT session_id FROM behavior_data")).scalars()
+        ) == ["recent", "spanning"]
+        assert sorted(
+            conn.execute(text("SELECT session_id FROM telemetry_sessions")).scalars()
+        ) == ["recent", "spanning"]
+    assert not get_session_file_path(MODULE, "old").exists()
+    assert get_session_file_path(MODULE, "spanning").exists()
+    assert get_session_file_path(MODULE, "recent").exists()
+    assert list(load_manifest(MODULE)["days"]) == ["2026-06-15"]
+    assert not (get_compacted_dir(MODULE) / "2026-05-08.parquet").exists()
@@ -0,0 +1,88 @@
+from datetime import datetime, timedelta, timezone
+
+from models import TelemetrySession, User, UserRole
+
+START = datetime(2026, 3, 1, tzinfo=timezone.utc)
+
+
+def seed_admin(db):
+    admin = User(
+        email="admin@example.org",
+        username="admin",
+        role=UserRole.PLATFORM_ADMIN,
+        is_active=True,
+    )
+    db.add(admin)
+    db.commit()
+    return admin
+
+
+def seed_sessions(db):
+    """Sessions sharing end times across modules, every fourth one still without an end time."""
+    for i in range(23):
+        ended_at = None if i % 4 == 0 else START + timedelta(minutes=i // 3)
+        for module_id in ("module-a", "module-b"):
+            db.add(
+                TelemetrySession(
+                    module_id=module_id,
+                    session_id=f"session-{i:02d}",
+                    started_at=START,
+                    ended_at=ended_at,
+                )
+            )
+    db.commit()
+
+
+def expected_listing(db) -> list[tuple[str, str]]:
+    """Newest end time first, then session and module descending; no end time last."""
+    rows = db.query(TelemetrySession).all()
+    dated = sorted(
+        (row for row in rows if row.ended_at is not None),
+        key=lambda row: (row.ended_at, row.session_id, row.module_id),
+        reverse=True,
+    )
+    undated = sorted(
+        (row for row in rows if row.ended_at is None),
+        key=lambda row: (row.session_id, row.module_id),
+        reverse=True,
+    )
+    return [(row.session_id, row.module_id) for row in dated + undated]
+
+
+def listed(body) -> list[tuple[str, str]]:
+    return [(item["session_id"], item["module_id"]) for item in body["sessions"]]
+
+
+def test_cursor_pages_cover_sessions_without_end_time(db, client_as):
+    client = client_as(seed_admin(db))
+    seed_sessions(db)
+
+    pages = []
+    cursor = None
+    while True:
+        params = {"limit": 5, "count": "none"}
+        if cursor:
+            params["cursor"] = cursor
+        response = client.get("/api/admin/telemetry/sessions", params=params)
+        assert response.status_code == 200, response.text
+        pages.append(listed(response.json()))
+        cursor = response.json()["next_cursor"]
+        if not cursor:
+            break
+
+    assert [row for page in pages for row in page] == expected_listing(db)
+    assert all(len(page) == 5 for page in pages[:-1])
+
+
+def test_offset_pages_match_cursor_order(db, client_as):
+    client = client_as(seed_admin(db))
+    seed_sessions(db)
+    expected = expected_listing(db)
+
+    for offset in (0, 7, 30, 34, 40, 46):
+        response = client.get(
+            "/api/admin/telemetry/sessions",
+            params={"limit": 6, "offset": offset, "count": "none"},
+        )
+        assert response.status_code == 200, response.text
+        assert listed(response.json()) == expected[offset:offset + 6]
@@ -0,0 +1,162 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, make_transient_to_detached
+
+from cache_bus import cache_bus
+from models import User
+
+USER_CACHE_TTL_SECONDS = float(os.getenv("USER_CACHE_TTL_SECONDS", "60"))
+USER_CACHE_MAX_ENTRIES = int(os.getenv("USER_CACHE_MAX_ENTRIES", "10000"))
+
+TOPIC = "users"
+PENDING_KEY = "user_cache_invalidate"
+
+# Never keep password hashes in memory; they load lazily when a handler needs them.
+SNAPSHOT_COLUMNS = tuple(
+    column.key for column in inspect(User).column_attrs if column.key != "hashed_password"
+)
+
+
+class UserCache:
+    """
+    TTL/LRU cache of user rows keyed by token subject (``("id", 42)`` or
+    ``("email", "a@b")``). Entries hold plain column snapshots; ``get``
+    rebuilds a ``User`` attached to the caller's session without a query.
+    """
+
+    def __init__(self, ttl_seconds: float, max_entries: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max(1, max_entries)
+        self._entries: OrderedDict[tuple, tuple[float, dict]] = OrderedDict()
+        self._keys_by_user: dict[int, set[tuple]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        # Bumped on every invalidation so a row read before a concurrent
+        # update cannot be cached after that update's invalidation ran.
+        self.generation = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl_seconds > 0
+
+    def get(self, db: Session, key: tuple) -> User | None:
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    self._drop(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            values = entry[1]
+
+        user = User(**values)
+        make_transient_to_detached(user)
+        return db.merge(user, load=False)
+
+    def put(self, key: tuple, user: User, generation: int) -> None:
+        if not self.enabled:
+            return
+        state = inspect(user)
+        values = {name: state.dict[name] for name in SNAPSHOT_COLUMNS if name in state.dict}
+        if values.get("id") is None:
+            return
+        with self._lock:
+            if generation != self.generation:
+                return
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, values)
+            self._entries.move_to_end(key)
+            self._keys_by_user.setdefault(values["id"], set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+
+    def invalidate(self, user_id) -> None:
+        with self._lock:
+            self.invalidations += 1
+            self.generation += 1
+            for key in self._keys_by_user.pop(user_id, set()):
+                self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+            self._keys_by_user.clear()
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "ttl_seconds": self.ttl_seconds,
+            "max_entries": self.max_entries,
+        }
+
+    def _drop(self, key: tuple) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        keys = self._keys_by_user.get(entry[1]["id"])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                self._keys_by_user.pop(entry[1]["id"], None)
+
+
+user_cache = UserCache(USER_CACHE_TTL_SECONDS, USER_CACHE_MAX_ENTRIES)
+cache_bus.subscribe(TOPIC, user_cache.invalidate, on_reset=user_cache.clear)
+
+
+def invalidate_user(user_id: int) -> None:
+    cache_bus.publish(TOPIC, user_id)
+
+
+def load_user(db: Session, user_id: int | None = None, email: str | None = None) -> User | None:
+    """Resolve a token subject to a ``User``, preferring the id claim."""
+    if user_id:
+        key, criterion = ("id", user_id), User.id == user_id
+    elif email:
+        key, criterion = ("email", email), User.email == email
+    else:
+        return None
+
+    user = user_cache.get(db, key)
+    if user is None:
+        generation = user_cache.generation
+        user = db.query(User).filter(criterion).first()
+        if user is not None:
+            user_cache.put(key, user, generation)
+    return user
+
+
+@event.listens_for(Session, "after_flush")
+def collect_changed_users(session, flush_context):
+    changed = {
+        obj.id
+        for obj in list(session.dirty) + list(session.deleted)
+        if isinstance(obj, User) and obj.id is not None
+    }
+    if changed:
+        session.info.setdefault(PENDING_KEY, set()).update(changed)
+
+
+@event.listens_for(Session, "after_commit")
+def publish_changed_users(session):
+    for user_id in session.info.pop(PENDING_KEY, ()):
+        invalidate_user(user_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def discard_changed_users(session):
+    session.info.pop(PENDING_KEY, None)